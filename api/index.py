@@ -1,3 +1,9 @@
+import os
+
+# A serverless instance may be frozen between invocations, so load the model on the first
+# request instead of in a background startup thread (app.main imports no TensorFlow either way)
+os.environ.setdefault('SKINSCREEN_EAGER_LOAD', '0')
+
 from app.main import app
 
 # This file is the entry point for Vercel Serverless Functions.
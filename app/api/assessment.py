@@ -0,0 +1,172 @@
+"""Questionnaire scoring for /assess, so the image and the answers are scored in one request.
+
+Ports of the frontend's scoring, kept numerically identical:
+
+- calculateCurrentScores (src/pages/AdaptiveQuestionnaire.jsx) -> disease_scores
+- processAdaptiveScores (src/utils/diseaseScoring.js) -> rank_scores
+- getTargetCategory (src/pages/selfAssessmentQuestions.js) -> target_category
+- findConditionDescription / formatDiseaseName (src/utils/predictionProcessing.js) -> condition_info
+
+The tables are exported from the frontend into assessment_data.json by
+``python -m app.tools.export_assessment_data``.
+"""
+import functools
+import json
+import os
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assessment_data.json')
+
+INITIAL_SCORE = 5
+MIN_SCORE = -10
+TOP_K = 4
+METADATA_FIELDS = ('description', 'treatment', 'causes')
+
+
+@functools.lru_cache(maxsize=None)
+def load_data(path=DATA_PATH):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def parse_answers(raw):
+    """``{"<question id>": "<answer>", ...}`` JSON (as sent in the ``answers`` form field) -> {int: str}.
+
+    Keeps the order the answers were supplied in, which is the order they are scored in.
+    """
+    try:
+        answers = json.loads(raw) if raw else {}
+    except ValueError as e:
+        raise ValueError(f"answers is not valid JSON: {e}")
+    if not isinstance(answers, dict):
+        raise ValueError("answers must be a JSON object of question id -> answer")
+    parsed = {}
+    for question_id, answer in answers.items():
+        if not str(question_id).isdigit() or not isinstance(answer, str):
+            raise ValueError(f"Invalid answer {question_id!r}: expected a numeric question id and a string answer")
+        parsed[int(question_id)] = answer
+    return parsed
+
+
+def parse_category(raw):
+    """Validated questionnaire category from the optional ``category`` form field, or None."""
+    if not raw:
+        return None
+    category = raw.strip().upper()
+    if category not in load_data()['questions']:
+        raise ValueError(f"Unknown category {raw!r} (expected one of {', '.join(load_data()['questions'])})")
+    return category
+
+
+def target_category(condition):
+    """Questionnaire category for a predicted condition, DEFAULT when no keyword matches."""
+    if not condition:
+        return 'DEFAULT'
+    condition = condition.lower()
+    for category, keywords in load_data()['category_keywords'].items():
+        if any(keyword in condition for keyword in keywords):
+            return category
+    return 'DEFAULT'
+
+
+def disease_scores(answers, category):
+    """Score each disease of ``category`` against yes/no answers keyed by question id."""
+    data = load_data()
+    diseases = data['diseases'].get(category)
+    if not diseases:
+        return {}
+    question_ids = data['questions'].get(category) or data['questions']['DEFAULT']
+    position = {question_id: i for i, question_id in enumerate(question_ids)}
+
+    scores = {}
+    for disease, entry in diseases.items():
+        weights, attributes = entry['weights'], entry['attributes']
+        average = sum(weights) / len(weights)
+        total = INITIAL_SCORE
+        # In the order the answers were given, as the frontend accumulates them
+        for question_id, answer in answers.items():
+            index = position.get(question_id)
+            if index is None or index >= len(weights):
+                continue
+            value = 1 if 'yes' in answer.lower() else 0
+            expected = attributes[index] if index < len(attributes) else 0
+            if value != expected:
+                total -= average
+            elif value == 0:
+                total += average
+            else:
+                total += weights[index]
+        scores[disease] = max(MIN_SCORE, total)
+    return scores
+
+
+def _round_percent(value):
+    # Number.prototype.toFixed(0): half away from zero on the exact binary value
+    return int(Decimal(value).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def rank_scores(scores):
+    """Top ``TOP_K`` diseases as whole percentages of their combined score, summing to 100.
+
+    Negative scores count as zero; the last entry absorbs the rounding so the
+    percentages add up exactly. Returned highest percentage first.
+    """
+    top = sorted(((disease, max(0, score)) for disease, score in scores.items()),
+                 key=lambda item: -item[1])[:TOP_K]
+    total = sum(score for _, score in top)
+    ranked = [{"disease": disease, "percentage": _round_percent(score / total * 100 if total > 0 else 0),
+               "index": index}
+              for index, (disease, score) in enumerate(top)]
+    if ranked:
+        ranked[-1]["percentage"] = 100 - sum(r["percentage"] for r in ranked[:-1])
+    return sorted(ranked, key=lambda r: -r["percentage"])
+
+
+def _title_words(name):
+    return ' '.join(word[:1].upper() + word[1:].lower() for word in name.split('_'))
+
+
+@functools.lru_cache(maxsize=256)
+def condition_info(disease):
+    """Display name and description fields for a disease or class name (any of its spellings)."""
+    conditions = load_data()['conditions']
+    info = None
+    for key in (disease.replace('_', ' '),
+                re.sub(r'\b\w', lambda m: m.group().upper(), disease.replace('_', '')),
+                _title_words(disease)):
+        if conditions.get(key):
+            info = conditions[key]
+            break
+    if info is None:
+        wanted = disease.lower().replace('_', '')
+        info = next((c for c in conditions.values()
+                     if c.get('name') and re.sub(r'\s+', '', c['name'].lower()) == wanted), {})
+    result = {"name": info.get('name') or _title_words(disease) or disease.replace('_', ' ')}
+    result.update({field: info[field] for field in METADATA_FIELDS if str(info.get(field) or '').strip()})
+    return result
+
+
+def assess(prediction, answers, category=None):
+    """Combine a /predict result with questionnaire answers into the results-page payload.
+
+    ``category`` is the question set the answers belong to; by default the one
+    the top prediction selects, as in the adaptive questionnaire. The display
+    threshold always follows the top prediction's category, like the frontend's
+    processAdaptiveScores.
+    """
+    top = prediction["top_prediction"]
+    predicted_category = target_category(top)
+    category = category or predicted_category
+    thresholds = load_data()['display_thresholds']
+    results = rank_scores(disease_scores(answers, category))
+    for result in results:
+        result["name"] = condition_info(result["disease"])["name"]
+    return {
+        "prediction": prediction,
+        "condition": dict(condition_info(top)),
+        "category": category,
+        "predicted_category": predicted_category,
+        "threshold": thresholds.get(predicted_category, thresholds['DEFAULT']),
+        "results": results,
+    }
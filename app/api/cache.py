@@ -0,0 +1,198 @@
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from app.api.executor import DeadlineExceededError, remaining_time
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(image_data):
+    """Hex digest identifying an upload by its bytes."""
+    return hashlib.blake2b(image_data, digest_size=20).hexdigest()
+
+
+def model_fingerprint(model_path):
+    """Identity of the model files on disk; changes whenever any of them is replaced or rewritten."""
+    digest = hashlib.sha1(os.path.abspath(model_path).encode('utf-8'))
+    for root, dirs, files in os.walk(model_path):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            digest.update(f"{os.path.relpath(path, model_path)}:{st.st_size}:{st.st_mtime_ns}".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def _estimate_size(value):
+    """Rough in-memory size of a result dict (strings, floats and nested containers)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += _estimate_size(k) + _estimate_size(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            size += _estimate_size(v)
+    return size
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'expires')
+
+    def __init__(self, value, size, expires):
+        self.value = value
+        self.size = size
+        self.expires = expires
+
+
+# PREDICTION CACHE - Bounded LRU + TTL with single-flight de-duplication
+
+class PredictionCache:
+    """In-process LRU cache with a TTL, bounded by entry count and estimated bytes.
+
+    Concurrent misses for the same key share a single computation: the first
+    caller computes, the others wait for its result.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, ttl=600.0):
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_bytes))
+        self.ttl = float(ttl)
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+
+    def _evict_locked(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self._evictions += 1
+
+    def _put_locked(self, key, value):
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._entries[key] = _Entry(value, size, time.monotonic() + self.ttl)
+        self._bytes += size
+        self._evict_locked()
+
+    def get_or_compute(self, key, compute, cacheable=None, deadline=None):
+        """Return ``(value, hit)`` for ``key``, running ``compute()`` at most once per concurrent miss.
+
+        Only values for which ``cacheable(value)`` is true are stored, and only
+        those count as a hit for callers that waited on another's computation.
+        ``compute`` runs under the deadline of whichever caller leads it; when
+        that deadline passes, waiters with time left retry instead of failing.
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    if entry.expires > time.monotonic():
+                        self._entries.move_to_end(key)
+                        self._hits += 1
+                        return entry.value, True
+                    del self._entries[key]
+                    self._bytes -= entry.size
+
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._inflight[key] = future
+                    self._misses += 1
+                else:
+                    self._coalesced += 1
+
+            if leader:
+                break
+            try:
+                value = future.result(timeout=remaining_time(deadline))
+            except FutureTimeoutError:
+                raise DeadlineExceededError("Request deadline exceeded waiting for a shared inference")
+            except DeadlineExceededError:
+                # The leader's deadline, not necessarily ours
+                remaining = remaining_time(deadline)
+                if remaining is not None and remaining <= 0:
+                    raise
+                continue
+            # A shared value that was not stored is not a cache hit either
+            return value, cacheable is None or cacheable(value)
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            if cacheable is None or cacheable(value):
+                self._put_locked(key, value)
+        future.set_result(value)
+        return value, False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses + self._coalesced
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "evictions": self._evictions,
+                "hit_rate": ((self._hits + self._coalesced) / lookups) if lookups else 0.0,
+            }
+
+
+class ModelIdentity:
+    """Tracks model_fingerprint(model_path), re-checking the files at most every ``check_interval`` seconds."""
+
+    def __init__(self, model_path, check_interval=30.0, on_change=None):
+        self.model_path = model_path
+        self.check_interval = float(check_interval)
+        self._on_change = on_change
+        self._value = model_fingerprint(model_path)
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def value(self):
+        if time.monotonic() - self._checked >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked >= self.check_interval:
+                    self._checked = time.monotonic()
+                    current = model_fingerprint(self.model_path)
+                    if current != self._value:
+                        logger.info(f"Model files under {self.model_path} changed; invalidating cached predictions")
+                        self._value = current
+                        if self._on_change is not None:
+                            self._on_change()
+        return self._value
@@ -0,0 +1,159 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Every setting can be overridden through an environment variable with this prefix,
+# e.g. SKINSCREEN_BATCH_MAX_SIZE=16.
+ENV_PREFIX = 'SKINSCREEN_'
+
+
+def env_str(name, default):
+    return os.environ.get(ENV_PREFIX + name, default)
+
+
+def env_int(name, default):
+    raw = os.environ.get(ENV_PREFIX + name)
+    if raw is None or raw == '':
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        logger.warning(f"Ignoring non-integer {ENV_PREFIX}{name}={raw!r}, using {default}")
+        return default
+
+
+def env_float(name, default):
+    raw = os.environ.get(ENV_PREFIX + name)
+    if raw is None or raw == '':
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        logger.warning(f"Ignoring non-numeric {ENV_PREFIX}{name}={raw!r}, using {default}")
+        return default
+
+
+def env_bool(name, default):
+    raw = os.environ.get(ENV_PREFIX + name)
+    if raw is None or raw == '':
+        return default
+    return raw.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int_list(name, default):
+    raw = os.environ.get(ENV_PREFIX + name)
+    if raw is None or raw == '':
+        return tuple(default)
+    try:
+        return tuple(int(part) for part in raw.split(',') if part.strip())
+    except ValueError:
+        logger.warning(f"Ignoring malformed {ENV_PREFIX}{name}={raw!r}, using {default}")
+        return tuple(default)
+
+
+def env_str_list(name, default):
+    raw = os.environ.get(ENV_PREFIX + name)
+    if raw is None or raw == '':
+        return tuple(default)
+    return tuple(part.strip() for part in raw.split(',') if part.strip())
+
+
+# Micro-batching: requests arriving within BATCH_WINDOW_MS of the first queued one
+# are scored together, up to BATCH_MAX_SIZE images per forward pass.
+BATCHING_ENABLED = env_bool('BATCHING_ENABLED', True)
+BATCH_MAX_SIZE = env_int('BATCH_MAX_SIZE', 8)
+BATCH_WINDOW_MS = env_float('BATCH_WINDOW_MS', 5.0)
+
+# Inference executor: blocking decode + inference runs in INFERENCE_WORKERS threads;
+# at most INFERENCE_QUEUE_SIZE further requests may wait before new ones get a 503.
+INFERENCE_WORKERS = env_int('INFERENCE_WORKERS', min(4, os.cpu_count() or 1))
+INFERENCE_QUEUE_SIZE = env_int('INFERENCE_QUEUE_SIZE', 32)
+REQUEST_TIMEOUT_S = env_float('REQUEST_TIMEOUT_S', 10.0)
+RETRY_AFTER_S = env_int('RETRY_AFTER_S', 1)
+
+# /predict/batch: maximum number of files accepted in one upload
+BATCH_UPLOAD_MAX_FILES = env_int('BATCH_UPLOAD_MAX_FILES', 16)
+
+# Upload ingestion: bodies are streamed and an image is rejected as soon as it exceeds UPLOAD_MAX_MB,
+# is not one of UPLOAD_FORMATS (by magic bytes) or its header declares more than UPLOAD_MAX_PIXELS.
+# RAW (SKPX header + uint8 RGB pixels) and NPY (uint8 .npy arrays) skip image decoding altogether
+UPLOAD_MAX_MB = env_float('UPLOAD_MAX_MB', 10.0)
+UPLOAD_MAX_PIXELS = env_int('UPLOAD_MAX_PIXELS', 50_000_000)
+UPLOAD_FORMATS = env_str_list('UPLOAD_FORMATS', ('JPEG', 'PNG', 'WEBP', 'GIF', 'BMP', 'RAW', 'NPY'))
+
+# Prediction cache keyed by image bytes + model identity + preprocess mode
+CACHE_ENABLED = env_bool('CACHE_ENABLED', True)
+CACHE_MAX_ENTRIES = env_int('CACHE_MAX_ENTRIES', 1024)
+CACHE_MAX_MB = env_float('CACHE_MAX_MB', 16.0)
+CACHE_TTL_S = env_float('CACHE_TTL_S', 600.0)
+CACHE_MODEL_CHECK_S = env_float('CACHE_MODEL_CHECK_S', 30.0)
+
+# Near-duplicate reuse: an upload whose perceptual hash ("phash" or "dhash", 64 bits) is within
+# NEAR_DUPLICATE_MAX_DISTANCE bits of a recent one gets that image's prediction instead of a forward pass.
+# Privacy: the index is shared by every client of the process, so a similar-looking photo from a different
+# person can be answered with another user's earlier result. Off by default; only enable it where that is
+# acceptable (e.g. single-user or kiosk deployments). Reused results carry "cached": "near_duplicate"
+NEAR_DUPLICATE_ENABLED = env_bool('NEAR_DUPLICATE_ENABLED', False)
+NEAR_DUPLICATE_HASH = env_str('NEAR_DUPLICATE_HASH', 'phash')
+NEAR_DUPLICATE_MAX_DISTANCE = env_int('NEAR_DUPLICATE_MAX_DISTANCE', 8)
+NEAR_DUPLICATE_MAX_ENTRIES = env_int('NEAR_DUPLICATE_MAX_ENTRIES', 4096)
+NEAR_DUPLICATE_TTL_S = env_float('NEAR_DUPLICATE_TTL_S', 120.0)
+
+# Live camera (WebSocket /ws/predict): frames scored per second per connection (older pending frames
+# are dropped), concurrent connections, classes per message and how long a frame may take to score
+LIVE_MAX_FPS = env_float('LIVE_MAX_FPS', 5.0)
+LIVE_MAX_CONNECTIONS = env_int('LIVE_MAX_CONNECTIONS', 32)
+LIVE_TOP_K = env_int('LIVE_TOP_K', 3)
+LIVE_FRAME_TIMEOUT_S = env_float('LIVE_FRAME_TIMEOUT_S', 2.0)
+
+# Startup: load and warm up the model in the background as soon as the server starts.
+# /readyz reports not-ready until warm-up finishes; set READY_WHEN_MOCK to also accept
+# mock mode (no TensorFlow / failed load), e.g. for local frontend development.
+EAGER_LOAD = env_bool('EAGER_LOAD', True)
+READY_WHEN_MOCK = env_bool('READY_WHEN_MOCK', False)
+
+# Model registry: resident model versions are kept under this RAM budget (LRU eviction).
+# Admin endpoints for loading/activating versions are enabled only when ADMIN_TOKEN is set.
+MODEL_MEMORY_BUDGET_MB = env_float('MODEL_MEMORY_BUDGET_MB', 2048.0)
+ADMIN_TOKEN = env_str('ADMIN_TOKEN', '')
+
+# Inference backend: "tf" (Keras/SavedModel) or "tflite" (converted model_<variant>.tflite
+# files written by `python -m app.tools.convert_tflite`). TFLITE_THREADS=0 lets TFLite decide.
+MODEL_BACKEND = env_str('MODEL_BACKEND', 'tf')
+TFLITE_VARIANT = env_str('TFLITE_VARIANT', 'float16')
+TFLITE_THREADS = env_int('TFLITE_THREADS', 0)
+
+# CPU topology: MODEL_REPLICAS forward passes run concurrently, each on the least busy replica.
+# INTRA_OP_THREADS / INTER_OP_THREADS are per replica (TFLite interpreter threads; TensorFlow's
+# process-wide pools are sized replicas x these). 0 keeps the runtime defaults. CPU_AFFINITY
+# pins threads: "auto" splits the allowed CPUs between serve.py workers and then between TFLite
+# replicas, "0-3;4-7" gives each replica an explicit set, empty disables pinning.
+MODEL_REPLICAS = env_int('MODEL_REPLICAS', 1)
+INTRA_OP_THREADS = env_int('INTRA_OP_THREADS', 0)
+INTER_OP_THREADS = env_int('INTER_OP_THREADS', 0)
+CPU_AFFINITY = env_str('CPU_AFFINITY', '')
+# Pixel normalization: "efficientnet" (identity on 0-255), "resnet_v2" ([-1, 1]) or "scale01" ([0, 1])
+PREPROCESS_MODE = env_str('PREPROCESS_MODE', 'efficientnet')
+
+# Compiled inference: fixed-signature tf.function (optionally XLA), batches padded to these sizes
+COMPILED_INFERENCE = env_bool('COMPILED_INFERENCE', True)
+XLA_JIT = env_bool('XLA_JIT', False)
+BATCH_BUCKETS = env_int_list('BATCH_BUCKETS', (1, 2, 4, 8, 16, 32))
+
+# Never load a model; serve uniform mock predictions (load tests of the HTTP layer, frontend work)
+MOCK_MODEL = env_bool('MOCK_MODEL', False)
+
+# Cascade: a cheap first stage (by default the int8 TFLite conversion of the same model) answers
+# when its top-1 probability reaches CASCADE_THRESHOLD; other images go on to the full model.
+# Pick the threshold with python -m app.tools.calibrate_cascade.
+CASCADE_ENABLED = env_bool('CASCADE_ENABLED', False)
+CASCADE_THRESHOLD = env_float('CASCADE_THRESHOLD', 0.9)
+CASCADE_MODEL_PATH = env_str('CASCADE_MODEL_PATH', '')
+CASCADE_BACKEND = env_str('CASCADE_BACKEND', 'tflite')
+CASCADE_TFLITE_VARIANT = env_str('CASCADE_TFLITE_VARIANT', 'int8')
+
+# serve.py: worker processes forked from one preloaded parent, restarted if they die
+WORKER_PROCESSES = env_int('WORKER_PROCESSES', 2)
+WORKER_MAX_RESTARTS = env_int('WORKER_MAX_RESTARTS', 5)
+WORKER_RESTART_WINDOW_S = env_float('WORKER_RESTART_WINDOW_S', 60.0)
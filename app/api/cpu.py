@@ -0,0 +1,107 @@
+"""CPU topology for inference: thread pool sizes, CPU sets per worker or replica, and affinity pinning."""
+import logging
+import os
+import threading
+
+from app.api.lazy_import import tf
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus():
+    """CPUs this process may run on (honours taskset/cpuset restrictions where the OS reports them)."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_list(text):
+    """``'0-3,8,10-11'`` -> ``[0, 1, 2, 3, 8, 10, 11]``."""
+    cpus = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    if not cpus:
+        raise ValueError(f"Empty CPU list: {text!r}")
+    return sorted(cpus)
+
+
+def partition_cpus(cpus, parts):
+    """Split ``cpus`` into ``parts`` contiguous groups of near-equal size.
+
+    With more parts than CPUs, groups wrap around and share CPUs.
+    """
+    cpus = list(cpus)
+    if parts <= len(cpus):
+        base, extra = divmod(len(cpus), parts)
+        groups, start = [], 0
+        for i in range(parts):
+            size = base + (1 if i < extra else 0)
+            groups.append(cpus[start:start + size])
+            start += size
+        return groups
+    return [[cpus[i % len(cpus)]] for i in range(parts)]
+
+
+def cpu_sets(spec, count, cpus=None):
+    """CPU set for each of ``count`` workers or replicas from a SKINSCREEN_CPU_AFFINITY value, or None.
+
+    ``''`` / ``'none'`` disables pinning, ``'auto'`` partitions ``cpus`` (default:
+    the CPUs this process may use) and ``'0-3;4-7'`` lists the sets explicitly,
+    reused round-robin if there are fewer sets than ``count``.
+    """
+    spec = (spec or '').strip().lower()
+    if spec in ('', 'none', 'off'):
+        return None
+    if spec == 'auto':
+        return partition_cpus(cpus if cpus is not None else available_cpus(), count)
+    sets = [parse_cpu_list(part) for part in spec.split(';') if part.strip()]
+    return [sets[i % len(sets)] for i in range(count)]
+
+
+def pin_current_thread(cpus):
+    """Restrict the calling thread, and threads it starts afterwards, to ``cpus``. False if not possible."""
+    if not cpus or not hasattr(os, 'sched_setaffinity'):
+        return False
+    try:
+        # pid 0 is the calling thread on Linux, so this pins this thread rather than the whole process
+        os.sched_setaffinity(0, cpus)
+        return True
+    except OSError as e:
+        logger.warning(f"Could not pin thread to CPUs {cpus}: {e}")
+        return False
+
+
+_tf_threads_lock = threading.Lock()
+_tf_threads = None
+
+
+def configure_tensorflow_threads(intra_op=0, inter_op=0):
+    """Size TensorFlow's process-wide intra-/inter-op pools; 0 keeps TensorFlow's default.
+
+    Only takes effect before TensorFlow runs its first op; later calls log a
+    warning and keep the existing pools.
+    """
+    global _tf_threads
+    if not (intra_op or inter_op):
+        return
+    with _tf_threads_lock:
+        if _tf_threads is not None:
+            if _tf_threads != (intra_op, inter_op):
+                logger.warning(f"TensorFlow threads already set to {_tf_threads}, ignoring {(intra_op, inter_op)}")
+            return
+        try:
+            if intra_op:
+                tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+            if inter_op:
+                tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+            logger.info(f"TensorFlow thread pools: intra-op {intra_op or 'default'}, inter-op {inter_op or 'default'}")
+        except RuntimeError as e:
+            logger.warning(f"TensorFlow is already initialized, keeping its thread pools: {e}")
+        _tf_threads = (intra_op, inter_op)
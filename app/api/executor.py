@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionError(Exception):
+    """Raised when a request is rejected instead of being scored."""
+
+    status_code = 503
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFullError(AdmissionError):
+    """The admission queue is full; the client should retry later."""
+
+
+class DeadlineExceededError(AdmissionError):
+    """The request's deadline passed before a result was produced."""
+
+
+def remaining_time(deadline):
+    """Seconds left until a time.monotonic() deadline (None means no deadline)."""
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check_deadline(deadline, stage='inference'):
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceededError(f"Request deadline exceeded before {stage}")
+
+
+# INFERENCE EXECUTOR - Run blocking work off the event loop with bounded admission
+
+class InferenceExecutor:
+    """Runs blocking prediction work in a dedicated thread pool.
+
+    At most ``max_workers + max_queue`` requests are admitted at once; further
+    requests fail fast with QueueFullError instead of piling up. Every admitted
+    request carries a deadline and is dropped if it expires while queued.
+    """
+
+    def __init__(self, max_workers=4, max_queue=32, timeout=10.0, retry_after=1):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.timeout = float(timeout)
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='inference')
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._rejected = 0
+        self._expired = 0
+
+    @property
+    def capacity(self):
+        return self.max_workers + self.max_queue
+
+    def _admit(self):
+        with self._lock:
+            if self._admitted >= self.capacity:
+                self._rejected += 1
+                return False
+            self._admitted += 1
+            return True
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._admitted -= 1
+
+    def _expire(self):
+        with self._lock:
+            self._expired += 1
+
+    async def run(self, fn, *args, timeout=None, **kwargs):
+        """Run ``fn(*args, deadline=..., **kwargs)`` in the pool and await its result.
+
+        ``timeout`` (seconds) is capped at the executor's configured timeout.
+        """
+        if not self._admit():
+            raise QueueFullError("Inference queue is full", retry_after=self.retry_after)
+
+        timeout = self.timeout if timeout is None else min(float(timeout), self.timeout)
+        deadline = time.monotonic() + timeout
+
+        def task():
+            # Drop requests that went stale while waiting for a worker
+            check_deadline(deadline, stage='dequeue')
+            return fn(*args, deadline=deadline, **kwargs)
+
+        try:
+            future = self._pool.submit(task)
+        except Exception:
+            self._release()
+            raise
+        # Released on completion or cancellation, never by the awaiting coroutine
+        future.add_done_callback(self._release)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=max(0.0, remaining_time(deadline)))
+        except asyncio.TimeoutError:
+            future.cancel()
+            self._expire()
+            raise DeadlineExceededError("Request deadline exceeded", retry_after=self.retry_after)
+        except DeadlineExceededError:
+            self._expire()
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "capacity": self.capacity,
+                "in_flight": self._admitted,
+                "rejected": self._rejected,
+                "expired": self._expired,
+            }
+
+    def shutdown(self, wait=False):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
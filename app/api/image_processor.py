@@ -1,17 +1,106 @@
 import logging
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 import numpy as np
-try:
-    import tensorflow as tf
-    TF_AVAILABLE = True
-except Exception:
-    tf = None
-    TF_AVAILABLE = False
+from numpy.lib import format as npy_format
 
 from PIL import Image, UnidentifiedImageError
 
 logger = logging.getLogger(__name__)
 
+# Formats whose decoder supports reduced-size (draft) decoding
+DRAFT_FORMATS = ('JPEG', 'MPO')
+
+
+# RAW PIXELS - Uncompressed uint8 RGB uploads that skip image decoding
+
+# "SKPX" header: magic, image count, height, width, channels (little-endian), then count*H*W*3 bytes
+RAW_MAGIC = b'SKPX'
+RAW_HEADER = struct.Struct('<4sHHHH')
+NPY_MAGIC = b'\x93NUMPY'
+
+
+def is_raw(data):
+    """True for an SKPX or .npy body (bytes) or an already wrapped pixel array."""
+    if isinstance(data, np.ndarray):
+        return True
+    return data[:4] == RAW_MAGIC or data[:6] == NPY_MAGIC
+
+
+def raw_header(head):
+    """``(count, height, width, offset)`` from the start of an SKPX or .npy body, or None if incomplete.
+
+    ``offset`` is where the pixels start. Raises ValueError for anything other
+    than C-ordered uint8 RGB, i.e. (H, W, 3) or (N, H, W, 3).
+    """
+    if head[:4] == RAW_MAGIC:
+        if len(head) < RAW_HEADER.size:
+            return None
+        _, count, height, width, channels = RAW_HEADER.unpack_from(head)
+        shape, offset = (count, height, width, channels), RAW_HEADER.size
+    elif head[:6] == NPY_MAGIC:
+        if len(head) < 10:
+            return None
+        major = head[6]
+        length_format, start = ('<H', 10) if major == 1 else ('<I', 12)
+        if len(head) < start:
+            return None
+        offset = start + struct.unpack_from(length_format, head, start - struct.calcsize(length_format))[0]
+        if len(head) < offset:
+            return None
+        fp = BytesIO(head[:offset])
+        read_header = npy_format.read_array_header_1_0 if npy_format.read_magic(fp) == (1, 0) \
+            else npy_format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(fp)
+        if dtype != np.uint8 or fortran_order:
+            raise ValueError(f".npy input must be C-ordered uint8, got {dtype}{' (Fortran order)' if fortran_order else ''}")
+        if len(shape) == 3:
+            shape = (1,) + shape
+    else:
+        raise ValueError("Not an SKPX or .npy body")
+    if len(shape) != 4 or shape[3] != 3 or 0 in shape:
+        raise ValueError(f"Raw input must be (H, W, 3) or (N, H, W, 3) RGB pixels, got shape {shape}")
+    count, height, width, _ = shape
+    return count, height, width, offset
+
+
+def raw_pixels(data):
+    """(N, H, W, 3) uint8 view of an SKPX or .npy body; wraps ``data`` without copying it."""
+    if isinstance(data, np.ndarray):
+        return data[np.newaxis] if data.ndim == 3 else data
+    header = raw_header(data)
+    if header is None:
+        raise ValueError("Truncated raw input header")
+    count, height, width, offset = header
+    expected = offset + count * height * width * 3
+    if len(data) != expected:
+        raise ValueError(f"Raw input is {len(data)} bytes; its header declares {expected}")
+    return np.frombuffer(data, dtype=np.uint8, count=count * height * width * 3,
+                         offset=offset).reshape(count, height, width, 3)
+
+
+def encode_raw(pixels):
+    """SKPX body for (H, W, 3) or (N, H, W, 3) uint8 pixels, e.g. for clients and benchmarks."""
+    pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+    if pixels.ndim == 3:
+        pixels = pixels[np.newaxis]
+    count, height, width, channels = pixels.shape
+    return RAW_HEADER.pack(RAW_MAGIC, count, height, width, channels) + pixels.tobytes()
+
+
+def _raw_to_size(data, size):
+    pixels = raw_pixels(data)
+    if len(pixels) != 1:
+        raise ValueError(f"Raw input holds {len(pixels)} images; send several images to /predict/batch")
+    pixels = pixels[0]
+    if (pixels.shape[1], pixels.shape[0]) != size:
+        # Box-reduce by an integer factor first, as JPEG draft decoding does for large photos
+        pixels = np.asarray(Image.fromarray(pixels).resize(size, reducing_gap=2.0), dtype=np.uint8)
+    return pixels
+
 
 def validate_image(image_data) -> bool:
     try:
@@ -23,25 +112,134 @@ def validate_image(image_data) -> bool:
         return False
 
 
-def preprocess_image(image_data, preprocess_mode='efficientnet'):
-    if not validate_image(image_data):
-        raise ValueError('Invalid image data')
-
-    img = Image.open(BytesIO(image_data)).convert('RGB').resize((224, 224))
-
-    if TF_AVAILABLE:
-        img_array = tf.keras.preprocessing.image.img_to_array(img)
-        img_array = tf.expand_dims(img_array, 0)
-        mode = preprocess_mode
-        if mode == 'efficientnet':
-            return tf.keras.applications.efficientnet.preprocess_input(tf.cast(img_array, tf.float32))
-        if mode == 'resnet_v2':
-            return tf.keras.applications.resnet_v2.preprocess_input(tf.cast(img_array, tf.float32))
-        if mode == 'scale01':
-            return tf.cast(img_array, tf.float32) / 255.0
-        return tf.cast(img_array, tf.float32)
-
-    # Fallback: return numpy array scaled to [0,1]
-    arr = np.asarray(img, dtype=np.float32) / 255.0
-    arr = np.expand_dims(arr, 0)
-    return arr
+def decode_image(image_data, size=(224, 224), out=None):
+    """Decode an encoded image once, straight down to ``size``, as (H, W, 3) uint8.
+
+    Raw pixels (SKPX or .npy bodies, or a (H, W, 3) uint8 array) are not
+    decoded; they are only resized when they are not ``size`` already.
+
+    The header is parsed a single time; for JPEGs the decoder is put in draft
+    mode so it emits a DCT-downscaled image (1/2, 1/4 or 1/8 scale) no smaller
+    than ``size`` and a full-resolution phone photo is never materialized.
+    Pixels are written into ``out`` (uint8 or float32) when a preallocated
+    buffer is given.
+    Raises ValueError for anything Pillow cannot decode.
+    """
+    if is_raw(image_data):
+        pixels = _raw_to_size(image_data, size)
+        if out is None:
+            return pixels
+        out[...] = pixels
+        return out
+
+    try:
+        img = Image.open(BytesIO(image_data))
+        if img.format in DRAFT_FORMATS:
+            img.draft('RGB', size)
+        img = img.convert('RGB')
+        if img.size != size:
+            img = img.resize(size)
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        logger.error(f"Invalid image: {e}")
+        raise ValueError(f'Invalid image data: {e}')
+
+    if out is None:
+        return np.asarray(img, dtype=np.uint8)
+    out[...] = np.asarray(img, dtype=np.uint8)
+    return out
+
+
+# NORMALIZATION - Per-family pixel scaling, identical to tf.keras.applications.*.preprocess_input
+
+# mode -> (divisor, offset): x / divisor + offset
+NORMALIZATIONS = {
+    'efficientnet': (1.0, 0.0),  # EfficientNet rescales inside the model
+    'resnet_v2': (127.5, -1.0),
+    'scale01': (255.0, 0.0),
+}
+
+
+def apply_preprocess(img_array, preprocess_mode, out=None):
+    """Normalize a (N, H, W, 3) pixel batch the way the model expects, as float32.
+
+    The pixels are converted into ``out`` (allocated when not given; it may be
+    ``img_array`` itself if that is already float32) and scaled in place, so a
+    batch costs one float32 buffer. Unknown modes return the raw pixel values.
+    """
+    divisor, offset = NORMALIZATIONS.get(preprocess_mode, (1.0, 0.0))
+    if out is None:
+        out = np.empty(np.shape(img_array), dtype=np.float32)
+    if out is not img_array:
+        np.copyto(out, img_array, casting='unsafe')
+    if divisor != 1.0:
+        np.divide(out, np.float32(divisor), out=out)
+    if offset:
+        np.add(out, np.float32(offset), out=out)
+    return out
+
+
+def preprocess_image(image_data, preprocess_mode='efficientnet', size=(224, 224)):
+    if image_data is None or len(image_data) == 0:
+        raise ValueError('Empty image data provided')
+    img_array = decode_image(image_data, size=size)[np.newaxis]
+    return apply_preprocess(img_array, preprocess_mode)
+
+
+_decode_pool = None
+_decode_pool_lock = threading.Lock()
+
+
+def _get_decode_pool():
+    global _decode_pool
+    if _decode_pool is None:
+        with _decode_pool_lock:
+            if _decode_pool is None:
+                # PIL releases the GIL while decoding and resizing, so threads scale here
+                _decode_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1),
+                                                  thread_name_prefix='decode')
+    return _decode_pool
+
+
+def _reset_decode_pool():
+    # Pool threads do not survive fork(); a forked worker starts its own pool on first use
+    global _decode_pool, _decode_pool_lock
+    _decode_pool = None
+    _decode_pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_decode_pool)
+
+
+def preprocess_images(images, preprocess_mode='efficientnet', size=(224, 224)):
+    """Decode and preprocess several images in parallel into one batch.
+
+    Returns ``(batch, indices, errors)``: ``batch`` has one row per image that
+    decoded successfully (None if none did), ``indices`` maps each row back to
+    its position in ``images`` and ``errors`` maps failed positions to a message.
+    Images are resized to ``size`` (width, height).
+
+    Each worker decodes straight into its row of one float32 buffer, which is
+    then normalized in place.
+    """
+    buffer = np.empty((len(images), size[1], size[0], 3), dtype=np.float32)
+
+    def decode(i):
+        if images[i] is None or len(images[i]) == 0:
+            raise ValueError('Empty image data provided')
+        decode_image(images[i], size=size, out=buffer[i])
+
+    futures = [_get_decode_pool().submit(decode, i) for i in range(len(images))]
+
+    indices, errors = [], {}
+    for i, future in enumerate(futures):
+        try:
+            future.result()
+            indices.append(i)
+        except Exception as e:
+            errors[i] = str(e)
+
+    if not indices:
+        return None, indices, errors
+    batch = buffer if not errors else buffer[indices]
+    return apply_preprocess(batch, preprocess_mode, out=batch), indices, errors
@@ -0,0 +1,397 @@
+import hashlib
+import logging
+import warnings
+from io import BytesIO
+
+from PIL import Image
+
+try:
+    import python_multipart.multipart as multipart
+except ImportError:  # python-multipart < 0.0.13
+    import multipart.multipart as multipart
+
+from app.api import config
+from app.api.image_processor import NPY_MAGIC, RAW_MAGIC, raw_header
+
+logger = logging.getLogger(__name__)
+
+# Leading bytes of each accepted container format (WEBP additionally needs "WEBP" at offset 8)
+MAGIC_BYTES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'RIFF', 'WEBP'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP'),
+    # Uncompressed pixels (see image_processor.raw_header)
+    (RAW_MAGIC, 'RAW'),
+    (NPY_MAGIC, 'NPY'),
+)
+RAW_FORMATS = ('RAW', 'NPY')
+# Body types accepted besides image/*; raw pixels and .npy files usually arrive as one of these
+BINARY_CONTENT_TYPES = ('application/octet-stream', 'application/x-npy')
+SNIFF_BYTES = 12
+# Give up on an image whose dimensions are not known after this much data (JPEG EXIF/ICC segments come first)
+HEADER_MAX_BYTES = 512 * 1024
+# Multipart framing allowance on top of the image bytes when checking Content-Length
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+# Largest accepted non-file form field (e.g. questionnaire answers); fits inside the overhead allowance
+FORM_FIELD_MAX_BYTES = 8 * 1024
+
+
+class UploadRejected(Exception):
+    """An upload refused during ingestion; ``status_code`` is the HTTP status to answer with."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_format(head):
+    """Image format named by the magic bytes at the start of ``head``, or None."""
+    for magic, fmt in MAGIC_BYTES:
+        if head.startswith(magic):
+            if fmt == 'WEBP' and head[8:12] != b'WEBP':
+                return None
+            return fmt
+    return None
+
+
+# IMAGE INGEST - Incremental validation of one uploaded image
+
+class ImageIngest:
+    """Accepts one image chunk by chunk and rejects it as early as possible.
+
+    The byte limit is enforced on every chunk, the format is sniffed from the
+    magic bytes of the first ones, and the dimensions are read from the header
+    (without decoding pixels) as soon as it has arrived, so oversized,
+    decompression-bomb and unsupported images fail before the body is buffered.
+    The content hash is updated as the bytes stream in.
+    """
+
+    def __init__(self, filename=None, content_type=None, max_bytes=None, max_pixels=None, formats=None):
+        self.filename = filename
+        self.content_type = content_type
+        self.max_bytes = int(config.UPLOAD_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self.max_pixels = config.UPLOAD_MAX_PIXELS if max_pixels is None else max_pixels
+        self.formats = tuple(f.upper() for f in (config.UPLOAD_FORMATS if formats is None else formats))
+        self.size = 0
+        self.format = None
+        self.dimensions = None
+        self.count = 1
+        self._expected_size = None
+        self._chunks = []
+        self._head = b''
+        self._hasher = hashlib.blake2b(digest_size=20)
+
+    def feed(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadRejected(f"Image exceeds the {self.max_bytes // (1024 * 1024)} MB upload limit", 413)
+        self._hasher.update(data)
+        self._chunks.append(bytes(data))
+        if self.dimensions is None:
+            self._head += data
+            self._inspect()
+
+    def _inspect(self):
+        if self.format is None:
+            if len(self._head) < SNIFF_BYTES:
+                return
+            fmt = sniff_format(self._head)
+            if fmt is None or fmt not in self.formats:
+                raise UploadRejected(f"Unsupported image format (accepted: {', '.join(self.formats)})", 415)
+            self.format = fmt
+
+        if self.format in RAW_FORMATS:
+            self._inspect_raw()
+            return
+        try:
+            # Image.open only parses the header; no pixel memory is allocated here
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+                img = Image.open(BytesIO(self._head), formats=[self.format])
+            size = img.size
+        except Image.DecompressionBombError as e:
+            raise UploadRejected(f"Image dimensions too large: {e}", 413)
+        except Exception:
+            # Header not complete yet
+            if len(self._head) >= HEADER_MAX_BYTES:
+                raise UploadRejected("Could not read the image header", 415)
+            return
+
+        self._accept_dimensions(size)
+
+    def _inspect_raw(self):
+        try:
+            header = raw_header(self._head)
+        except ValueError as e:
+            raise UploadRejected(str(e), 415)
+        if header is None:
+            if len(self._head) >= HEADER_MAX_BYTES:
+                raise UploadRejected("Could not read the raw pixel header", 415)
+            return
+        self.count, height, width, offset = header
+        self._expected_size = offset + self.count * height * width * 3
+        if self._expected_size > self.max_bytes:
+            raise UploadRejected(f"Image exceeds the {self.max_bytes // (1024 * 1024)} MB upload limit", 413)
+        self._accept_dimensions((width, height))
+
+    def _accept_dimensions(self, size):
+        width, height = size
+        if width * height > self.max_pixels:
+            raise UploadRejected(f"Image is {width}x{height}; at most {self.max_pixels} pixels are accepted", 413)
+        self.dimensions = size
+        self._head = b''
+
+    def finish(self):
+        """Check the complete upload; returns an IngestedImage."""
+        if self.size == 0:
+            raise UploadRejected("Empty image data provided", 400)
+        if self.format is None:
+            raise UploadRejected("Unsupported image format", 415)
+        if self.dimensions is None:
+            raise UploadRejected("Could not read the image header", 415)
+        if self._expected_size is not None and self.size != self._expected_size:
+            raise UploadRejected(f"Raw pixel body is {self.size} bytes; its header declares {self._expected_size}", 400)
+        data = self._chunks[0] if len(self._chunks) == 1 else b''.join(self._chunks)
+        self._chunks = []
+        return IngestedImage(data, self._hasher.hexdigest(), self.format, self.dimensions,
+                             self.filename, self.content_type, self.count)
+
+
+class IngestedImage:
+    """An accepted upload. ``count`` > 1 only for raw pixel / .npy bodies holding several images."""
+
+    __slots__ = ('data', 'content_hash', 'format', 'dimensions', 'filename', 'content_type', 'count')
+
+    def __init__(self, data, content_hash, fmt, dimensions, filename=None, content_type=None, count=1):
+        self.data = data
+        self.content_hash = content_hash
+        self.format = fmt
+        self.dimensions = dimensions
+        self.filename = filename
+        self.content_type = content_type
+        self.count = count
+
+
+class UploadItem:
+    """Outcome for one uploaded file: ``image`` when accepted, ``error``/``status_code`` when rejected."""
+
+    __slots__ = ('filename', 'image', 'error', 'status_code')
+
+    def __init__(self, filename=None, image=None, error=None, status_code=None):
+        self.filename = filename
+        self.image = image
+        self.error = error
+        self.status_code = status_code
+
+
+# STREAMING INGESTION - Parse request bodies as they arrive
+
+def _check_content_type(content_type):
+    # Cheap rejection from the part headers alone; binary types are allowed and left to the sniffer
+    if content_type and not (content_type.startswith('image/') or content_type in BINARY_CONTENT_TYPES):
+        raise UploadRejected("File must be an image", 400)
+
+
+class _MultipartIngest:
+    """Drives python-multipart's streaming parser, feeding each matching file part to an ImageIngest.
+
+    With ``fail_fast`` the first rejected file aborts the whole request; otherwise the
+    rest of that part is skipped and its error is reported in its UploadItem.
+    Plain form fields named in ``text_fields`` are collected into ``fields``.
+    """
+
+    def __init__(self, boundary, field, max_files, fail_fast, text_fields=()):
+        self.field = field
+        self.max_files = max_files
+        self.fail_fast = fail_fast
+        self.text_fields = text_fields
+        self.items = []
+        self.fields = {}
+        self._text = None           # (name, bytearray) of the text field being read
+        self._headers = {}
+        self._header_field = b''
+        self._header_value = b''
+        self._current = None        # (UploadItem, ImageIngest) of the part being read, if it is a file
+        self._parser = multipart.MultipartParser(boundary, callbacks={
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+        })
+
+    def write(self, chunk):
+        self._parser.write(chunk)
+
+    def finalize(self):
+        self._parser.finalize()
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._current = None
+        self._text = None
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b''
+        self._header_value = b''
+
+    def _on_headers_finished(self):
+        _, options = multipart.parse_options_header(self._headers.get(b'content-disposition', b''))
+        name = options.get(b'name', b'').decode('latin-1')
+        if b'filename' not in options:
+            if name in self.text_fields:
+                self._text = (name, bytearray())
+            return
+        if name != self.field:
+            return
+        if len(self.items) >= self.max_files:
+            raise UploadRejected(f"At most {self.max_files} files per request", 413)
+        filename = options[b'filename'].decode('utf-8', 'replace')
+        content_type = self._headers.get(b'content-type', b'').decode('latin-1').split(';')[0].strip().lower()
+        item = UploadItem(filename=filename)
+        self.items.append(item)
+        self._current = (item, ImageIngest(filename, content_type))
+        self._reject_on_error(_check_content_type, content_type)
+
+    def _on_part_data(self, data, start, end):
+        if self._current is not None:
+            self._reject_on_error(self._current[1].feed, data[start:end])
+        elif self._text is not None:
+            self._text[1].extend(data[start:end])
+            if len(self._text[1]) > FORM_FIELD_MAX_BYTES:
+                raise UploadRejected(f"Form field '{self._text[0]}' exceeds {FORM_FIELD_MAX_BYTES} bytes", 413)
+
+    def _on_part_end(self):
+        if self._text is not None:
+            name, value = self._text
+            self.fields[name] = value.decode('utf-8', 'replace')
+            self._text = None
+        if self._current is not None:
+            item, ingest = self._current
+            item.image = self._reject_on_error(ingest.finish)
+            self._current = None
+
+    def _reject_on_error(self, fn, *args):
+        try:
+            return fn(*args)
+        except UploadRejected as e:
+            if self.fail_fast:
+                raise
+            item, _ = self._current
+            item.error, item.status_code = str(e), e.status_code
+            # Ignore the rest of this part
+            self._current = None
+
+
+async def ingest_request(request, field='file', max_files=1, fail_fast=True):
+    """Stream an upload out of ``request`` and return one UploadItem per file.
+
+    Accepts ``multipart/form-data`` (files in the ``field`` form field) or a raw
+    ``image/*`` / ``application/octet-stream`` body. Besides encoded images, files
+    may be raw pixels (SKPX) or .npy arrays, which can hold several images;
+    every image counts towards ``max_files``. Oversized requests are refused
+    from Content-Length before any of the body is read; everything else is
+    checked chunk by chunk as it arrives. With ``fail_fast`` (single-image
+    endpoints) the first rejected file raises UploadRejected; otherwise each
+    file's rejection is reported in its UploadItem.
+    """
+    items, _ = await _ingest(request, field, max_files, fail_fast)
+    return items
+
+
+async def ingest_form(request, field='file', text_fields=()):
+    """Single image plus the plain form fields named in ``text_fields``: ``(IngestedImage, {name: value})``.
+
+    Fields that were not sent are missing from the dict; a raw image body has none.
+    """
+    items, fields = await _ingest(request, field, 1, True, text_fields)
+    return items[0].image, fields
+
+
+async def _ingest(request, field, max_files, fail_fast, text_fields=()):
+    max_bytes = int(config.UPLOAD_MAX_MB * 1024 * 1024)
+    body_limit = max_files * max_bytes + MULTIPART_OVERHEAD_BYTES
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > body_limit:
+        raise UploadRejected(f"Request body exceeds the {body_limit // (1024 * 1024)} MB upload limit", 413)
+
+    media_type, options = multipart.parse_options_header(request.headers.get('content-type', ''))
+    media_type = media_type.decode('latin-1').lower()
+
+    if media_type == 'multipart/form-data':
+        boundary = options.get(b'boundary')
+        if not boundary:
+            raise UploadRejected("Missing multipart boundary", 400)
+        parser = _MultipartIngest(boundary, field, max_files, fail_fast, text_fields)
+        received = 0
+        try:
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > body_limit:
+                    raise UploadRejected(f"Request body exceeds the {body_limit // (1024 * 1024)} MB upload limit",
+                                         413)
+                parser.write(chunk)
+            parser.finalize()
+        except multipart.MultipartParseError as e:
+            raise UploadRejected(f"Malformed multipart body: {e}", 400)
+        if not parser.items:
+            raise UploadRejected(f"No file uploaded in form field '{field}'", 422)
+        _check_image_count(parser.items, max_files)
+        return parser.items, parser.fields
+
+    if not (media_type.startswith('image/') or media_type in BINARY_CONTENT_TYPES):
+        raise UploadRejected("Expected multipart/form-data or an image request body", 415)
+    ingest = ImageIngest(content_type=media_type)
+    async for chunk in request.stream():
+        ingest.feed(chunk)
+    items = [UploadItem(image=ingest.finish())]
+    _check_image_count(items, max_files)
+    return items, {}
+
+
+def _check_image_count(items, max_files):
+    count = sum(item.image.count for item in items if item.image is not None)
+    if count > max_files:
+        noun = "image" if max_files == 1 else "images"
+        raise UploadRejected(f"At most {max_files} {noun} per request, got {count}", 413)
+
+
+async def ingest_image(request, field='file'):
+    """Single-image variant of ingest_request; returns the IngestedImage or raises UploadRejected."""
+    return (await ingest_request(request, field=field, max_files=1, fail_fast=True))[0].image
+
+
+# OpenAPI description of the upload body, since the handlers read the stream themselves
+def upload_openapi(field='file', many=False, text_fields=None):
+    """``text_fields`` maps extra form field names to their descriptions."""
+    schema = {"type": "string", "format": "binary"}
+    if many:
+        schema = {"type": "array", "items": schema}
+    properties = {field: schema}
+    properties.update({name: {"type": "string", "description": description}
+                       for name, description in (text_fields or {}).items()})
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {"type": "object", "properties": properties, "required": [field]},
+                },
+                **({} if many else {"image/*": {"schema": {"type": "string", "format": "binary"}}}),
+                # Raw pixels (SKPX) or a .npy array; for batches it may stack several images
+                "application/octet-stream": {"schema": {"type": "string", "format": "binary"}},
+            },
+        }
+    }
@@ -0,0 +1,63 @@
+"""Heavy optional dependencies, imported on first use instead of when the API is imported.
+
+Importing ``app.main`` then costs only FastAPI, NumPy and Pillow, which keeps
+serverless cold starts short; TensorFlow is imported the first time a model or
+TF op actually needs it.
+"""
+import importlib
+import importlib.util
+import logging
+import sys
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    ``available`` tells whether the module is installed without importing it, and
+    ``loaded`` whether it has been imported yet (by anyone), so code can skip
+    checks such as ``tf.is_tensor`` that could only be true once it has.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._available = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        if self._available is None:
+            try:
+                self._available = importlib.util.find_spec(self._name) is not None
+            except (ImportError, ValueError):
+                self._available = False
+        return self._available
+
+    @property
+    def loaded(self):
+        return self._module is not None or self._name in sys.modules
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    logger.info(f"Importing {self._name}")
+                    try:
+                        self._module = importlib.import_module(self._name)
+                    except Exception:
+                        self._available = False
+                        raise
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}' ({'loaded' if self.loaded else 'not loaded'})>"
+
+
+tf = LazyModule('tensorflow')
+TF_AVAILABLE = tf.available
@@ -0,0 +1,177 @@
+"""Live-camera scoring over a WebSocket: latest frame wins, per-connection rate limit and buffers.
+
+The client sends encoded frames (e.g. JPEG blobs from a canvas) as binary
+messages. A frame that arrives while the previous one is still being scored
+replaces whatever frame was waiting, so a slow model skips frames instead of
+falling behind. At most ``max_fps`` frames per second are scored per
+connection. Each connection decodes into its own preallocated input buffer.
+Results go back as small JSON text messages:
+
+    {"type": "ready", "max_fps": 5.0, "max_frame_bytes": 2097152, "top_k": 3}
+    {"type": "score", "frame": 12, "top": "Acne", "confidence": 0.8731,
+     "top_k": [["Acne", 0.8731], ["Warts", 0.0512], ["Ringworm", 0.0311]], "dropped": 4, "ms": 38.2}
+    {"type": "error", "frame": 13, "error": "Invalid image data: ..."}
+
+``frame`` numbers every received binary message from 1. ``dropped`` counts
+frames replaced before they were scored, since the connection opened.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+import numpy as np
+
+from app.api import config
+from app.api.executor import AdmissionError
+
+logger = logging.getLogger(__name__)
+
+# Close codes (RFC 6455 section 7.4.1)
+CLOSE_UNSUPPORTED_DATA = 1003
+CLOSE_MESSAGE_TOO_BIG = 1009
+CLOSE_TRY_AGAIN_LATER = 1013
+
+_connections_lock = threading.Lock()
+_connections = 0
+_frame_counts = {"scored": 0, "dropped": 0, "error": 0}
+
+
+def live_stats():
+    """Open connections and frame outcomes since startup."""
+    with _connections_lock:
+        return {"connections": _connections, "max_connections": config.LIVE_MAX_CONNECTIONS,
+                "frames": dict(_frame_counts)}
+
+
+def _count(outcome, n=1):
+    with _connections_lock:
+        _frame_counts[outcome] += n
+
+
+def _open_connection():
+    global _connections
+    with _connections_lock:
+        if _connections >= config.LIVE_MAX_CONNECTIONS:
+            return False
+        _connections += 1
+        return True
+
+
+def _close_connection():
+    global _connections
+    with _connections_lock:
+        _connections -= 1
+
+
+def score_message(frame, result, top_k, dropped, seconds):
+    """Compact message for a /predict-style result."""
+    ranked = sorted(result["predictions"].items(), key=lambda item: -item[1])[:top_k]
+    message = {"type": "score", "frame": frame, "top": result["top_prediction"],
+               "confidence": round(float(result["confidence"]), 4),
+               "top_k": [[name, round(float(p), 4)] for name, p in ranked],
+               "dropped": dropped, "ms": round(seconds * 1000.0, 1)}
+    if result.get("cached"):
+        message["cached"] = result["cached"]
+    return message
+
+
+# LIVE SESSION - One WebSocket connection
+
+class LiveSession:
+    """Receives frames into a single pending slot and scores the newest one at most ``max_fps`` times a second."""
+
+    def __init__(self, websocket, service, executor, max_fps=None, max_frame_bytes=None, top_k=None,
+                 frame_timeout=None):
+        self.websocket = websocket
+        self.service = service
+        self.executor = executor
+        self.max_fps = config.LIVE_MAX_FPS if max_fps is None else max_fps
+        self.max_frame_bytes = int(config.UPLOAD_MAX_MB * 1024 * 1024) if max_frame_bytes is None \
+            else max_frame_bytes
+        self.top_k = config.LIVE_TOP_K if top_k is None else top_k
+        self.frame_timeout = config.LIVE_FRAME_TIMEOUT_S if frame_timeout is None else frame_timeout
+        self.received = 0
+        self.dropped = 0
+        self._pending = None
+        self._frame_ready = asyncio.Event()
+        self._buffer = None
+
+    def _input_buffer(self):
+        if self._buffer is None:
+            width, height = self.service.input_size
+            self._buffer = np.empty((1, height, width, 3), dtype=np.float32)
+        return self._buffer
+
+    async def run(self):
+        """Serve the connection until the client disconnects or breaks the protocol."""
+        if not _open_connection():
+            await self.websocket.close(code=CLOSE_TRY_AGAIN_LATER, reason="Too many live connections")
+            return
+        try:
+            await self.websocket.accept()
+            await self.websocket.send_json({"type": "ready", "max_fps": self.max_fps,
+                                            "max_frame_bytes": self.max_frame_bytes, "top_k": self.top_k})
+            scorer = asyncio.create_task(self._score_frames())
+            try:
+                await self._receive_frames()
+            finally:
+                scorer.cancel()
+                try:
+                    await scorer
+                except asyncio.CancelledError:
+                    pass
+        finally:
+            _close_connection()
+
+    async def _receive_frames(self):
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            data = message.get("bytes")
+            if data is None:
+                await self.websocket.close(code=CLOSE_UNSUPPORTED_DATA, reason="Send frames as binary messages")
+                return
+            if len(data) > self.max_frame_bytes:
+                await self.websocket.close(code=CLOSE_MESSAGE_TOO_BIG,
+                                           reason=f"Frame exceeds {self.max_frame_bytes} bytes")
+                return
+            self.received += 1
+            if self._pending is not None:
+                # Latest frame wins: the one still waiting is never scored
+                self.dropped += 1
+                _count("dropped")
+            self._pending = (self.received, data)
+            self._frame_ready.set()
+
+    async def _score_frames(self):
+        loop = asyncio.get_running_loop()
+        next_start = 0.0
+        while True:
+            await self._frame_ready.wait()
+            # Rate limit: frames arriving during the pause replace the pending one
+            pause = next_start - loop.time()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            self._frame_ready.clear()
+            frame, data = self._pending
+            self._pending = None
+            next_start = loop.time() + (1.0 / self.max_fps if self.max_fps > 0 else 0.0)
+            await self.websocket.send_json(await self._score(frame, data))
+
+    async def _score(self, frame, data):
+        start = time.perf_counter()
+        try:
+            result = await self.executor.run(self.service.predict_frame, data, self._input_buffer(),
+                                             timeout=self.frame_timeout)
+        except AdmissionError as e:
+            # A late forward pass may still be writing into the buffer: give the next frame a fresh one
+            self._buffer = None
+            _count("error")
+            return {"type": "error", "frame": frame, "error": str(e), "retry_after": e.retry_after}
+        if not result.get("success", True):
+            _count("error")
+            return {"type": "error", "frame": frame, "error": result.get("error")}
+        _count("scored")
+        return score_message(frame, result, self.top_k, self.dropped, time.perf_counter() - start)
@@ -0,0 +1,203 @@
+import bisect
+import threading
+import time
+
+# Latency buckets in seconds, from sub-millisecond decode steps to multi-second cold inferences
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labelvalues, value in sorted(values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # labelvalues -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def collect(self):
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labelvalues, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, ('le', _format_value(float(bound))))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f'{self.name}_sum{labels} {_format_value(float(series[-1]))}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class CallbackMetric:
+    """A gauge or counter whose value is read from ``fn()`` at scrape time (a number, or {labelvalue: number})."""
+
+    def __init__(self, name, documentation, fn, metric_type='gauge', labelname=None):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.metric_type = metric_type
+        self.labelname = labelname
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        try:
+            value = self.fn()
+        except Exception:
+            return lines
+        if value is None:
+            return lines
+        if isinstance(value, dict):
+            for labelvalue, v in sorted(value.items()):
+                lines.append(f'{self.name}{_format_labels((self.labelname,), (labelvalue,))} {_format_value(v)}')
+        else:
+            lines.append(f'{self.name} {_format_value(value)}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, fn, metric_type='gauge', labelname=None):
+        return self.register(CallbackMetric(name, documentation, fn, metric_type, labelname))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'skinscreen_stage_seconds', 'Time spent in each prediction pipeline stage', ('stage',))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'skinscreen_request_seconds', 'End-to-end HTTP request latency', ('route', 'method'))
+REQUESTS_TOTAL = REGISTRY.counter(
+    'skinscreen_requests_total', 'HTTP requests by route and status code', ('route', 'method', 'status'))
+ERRORS_TOTAL = REGISTRY.counter(
+    'skinscreen_prediction_errors_total', 'Failed predictions by error type', ('type',))
+MOCK_PREDICTIONS_TOTAL = REGISTRY.counter(
+    'skinscreen_mock_predictions_total', 'Images answered with mock (uniform) predictions because no model was available')
+CASCADE_DECISIONS_TOTAL = REGISTRY.counter(
+    'skinscreen_cascade_decisions_total', 'Images answered by the cheap cascade stage (fast) or escalated (full)',
+    ('stage',))
+BATCH_SIZE = REGISTRY.histogram(
+    'skinscreen_batch_size', 'Images per forward pass', buckets=(1, 2, 4, 8, 16, 32, 64))
+
+
+class StageTimer:
+    """Accumulates per-stage durations for one request; mark(stage) closes the stage that just ended."""
+
+    __slots__ = ('stages', '_last')
+
+    def __init__(self):
+        self.stages = {}
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._last)
+        self._last = now
+
+    def observe(self):
+        """Record every stage in the skinscreen_stage_seconds histogram."""
+        for stage, seconds in self.stages.items():
+            STAGE_SECONDS.observe(seconds, stage)
+
+
+def server_timing(stages):
+    """Server-Timing header value for {stage: seconds}."""
+    return ', '.join(f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in stages.items())
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware counting requests and their latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get('route'), 'path', None) or 'unmatched'
+            method = scope.get('method', '')
+            REQUEST_SECONDS.observe(time.perf_counter() - start, route, method)
+            REQUESTS_TOTAL.inc(1, route, method, str(status[0]))
@@ -1,26 +1,124 @@
 import json
 import os
 import logging
+import threading
 import numpy as np
-try:
-    import tensorflow as tf
-    TF_AVAILABLE = True
-except Exception:
-    tf = None
-    TF_AVAILABLE = False
+from app.api.lazy_import import TF_AVAILABLE, tf
 
 logger = logging.getLogger(__name__)
 
+# File names written by app.tools.convert_tflite inside each model directory
+TFLITE_VARIANTS = ('float16', 'dynamic', 'int8')
 
-def _load_custom_model(arch_path, weights_path):
-    from tensorflow.keras.applications import EfficientNetB0
-    from tensorflow.keras import layers, models
 
-    with open(arch_path, 'r') as f:
-        arch_info = json.load(f)
+def tflite_model_path(model_path, variant):
+    """Path of a converted TFLite variant; ``model_path`` may already point at a .tflite file."""
+    if model_path.endswith('.tflite'):
+        return model_path
+    return os.path.join(model_path, f'model_{variant}.tflite')
+
+
+def _tflite_interpreter_class():
+    # The standalone runtimes (LiteRT, or the older tflite_runtime) are much lighter than full TensorFlow
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    if TF_AVAILABLE:
+        return tf.lite.Interpreter
+    raise RuntimeError("No TFLite runtime available: install ai-edge-litert, tflite-runtime or TensorFlow")
+
+
+class TFLiteModel:
+    """Callable TFLite interpreter taking a float32 (N, H, W, C) batch and returning (N, num_classes).
+
+    The interpreter is not thread-safe, so calls are serialized; the input tensor
+    is resized whenever the batch shape changes (batch size, or resolution where
+    the graph allows it).
+    """
+
+    def __init__(self, model_file, num_threads=None):
+        self.model_file = model_file
+        self.num_threads = num_threads
+        self._interpreter = _tflite_interpreter_class()(model_path=model_file, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._shape = tuple(int(d) for d in self._input['shape'])
+        self._lock = threading.Lock()
+
+    @property
+    def input_shape(self):
+        return tuple(int(d) for d in self._input['shape'][1:])
+
+    def _quantize(self, batch):
+        scale, zero_point = self._input.get('quantization', (0.0, 0))
+        dtype = self._input['dtype']
+        if dtype == np.float32 or not scale:
+            return batch.astype(dtype, copy=False)
+        return np.clip(np.round(batch / scale + zero_point), np.iinfo(dtype).min, np.iinfo(dtype).max).astype(dtype)
+
+    def _dequantize(self, output):
+        scale, zero_point = self._output.get('quantization', (0.0, 0))
+        if output.dtype == np.float32 or not scale:
+            return output.astype(np.float32, copy=False)
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def __call__(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        with self._lock:
+            if batch.shape != self._shape:
+                self._interpreter.resize_tensor_input(self._input['index'], list(batch.shape))
+                self._interpreter.allocate_tensors()
+                self._input = self._interpreter.get_input_details()[0]
+                self._output = self._interpreter.get_output_details()[0]
+                self._shape = batch.shape
+            self._interpreter.set_tensor(self._input['index'], self._quantize(batch))
+            self._interpreter.invoke()
+            return self._dequantize(self._interpreter.get_tensor(self._output['index']).copy())
+
+
+def load_tflite_model(model_path, variant='float16', num_threads=None):
+    model_file = tflite_model_path(model_path, variant)
+    if not os.path.exists(model_file):
+        raise FileNotFoundError(f"TFLite model not found: {model_file} (run python -m app.tools.convert_tflite)")
+    return TFLiteModel(model_file, num_threads=num_threads)
+
+
+def read_architecture(model_path):
+    """Return the parsed model_architecture.json of a model directory, or {} if absent."""
+    arch_path = os.path.join(model_path, 'model_architecture.json')
+    try:
+        with open(arch_path, 'r') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Could not read {arch_path}: {e}")
+        return {}
+
+
+def architecture_input_shape(model_path, default=(224, 224, 3)):
+    """(H, W, C) declared by a model directory's model_architecture.json, or ``default`` without one."""
+    if not os.path.exists(os.path.join(model_path, 'model_architecture.json')):
+        return tuple(default)
+    shape = read_architecture(model_path).get('input_shape')
+    if not shape or len(shape) != 3:
+        return tuple(default)
+    return tuple(int(d) for d in shape)
+
+
+def build_model(arch_info, weights='imagenet'):
+    """Build the ``model_type`` backbone (EfficientNetB0 by default) + Dense head of a model_architecture.json."""
+    from tensorflow.keras import applications, layers, models
 
-    base_model = EfficientNetB0(
-        weights='imagenet',
+    backbone = getattr(applications, arch_info.get('model_type', 'EfficientNetB0'))
+    base_model = backbone(
+        weights=weights,
         include_top=False,
         input_shape=tuple(arch_info['input_shape'])
     )
@@ -34,7 +132,15 @@ def _load_custom_model(arch_path, weights_path):
         layers.Dropout(arch_info.get('dropout_rate', 0.2)),
         layers.Dense(arch_info.get('num_classes', 2), activation='softmax')
     ])
+    return model
+
+
+def _load_custom_model(arch_path, weights_path):
+    with open(arch_path, 'r') as f:
+        arch_info = json.load(f)
 
+    # Every weight comes from weights_path; weights=None avoids downloading ImageNet weights at load time
+    model = build_model(arch_info, weights=None)
     model.load_weights(weights_path)
 
     model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
@@ -43,7 +149,7 @@ def _load_custom_model(arch_path, weights_path):
 
 
 def resolve_signature_input_key(model_obj):
-    if not TF_AVAILABLE or model_obj is None:
+    if not TF_AVAILABLE or model_obj is None or isinstance(model_obj, TFLiteModel):
         return 'inputs'
     try:
         if isinstance(model_obj, tf.keras.Model):
@@ -61,6 +167,39 @@ def resolve_signature_input_key(model_obj):
     return 'inputs'
 
 
+def model_input_shape(model_obj, input_key=None, default=(224, 224, 3)):
+    """(H, W, C) expected by a Keras model or serving signature."""
+    try:
+        if isinstance(model_obj, tf.keras.Model):
+            shape = tuple(model_obj.input_shape[1:])
+        else:
+            shape = tuple(model_obj.structured_input_signature[1][input_key].shape[1:])
+        if len(shape) == 3 and all(d is not None for d in shape):
+            return tuple(int(d) for d in shape)
+    except Exception:
+        pass
+    return tuple(default)
+
+
+def compile_inference_fn(model_obj, input_key=None, jit_compile=False):
+    """Wrap a Keras model or serving signature in a tf.function with a fixed float32 (None, H, W, C) signature.
+
+    The input key is bound here, once, instead of being probed per call; with
+    ``jit_compile`` the graph is compiled with XLA.
+    """
+    spec = tf.TensorSpec((None,) + model_input_shape(model_obj, input_key), tf.float32, name='images')
+    if isinstance(model_obj, tf.keras.Model):
+        def infer(images):
+            return model_obj(images, training=False)
+    elif input_key:
+        def infer(images):
+            return model_obj(**{input_key: images})
+    else:
+        def infer(images):
+            return model_obj(images)
+    return tf.function(infer, input_signature=[spec], jit_compile=jit_compile)
+
+
 def load_model(model_path):
     """Attempt multiple strategies to load a model. Returns a TF Keras model, a signature function, or raises."""
     if not TF_AVAILABLE:
@@ -97,7 +236,10 @@ def load_model(model_path):
     try:
         loaded = tf.saved_model.load(model_path)
         if hasattr(loaded, 'signatures') and 'serving_default' in loaded.signatures:
-            return loaded.signatures['serving_default']
+            signature = loaded.signatures['serving_default']
+            # The signature only weakly references the variables; keep the loaded object alive with it
+            signature._loaded_root = loaded
+            return signature
         raise ValueError('No serving signature found')
     except Exception as e:
         logger.error(f"All load attempts failed: {e}")
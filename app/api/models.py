@@ -1,7 +1,62 @@
 from pydantic import BaseModel
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 class PredictionResponse(BaseModel):
     predictions: Dict[str, float]
     top_prediction: str
-    confidence: float 
\ No newline at end of file
+    confidence: float
+    model_version: Optional[str] = None
+    # "fast" when the cheap cascade stage answered, "full" when escalated; None without a cascade
+    cascade_stage: Optional[str] = None
+    # "exact" when served from the cache of identical uploads, "near_duplicate" when reused from a
+    # recent visually near-identical photo; None when the model scored this image
+    cached: Optional[str] = None
+    # True when the model is not loaded and the scores are a uniform placeholder, not a prediction
+    mocked: bool = False
+
+
+class BatchPredictionItem(BaseModel):
+    index: int
+    filename: Optional[str] = None
+    prediction: Optional[PredictionResponse] = None
+    error: Optional[str] = None
+
+
+class BatchPredictionResponse(BaseModel):
+    results: List[BatchPredictionItem]
+
+
+class CombinedPredictionResponse(BaseModel):
+    disease: PredictionResponse
+    attributes: Dict[str, PredictionResponse]
+
+
+class ModelLoadRequest(BaseModel):
+    path: str
+    version: Optional[str] = None
+    activate: bool = True
+
+
+class ConditionInfo(BaseModel):
+    name: str
+    description: Optional[str] = None
+    treatment: Optional[str] = None
+    causes: Optional[str] = None
+
+
+class AssessmentResultItem(BaseModel):
+    disease: str
+    name: str
+    percentage: int
+    # Rank by questionnaire score before sorting by percentage, as in the frontend
+    index: int
+
+
+class AssessmentResponse(BaseModel):
+    prediction: PredictionResponse
+    condition: ConditionInfo
+    # Question set the answers were scored against, and the one the top prediction selects
+    category: str
+    predicted_category: str
+    threshold: int
+    results: List[AssessmentResultItem]
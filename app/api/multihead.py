@@ -0,0 +1,192 @@
+import hashlib
+import logging
+import os
+import threading
+import numpy as np
+from app.api.lazy_import import TF_AVAILABLE, tf
+from app.api.model_loader import architecture_input_shape, load_model, read_architecture
+from app.api.class_loader import load_class_names
+from app.api.executor import check_deadline
+from app.api.image_processor import preprocess_image
+from app.api.registry import ModelRegistry
+from app.api.services import OutputProcessor, format_prediction, model_wrapper_factory
+
+logger = logging.getLogger(__name__)
+
+# Disease model plus the lesion attribute models, all EfficientNetB0 + Dense heads
+DEFAULT_HEADS = {
+    'disease': 'saved_model/third',
+    'lesion_form': 'saved_model/m1_lesion_form',
+    'surface': 'saved_model/m2_surface',
+    'color': 'saved_model/m4_color',
+}
+
+
+def backbone_key(arch):
+    """Key under which heads may share one backbone pass, or None if the model needs its own.
+
+    Only frozen backbones (``base_trainable: false``) are identical across models;
+    a fine-tuned backbone belongs to its own model.
+    """
+    if not arch or arch.get('base_trainable', True):
+        return None
+    return (arch.get('model_type'), tuple(arch.get('input_shape', ())))
+
+
+def split_backbone(model):
+    """Split Sequential([backbone, GlobalAveragePooling2D, ...head]) into (features, head) models.
+
+    The returned models reuse the original layers, so no weights are copied.
+    Returns None for models of any other shape.
+    """
+    if not TF_AVAILABLE or not isinstance(model, tf.keras.Sequential):
+        return None
+    layers = model.layers
+    if len(layers) < 3:
+        return None
+    base, pool = layers[0], layers[1]
+    if not isinstance(base, tf.keras.Model) or not isinstance(pool, tf.keras.layers.GlobalAveragePooling2D):
+        return None
+    return tf.keras.Sequential([base, pool]), tf.keras.Sequential(layers[2:])
+
+
+def weights_fingerprint(model):
+    """Hash of a model's weights, used to confirm two backbones really are the same."""
+    digest = hashlib.sha1()
+    for weight in model.get_weights():
+        digest.update(np.ascontiguousarray(weight).tobytes())
+    return digest.hexdigest()
+
+
+class _Head:
+    def __init__(self, name, model_path, class_names, arch):
+        self.name = name
+        self.model_path = model_path
+        self.class_names = class_names
+        self.arch = arch
+        height, width, _ = architecture_input_shape(model_path)
+        self.size = (width, height)   # preprocess_image size, (W, H)
+        self.head_model = None      # Dense head on pooled features (shared-backbone path)
+        self.separate = False       # Full model served from the registry (separate-pass path)
+
+
+# MULTI-HEAD ENGINE - One backbone pass, every registered head
+
+class MultiHeadEngine:
+    """Scores an image with the disease model and every lesion attribute model at once.
+
+    Heads whose backbone is frozen and identical share one backbone forward pass
+    and run only their Dense layers on the pooled features; heads with a
+    fine-tuned backbone fall back to a separate full pass, served from the
+    model registry (shared with PredictionService, so the disease model is
+    not loaded twice).
+    """
+
+    def __init__(self, heads=None, preprocess_mode='efficientnet', registry=None):
+        self.preprocess_mode = preprocess_mode
+        self._registry = registry if registry is not None else ModelRegistry(model_wrapper_factory())
+        self._heads = {}
+        for name, model_path in (heads or DEFAULT_HEADS).items():
+            class_names = load_class_names(os.path.join(model_path, 'class_indices.json'),
+                                           os.path.join(model_path, 'labels.txt'))
+            self._heads[name] = _Head(name, model_path, class_names, read_architecture(model_path))
+        self._groups = []           # [(feature_model, [head, ...]), ...]
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def head_names(self):
+        return list(self._heads)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            groups = {}
+            for head in self._heads.values():
+                key = backbone_key(head.arch)
+                if TF_AVAILABLE and key is not None and self._attach_shared(head, key, groups):
+                    continue
+                self._registry.ensure_registered(head.name, head.model_path)
+                head.separate = True
+            self._groups = [(features, heads) for features, _, heads in groups.values()]
+            shared = sum(len(heads) for _, heads in self._groups)
+            logger.info(f"Multi-head engine: {shared} heads on {len(self._groups)} shared backbone(s), "
+                        f"{len(self._heads) - shared} separate pass(es)")
+            self._loaded = True
+
+    def _attach_shared(self, head, key, groups):
+        """Load a frozen-backbone model and attach its head to a shared backbone group."""
+        try:
+            split = split_backbone(load_model(head.model_path))
+        except Exception as e:
+            logger.error(f"Model load failed for head '{head.name}': {e}", exc_info=True)
+            return False
+        if split is None:
+            logger.warning(f"Head '{head.name}' is not backbone + Dense head; using a separate pass")
+            return False
+
+        features, head_model = split
+        fingerprint = weights_fingerprint(features)
+        group = groups.get((key, fingerprint))
+        if group is None:
+            groups[(key, fingerprint)] = (features, fingerprint, [head])
+        else:
+            # Keep the first model's backbone; this model's copy is released with `features`
+            group[2].append(head)
+        head.head_model = head_model
+        return True
+
+    def _mock(self, head, rows):
+        size = len(head.class_names) if head.class_names else 2
+        return np.ones((rows, size), dtype=float) / float(size)
+
+    @property
+    def input_sizes(self):
+        """Distinct (W, H) inputs the heads expect; each needs its own preprocessed batch."""
+        return sorted({head.size for head in self._heads.values()})
+
+    def infer(self, batch, size=None):
+        """Return {head name: (probabilities of shape (N, num_classes), model version, mocked)} for a batch.
+
+        With ``size``, only the heads taking that (W, H) input are run. The
+        version is None for heads on a shared backbone; ``mocked`` is True when
+        the head's model is not loaded and the probabilities are a uniform placeholder.
+        """
+        self._ensure_loaded()
+        rows = int(batch.shape[0])
+        results = {}
+        for features_model, heads in self._groups:
+            heads = [head for head in heads if size is None or head.size == size]
+            if not heads:
+                continue
+            features = features_model(batch, training=False)
+            for head in heads:
+                results[head.name] = (OutputProcessor.extract_batch_probabilities(
+                    head.head_model(features, training=False)), None, False)
+        for head in self._heads.values():
+            if not head.separate or (size is not None and head.size != size):
+                continue
+            with self._registry.acquire(head.name) as model:
+                raw_output = model.wrapper.predict(batch)
+            if raw_output is None:
+                results[head.name] = (self._mock(head, rows), model.version, True)
+            else:
+                results[head.name] = (OutputProcessor.extract_batch_probabilities(raw_output), model.version, False)
+        return results
+
+    def predict(self, image_data, deadline=None):
+        """Preprocess one image (once per input size) and return {head name: result dict} in the /predict format."""
+        probs = {}
+        for size in self.input_sizes:
+            batch = preprocess_image(image_data, preprocess_mode=self.preprocess_mode, size=size)
+            check_deadline(deadline)
+            probs.update(self.infer(batch, size=size))
+        results = {}
+        for name, (rows, version, mocked) in probs.items():
+            results[name] = format_prediction(self._heads[name].class_names, rows[0])
+            results[name]["model_version"] = version
+            results[name]["mocked"] = mocked
+        return results
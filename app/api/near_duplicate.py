@@ -0,0 +1,168 @@
+"""Perceptual hashes of decoded images and an index that finds earlier near-identical uploads.
+
+Retaken, re-encoded or slightly cropped photos of the same lesion differ in
+every byte but hash to 64-bit values a few bits apart, so their predictions
+can be reused. Hashes are computed on the preprocessed model input. Both
+hashes only compare intensities with each other, so the per-mode
+normalization (a positive scale plus an offset) does not change them.
+
+The index is not scoped per client: whoever uploads a matching photo gets
+the stored result, whoever it was computed for.
+"""
+import threading
+import time
+
+import numpy as np
+
+# ITU-R BT.601 luma
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+_BITS = np.uint64(1) << np.arange(64, dtype=np.uint64)
+_POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def _gray(pixels):
+    """(H, W, 3) or (1, H, W, 3) image -> (H, W) float32 luminance."""
+    pixels = np.asarray(pixels)
+    if pixels.ndim == 4:
+        pixels = pixels[0]
+    return pixels.astype(np.float32, copy=False) @ _LUMA
+
+
+def _block_mean(gray, rows, cols):
+    """Area-average ``gray`` down to (rows, cols); sizes need not divide evenly."""
+    height, width = gray.shape
+    if height % rows == 0 and width % cols == 0:
+        return gray.reshape(rows, height // rows, cols, width // cols).mean(axis=(1, 3))
+    row_edges = np.linspace(0, height, rows + 1).astype(np.intp)
+    col_edges = np.linspace(0, width, cols + 1).astype(np.intp)
+    sums = np.add.reduceat(np.add.reduceat(gray, row_edges[:-1], axis=0), col_edges[:-1], axis=1)
+    return sums / np.outer(np.diff(row_edges), np.diff(col_edges))
+
+
+def _pack(bits):
+    return int(np.bitwise_or.reduce(_BITS[bits.ravel()]))
+
+
+def dhash(pixels):
+    """Difference hash: is each cell of a 8x9 thumbnail brighter than its left neighbour."""
+    thumb = _block_mean(_gray(pixels), 8, 9)
+    return _pack(thumb[:, 1:] > thumb[:, :-1])
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * k * (2 * np.arange(n)[None, :] + 1) / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def phash(pixels):
+    """DCT hash: which of the 8x8 lowest frequencies of a 32x32 thumbnail are above their median.
+
+    The DC term (overall brightness) is left out and its bit is always 0.
+    """
+    thumb = _block_mean(_gray(pixels), 32, 32).astype(np.float32)
+    low = (_DCT32 @ thumb @ _DCT32.T)[:8, :8].ravel()
+    bits = low > np.median(low[1:])
+    bits[0] = False
+    return _pack(bits)
+
+
+HASHES = {'dhash': dhash, 'phash': phash}
+
+
+def hamming(hashes, value):
+    """Bit distance between every entry of a uint64 array and ``value``."""
+    diff = np.bitwise_xor(hashes, np.uint64(value))
+    if hasattr(np, 'bitwise_count'):  # NumPy >= 2.0
+        return np.bitwise_count(diff)
+    return _POPCOUNT8[diff.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+# NEAR-DUPLICATE INDEX - Bounded LRU of (hash, context) -> result with a TTL
+
+class NearDuplicateIndex:
+    """Results of recent images, found again by any image whose hash is within ``max_distance`` bits.
+
+    Lookups compare the hash with every entry at once (XOR + popcount on a
+    preallocated uint64 array). Only entries with the same ``context``, e.g.
+    model version and preprocess mode, can match. When full, the least
+    recently used entry is replaced.
+    """
+
+    def __init__(self, max_entries=4096, max_distance=8, ttl=120.0, hash_name='phash'):
+        if hash_name not in HASHES:
+            raise ValueError(f"Unknown perceptual hash {hash_name!r} (expected one of {', '.join(HASHES)})")
+        self.max_entries = max(1, int(max_entries))
+        self.max_distance = int(max_distance)
+        self.ttl = float(ttl)
+        self.hash_name = hash_name
+        self.hash = HASHES[hash_name]
+        self._hashes = np.zeros(self.max_entries, dtype=np.uint64)
+        self._expires = np.full(self.max_entries, -np.inf)
+        self._used = np.zeros(self.max_entries, dtype=np.int64)
+        self._contexts = [None] * self.max_entries
+        self._values = [None] * self.max_entries
+        self._size = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def lookup(self, value, context=None):
+        """``(result, distance)`` of the closest live entry within the threshold, or ``(None, None)``."""
+        with self._lock:
+            size = self._size
+            distances = hamming(self._hashes[:size], value)
+            candidates = np.flatnonzero((distances <= self.max_distance) &
+                                        (self._expires[:size] > time.monotonic()))
+            for slot in candidates[np.argsort(distances[candidates], kind='stable')]:
+                if self._contexts[slot] == context:
+                    self._clock += 1
+                    self._used[slot] = self._clock
+                    self._hits += 1
+                    return self._values[slot], int(distances[slot])
+            self._misses += 1
+            return None, None
+
+    def add(self, value, result, context=None):
+        with self._lock:
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                expired = np.flatnonzero(self._expires <= time.monotonic())
+                slot = int(expired[0]) if len(expired) else int(np.argmin(self._used))
+                if not len(expired):
+                    self._evictions += 1
+            self._clock += 1
+            self._hashes[slot] = value
+            self._expires[slot] = time.monotonic() + self.ttl
+            self._used[slot] = self._clock
+            self._contexts[slot] = context
+            self._values[slot] = result
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._contexts = [None] * self.max_entries
+            self._values = [None] * self.max_entries
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": self._size,
+                "max_entries": self.max_entries,
+                "hash": self.hash_name,
+                "max_distance": self.max_distance,
+                "ttl_s": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": (self._hits / lookups) if lookups else 0.0,
+            }
@@ -0,0 +1,216 @@
+import gc
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from app.api.cache import model_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+def model_disk_bytes(model_path):
+    """Size of a model directory on disk, used as an estimate of its resident weights."""
+    if os.path.isfile(model_path):
+        return os.path.getsize(model_path)
+    total = 0
+    for root, _, files in os.walk(model_path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+class ModelVersion:
+    """One loaded (or loadable) version of a named model."""
+
+    def __init__(self, name, version, path, wrapper):
+        self.name = name
+        self.version = version
+        self.path = path
+        self.wrapper = wrapper
+        self.size_bytes = model_disk_bytes(path)
+        self.refcount = 0
+        self.retired = False
+        self.registered_at = time.time()
+        self.last_used = time.monotonic()
+
+    @property
+    def resident(self):
+        return self.wrapper.is_loaded()
+
+    def status(self, active):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "active": active,
+            "retired": self.retired,
+            "resident": self.resident,
+            "in_flight": self.refcount,
+            "size_mb": self.size_bytes / (1024 * 1024),
+            "model": self.wrapper.status(),
+        }
+
+
+# MODEL REGISTRY - Versioned models with atomic hot-swap and a memory budget
+
+class ModelRegistry:
+    """Keeps named, versioned models and swaps new versions in without downtime.
+
+    New versions load and warm up in the background, then become active
+    atomically. Requests hold a reference to the version they started on, so a
+    retired version is unloaded only once its last in-flight request finishes.
+    Resident models are kept under ``memory_budget_bytes`` by unloading the
+    least recently used idle versions that are not active; the active version
+    of each model always stays loaded and warm.
+    """
+
+    def __init__(self, wrapper_factory, memory_budget_bytes=2 * 1024 ** 3, warmup_batch_sizes=(1,)):
+        self._wrapper_factory = wrapper_factory
+        self.memory_budget_bytes = int(memory_budget_bytes)
+        self.warmup_batch_sizes = tuple(warmup_batch_sizes)
+        self._versions = {}     # name -> {version: ModelVersion}
+        self._active = {}       # name -> version
+        self._factories = {}    # name -> wrapper factory, when it differs from the default one
+        self._lock = threading.Lock()
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-loader')
+
+    def _new_version_locked(self, name, version, path):
+        factory = self._factories.get(name, self._wrapper_factory)
+        return ModelVersion(name, version, path, factory(path))
+
+    def register(self, name, path, version=None, activate=True, wrapper_factory=None):
+        """Add a model version without loading it (it loads lazily or via load()). Returns the version.
+
+        ``wrapper_factory`` overrides the registry's default for every version of ``name``,
+        e.g. to serve one model through a different backend.
+        """
+        version = version or model_fingerprint(path)[:8]
+        with self._lock:
+            if wrapper_factory is not None:
+                self._factories[name] = wrapper_factory
+            versions = self._versions.setdefault(name, {})
+            if version not in versions:
+                versions[version] = self._new_version_locked(name, version, path)
+            if activate or name not in self._active:
+                self._activate_locked(name, version)
+        return version
+
+    def ensure_registered(self, name, path, wrapper_factory=None):
+        """Register ``path`` under ``name`` unless that name already has an active version."""
+        with self._lock:
+            if name in self._active:
+                return self._active[name]
+        return self.register(name, path, wrapper_factory=wrapper_factory)
+
+    def load(self, name, path, version=None, activate=True):
+        """Load and warm up a new version in the background, then (optionally) swap it in.
+
+        Returns ``(version, future)``; the future resolves once the version is live.
+        """
+        version = version or model_fingerprint(path)[:8]
+        with self._lock:
+            versions = self._versions.setdefault(name, {})
+            if version not in versions:
+                versions[version] = self._new_version_locked(name, version, path)
+            entry = versions[version]
+
+        def task():
+            entry.wrapper.warmup(self.warmup_batch_sizes)
+            if entry.wrapper.state not in ('ready', 'mock'):
+                raise RuntimeError(f"Model {name}@{version} failed to load: {entry.wrapper.load_error}")
+            with self._lock:
+                if activate:
+                    self._activate_locked(name, version)
+                self._enforce_budget_locked()
+            logger.info(f"Model {name}@{version} loaded from {path}" + (" and activated" if activate else ""))
+            return version
+
+        return version, self._loader.submit(task)
+
+    def activate(self, name, version):
+        with self._lock:
+            if version not in self._versions.get(name, {}):
+                raise KeyError(f"Unknown model version {name}@{version}")
+            self._activate_locked(name, version)
+
+    def _activate_locked(self, name, version):
+        previous = self._active.get(name)
+        self._active[name] = version
+        entry = self._versions[name][version]
+        entry.retired = False
+        if previous is not None and previous != version:
+            old = self._versions[name][previous]
+            old.retired = True
+            logger.info(f"Model {name}: {previous} → {version}")
+            if old.refcount == 0:
+                self._unload_locked(old)
+
+    def _unload_locked(self, entry):
+        if entry.resident:
+            entry.wrapper.unload()
+            gc.collect()
+            logger.info(f"Unloaded model {entry.name}@{entry.version}")
+        if entry.retired:
+            self._versions[entry.name].pop(entry.version, None)
+
+    def _enforce_budget_locked(self):
+        resident = [e for versions in self._versions.values() for e in versions.values() if e.resident]
+        used = sum(e.size_bytes for e in resident)
+        # Retired versions go first, then the least recently used. Active versions
+        # stay resident: a lazy reload would skip warmup and leave the model unready.
+        for entry in sorted(resident, key=lambda e: (not e.retired, e.last_used)):
+            if used <= self.memory_budget_bytes:
+                break
+            if entry.refcount > 0 or self._active.get(entry.name) == entry.version:
+                continue
+            self._unload_locked(entry)
+            used -= entry.size_bytes
+
+    def active_version(self, name):
+        with self._lock:
+            return self._active.get(name)
+
+    def active(self, name):
+        with self._lock:
+            return self._versions[name][self._active[name]]
+
+    @contextmanager
+    def acquire(self, name):
+        """Pin the active version of ``name`` for the duration of one request."""
+        with self._lock:
+            entry = self._versions[name][self._active[name]]
+            entry.refcount += 1
+            entry.last_used = time.monotonic()
+            was_resident = entry.resident
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                entry.refcount -= 1
+                if entry.retired and entry.refcount == 0:
+                    self._unload_locked(entry)
+                elif not was_resident and entry.resident:
+                    self._enforce_budget_locked()
+
+    def resident_bytes(self):
+        with self._lock:
+            return sum(e.size_bytes for versions in self._versions.values()
+                       for e in versions.values() if e.resident)
+
+    def status(self):
+        with self._lock:
+            return {
+                "memory_budget_mb": self.memory_budget_bytes / (1024 * 1024),
+                "resident_mb": sum(e.size_bytes for versions in self._versions.values()
+                                   for e in versions.values() if e.resident) / (1024 * 1024),
+                "models": {
+                    name: [entry.status(self._active.get(name) == version)
+                           for version, entry in versions.items()]
+                    for name, versions in self._versions.items()
+                },
+            }
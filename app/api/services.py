@@ -1,15 +1,27 @@
 import numpy as np
-try:
-    import tensorflow as tf
-    TF_AVAILABLE = True
-except Exception:
-    tf = None
-    TF_AVAILABLE = False
+from app.api.lazy_import import TF_AVAILABLE, tf
+import functools
 import logging
 import os
+import queue
 import threading
-from app.api.model_loader import load_model, resolve_signature_input_key
-from app.api.image_processor import preprocess_image, validate_image
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from io import BytesIO
+from PIL import Image
+from app.api import config
+from app.api.cpu import configure_tensorflow_threads, cpu_sets, pin_current_thread
+from app.api.cache import PredictionCache, ModelIdentity, content_hash as hash_content
+from app.api.near_duplicate import NearDuplicateIndex
+from app.api.executor import AdmissionError, DeadlineExceededError, check_deadline, remaining_time
+from app.api.registry import ModelRegistry
+from app.api.metrics import (STAGE_SECONDS, BATCH_SIZE, ERRORS_TOTAL, MOCK_PREDICTIONS_TOTAL, CASCADE_DECISIONS_TOTAL,
+                             StageTimer)
+from app.api.model_loader import (load_model, load_tflite_model, resolve_signature_input_key, compile_inference_fn,
+                                  TFLiteModel, architecture_input_shape, model_input_shape)
+from app.api.image_processor import (apply_preprocess, decode_image, preprocess_image, preprocess_images,
+                                     validate_image)
 from app.api.class_loader import load_class_names
 
 logger = logging.getLogger(__name__)
@@ -20,11 +32,11 @@ class OutputProcessor:
     """Handles extraction and normalization of predictions from various model output formats."""
 
     @staticmethod
-    def extract_probabilities(raw_output):
-        """Convert various TensorFlow output formats to a probability array."""
+    def _to_numpy(raw_output):
+        """Convert various TensorFlow output formats to a numpy array."""
         if isinstance(raw_output, np.ndarray):
-            probs = raw_output
-        elif isinstance(raw_output, dict):
+            return raw_output
+        if isinstance(raw_output, dict):
             tensor = None
             for key in ('probabilities', 'predictions', 'outputs', 'output_0', 'Identity'):
                 if key in raw_output:
@@ -34,32 +46,170 @@ class OutputProcessor:
                 tensor = next(iter(raw_output.values()))
             # If tensor-like, attempt to extract numpy array
             try:
-                probs = tensor.numpy()
+                return tensor.numpy()
             except Exception:
-                probs = np.array(tensor)
-        elif TF_AVAILABLE and tf is not None and tf.is_tensor(raw_output):
-            probs = raw_output.numpy()
-        else:
-            raise ValueError("Unsupported model output type")
+                return np.array(tensor)
+        # A TF tensor can only exist once TensorFlow has been imported
+        if tf.loaded and tf.is_tensor(raw_output):
+            return raw_output.numpy()
+        raise ValueError("Unsupported model output type")
+
+    @classmethod
+    def extract_probabilities(cls, raw_output):
+        """Convert various TensorFlow output formats to a probability array.
+
+        A (1, num_classes) output is flattened to (num_classes,); batched
+        (N, num_classes) outputs are returned unchanged.
+        """
+        probs = cls._to_numpy(raw_output)
 
         # Flatten if shape is (1, num_classes)
         if probs.ndim == 2 and probs.shape[0] == 1:
             probs = probs[0]
         return probs
 
+    @classmethod
+    def extract_batch_probabilities(cls, raw_output):
+        """Like extract_probabilities, but always returns shape (N, num_classes)."""
+        probs = cls._to_numpy(raw_output)
+        if probs.ndim == 1:
+            probs = probs[np.newaxis, :]
+        if probs.ndim != 2:
+            raise ValueError(f"Expected (N, num_classes) model output, got shape {probs.shape}")
+        return probs
+
+
+def format_prediction(class_names, preds):
+    """Map a (num_classes,) probability vector to the API result format."""
+    return {
+        "success": True,
+        "predictions": {class_names[i]: float(p) for i, p in enumerate(preds)},
+        "top_prediction": class_names[np.argmax(preds)],
+        "confidence": float(np.max(preds))
+    }
+
+
+ 
+# REPLICAS - Concurrent forward passes on several model instances
+
+_replica_pools = weakref.WeakSet()
+
+
+class ReplicaPool:
+    """Model replicas, each owned by one worker thread; every call goes to the least busy replica.
+
+    ``factory()`` builds each replica on its own thread, after that thread has
+    been pinned to the replica's CPU set from ``affinity`` (see cpu.cpu_sets),
+    so thread pools a replica starts inherit the pinning.
+    """
+
+    def __init__(self, factory, replicas, affinity='', name='replica'):
+        self.affinity = affinity
+        self.name = name
+        self._lock = threading.Lock()
+        self._in_flight = [0] * replicas
+        self._executors = None
+        executors = self._start(replicas)
+        self.models = [f.result() for f in [executor.submit(factory) for executor in executors]]
+        _replica_pools.add(self)
+
+    def _start(self, replicas):
+        sets = cpu_sets(self.affinity, replicas)
+        self.cpu_sets = sets
+        self._executors = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'{self.name}-{i}',
+                                              initializer=pin_current_thread,
+                                              initargs=(sets[i] if sets else None,))
+                           for i in range(replicas)]
+        return self._executors
+
+    def run(self, fn, batch):
+        """``fn(model, batch)`` on the least busy replica; blocks until it returns."""
+        with self._lock:
+            executors = self._executors or self._start(len(self.models))
+            i = min(range(len(self._in_flight)), key=self._in_flight.__getitem__)
+            self._in_flight[i] += 1
+        try:
+            return executors[i].submit(fn, self.models[i], batch).result()
+        finally:
+            with self._lock:
+                self._in_flight[i] -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"replicas": len(self.models), "in_flight": list(self._in_flight), "cpu_sets": self.cpu_sets}
+
+    def shutdown(self):
+        with self._lock:
+            executors, self._executors = self._executors, None
+        for executor in executors or ():
+            executor.shutdown(wait=False)
+
+    def _after_fork(self):
+        # Worker threads do not survive fork(); the child starts its own on first use, with CPU sets
+        # taken from the CPUs it is allowed to use by then (serve.py pins each worker first)
+        self._lock = threading.Lock()
+        self._in_flight = [0] * len(self.models)
+        self._executors = None
+
+
+def _reset_replica_pools():
+    for pool in list(_replica_pools):
+        pool._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_replica_pools)
+
 
  
 # MODEL WRAPPER - Encapsulate model loading and inference
  
 class ModelWrapper:
-    """Wraps model loading and prediction with lazy initialization and thread safety."""
+    """Wraps model loading and prediction with lazy initialization and thread safety.
 
-    def __init__(self, model_path):
+    ``backend`` selects the runtime: ``'tf'`` loads the Keras/SavedModel model,
+    ``'tflite'`` runs a converted ``model_<variant>.tflite`` from the same
+    directory through the TFLite interpreter with ``num_threads`` threads.
+
+    With ``compiled`` (the default) TF models run through a tf.function with a
+    fixed input signature (optionally XLA-compiled with ``jit_compile``), and
+    batches are zero-padded up to the next size in ``batch_buckets`` so only a
+    handful of shapes are ever traced. ``mock`` skips loading and always
+    returns mock (uniform) predictions, e.g. for load tests of the HTTP layer.
+
+    ``replicas`` > 1 runs that many forward passes concurrently through a
+    ReplicaPool. TFLite replicas are separate interpreters with ``num_threads``
+    threads each, pinned per ``cpu_affinity``. TensorFlow's thread pools are
+    process-wide, so TF replicas share one model and the pools are sized
+    ``replicas`` x ``intra_op_threads`` / ``inter_op_threads`` instead.
+    """
+
+    def __init__(self, model_path, backend='tf', tflite_variant='float16', num_threads=None,
+                 compiled=True, jit_compile=False, batch_buckets=(1, 2, 4, 8, 16, 32), mock=False,
+                 replicas=1, intra_op_threads=0, inter_op_threads=0, cpu_affinity=''):
         self._model_path = model_path
+        self.mock = mock
+        self.backend = backend
+        self.tflite_variant = tflite_variant
+        self.num_threads = num_threads
+        self.replicas = max(1, int(replicas))
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.cpu_affinity = cpu_affinity
+        self._pool = None
+        self.compiled = compiled
+        self.jit_compile = jit_compile
+        self.batch_buckets = tuple(sorted(batch_buckets))
+        self._infer_fn = None
         self._model = None
         self._model_loaded = False
         self._lock = threading.Lock()
         self._signature_input_key = None
+        # not_loaded → loading → loaded → warming → ready; "mock" without TensorFlow, "failed" on load errors
+        self.state = 'not_loaded'
+        self.load_error = None
+        self.load_seconds = None
+        self.warmup_seconds = {}
 
     def _ensure_loaded(self):
         """Load model on first access (thread-safe)."""
@@ -70,22 +220,112 @@ class ModelWrapper:
             if self._model_loaded:  # Double-check locking
                 return
             
-            if not TF_AVAILABLE:
+            if self.mock:
+                logger.warning("Mock model mode enabled — returning uniform predictions")
+                self._model = None
+                self.state = 'mock'
+                self.load_error = 'Mock mode enabled'
+                self._model_loaded = True
+                return
+
+            if not TF_AVAILABLE and self.backend != 'tflite':
                 logger.warning("TensorFlow not available — running in mock prediction mode")
                 self._model = None
+                self.state = 'mock'
+                self.load_error = 'TensorFlow not available'
                 self._model_loaded = True
                 return
             
+            self.state = 'loading'
+            start = time.perf_counter()
             try:
-                self._model = load_model(self._model_path)
-                self._signature_input_key = resolve_signature_input_key(self._model)
-                self._model_loaded = True
-                logger.info(f"Model loaded from {self._model_path}")
+                if self.backend == 'tflite' and (self.replicas > 1 or self.cpu_affinity):
+                    self._pool = ReplicaPool(
+                        lambda: load_tflite_model(self._model_path, self.tflite_variant, self.num_threads),
+                        self.replicas, self.cpu_affinity, name='tflite-replica')
+                    self._model = self._pool.models[0]
+                elif self.backend == 'tflite':
+                    self._model = load_tflite_model(self._model_path, self.tflite_variant, self.num_threads)
+                else:
+                    configure_tensorflow_threads(self.intra_op_threads * self.replicas,
+                                                 self.inter_op_threads * self.replicas)
+                    self._model = load_model(self._model_path)
+                self._prepare()
+                self.state = 'loaded'
+                logger.info(f"Model loaded from {self._model_path} ({self.backend} backend)")
             except Exception as e:
                 logger.error(f"Model load failed: {e}", exc_info=True)
                 self._model = None
+                self.state = 'failed'
+                self.load_error = str(e)
+            finally:
+                self.load_seconds = time.perf_counter() - start
                 self._model_loaded = True
 
+    def _prepare(self):
+        """Resolve the input key and build the compiled inference function once per loaded model."""
+        self._signature_input_key = resolve_signature_input_key(self._model)
+        self._infer_fn = None
+        if self.compiled and TF_AVAILABLE and not isinstance(self._model, TFLiteModel):
+            self._infer_fn = compile_inference_fn(self._model, self._signature_input_key, self.jit_compile)
+        if self._pool is None and self.replicas > 1:
+            model = self._model
+            self._pool = ReplicaPool(lambda: model, self.replicas, name='replica')
+
+    def attach(self, model):
+        """Serve an already-built model (used by benchmarks and tools that construct models in-process)."""
+        with self._lock:
+            self._model = model
+            self._prepare()
+            self.state = 'loaded'
+            self.load_error = None
+            self._model_loaded = True
+
+    def load(self):
+        """Load the model now instead of on the first request. Returns True if a real model is available."""
+        self._ensure_loaded()
+        return self._model is not None
+
+    @property
+    def input_shape(self):
+        """(H, W, C) the model expects: from the loaded model, else from model_architecture.json."""
+        default = architecture_input_shape(self._model_path)
+        if isinstance(self._model, TFLiteModel):
+            return self._model.input_shape
+        if self._model is not None and TF_AVAILABLE:
+            return model_input_shape(self._model, self._signature_input_key, default)
+        return default
+
+    def warmup(self, batch_sizes=(1,), input_shape=None):
+        """Run synthetic batches of each size through the model so graphs are traced before real traffic."""
+        if not self.load():
+            return
+        input_shape = input_shape or self.input_shape
+        self.state = 'warming'
+        for size in batch_sizes:
+            start = time.perf_counter()
+            self.predict(np.zeros((size,) + tuple(input_shape), dtype=np.float32))
+            self.warmup_seconds[size] = time.perf_counter() - start
+        self.state = 'ready'
+        logger.info(f"Model warmed up for batch sizes {list(batch_sizes)} "
+                    f"in {sum(self.warmup_seconds.values()):.2f}s")
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def status(self):
+        return {
+            "state": self.state,
+            "model_path": self._model_path,
+            "backend": self.backend if self.backend != 'tflite' else f"tflite/{self.tflite_variant}",
+            "compiled": self._infer_fn is not None,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": {str(k): v for k, v in self.warmup_seconds.items()},
+            "error": self.load_error,
+            "replicas": self._pool.stats() if self._pool is not None else None,
+        }
+
     def predict(self, processed_img):
         """Run inference on preprocessed image."""
         self._ensure_loaded()
@@ -96,27 +336,246 @@ class ModelWrapper:
             return None
         
         # Real prediction
-        if TF_AVAILABLE and isinstance(self._model, tf.keras.Model):
-            return self._model.predict(processed_img, verbose=0)
-        
-        # SavedModel signature
-        key = self._signature_input_key or 'inputs'
-        try:
-            return self._model(**{key: processed_img})
-        except TypeError:
-            for alt in ('input_1', 'input', 'image', 'images', 'x'):
-                try:
-                    return self._model(**{alt: processed_img})
-                except TypeError:
-                    continue
+        pool = self._pool
+        if pool is not None:
+            return pool.run(self._forward, processed_img)
+        return self._forward(self._model, processed_img)
+
+    def _forward(self, model, processed_img):
+        if isinstance(model, TFLiteModel):
+            return model(processed_img)
+        if self._infer_fn is not None:
+            return self._predict_compiled(processed_img)
+        if TF_AVAILABLE and isinstance(model, tf.keras.Model):
+            return model.predict(processed_img, verbose=0)
         
-        return self._model(processed_img)
+        # SavedModel signature (input key resolved at load time)
+        if self._signature_input_key:
+            return model(**{self._signature_input_key: processed_img})
+        return model(processed_img)
+
+    def _predict_compiled(self, processed_img):
+        images = tf.convert_to_tensor(processed_img, dtype=tf.float32)
+        rows = int(images.shape[0])
+        bucket = next((b for b in self.batch_buckets if b >= rows), rows)
+        if bucket > rows:
+            images = tf.pad(images, [[0, bucket - rows], [0, 0], [0, 0], [0, 0]])
+        output = self._infer_fn(images)
+        if bucket == rows:
+            return output
+        if isinstance(output, dict):
+            return {key: value[:rows] for key, value in output.items()}
+        return output[:rows]
 
     def is_available(self):
         """Check if model is available."""
         self._ensure_loaded()
         return self._model is not None
 
+    def is_loaded(self):
+        """True while a real model is resident in memory (without triggering a load)."""
+        return self._model_loaded and self._model is not None
+
+    def unload(self):
+        """Drop the model; the next predict() or load() loads it again."""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+            self._model = None
+            self._infer_fn = None
+            self._signature_input_key = None
+            self._model_loaded = False
+            self.state = 'not_loaded'
+            self.warmup_seconds = {}
+
+
+def model_wrapper_factory(backend=None, tflite_variant=None, num_threads=None, compiled=None, jit_compile=None,
+                          replicas=None):
+    """Build ModelWrappers with the configured backend and CPU topology (SKINSCREEN_MODEL_BACKEND etc.)."""
+    backend = backend or config.MODEL_BACKEND
+    tflite_variant = tflite_variant or config.TFLITE_VARIANT
+    if num_threads is None:
+        num_threads = config.TFLITE_THREADS or config.INTRA_OP_THREADS or None
+    return functools.partial(
+        ModelWrapper, backend=backend, tflite_variant=tflite_variant, num_threads=num_threads,
+        compiled=config.COMPILED_INFERENCE if compiled is None else compiled,
+        jit_compile=config.XLA_JIT if jit_compile is None else jit_compile,
+        batch_buckets=config.BATCH_BUCKETS,
+        mock=config.MOCK_MODEL,
+        replicas=config.MODEL_REPLICAS if replicas is None else replicas,
+        intra_op_threads=config.INTRA_OP_THREADS,
+        inter_op_threads=config.INTER_OP_THREADS,
+        cpu_affinity=config.CPU_AFFINITY,
+    )
+
+
+ 
+# BATCH SCHEDULER - Coalesce concurrent requests into batched forward passes
+ 
+def _concat_batch(arrays):
+    """Concatenate preprocessed inputs along the batch axis."""
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.concatenate(arrays, axis=0)
+
+
+
+class _BatchItem:
+    __slots__ = ('inputs', 'rows', 'deadline', 'future')
+
+    def __init__(self, inputs, rows, deadline=None):
+        self.inputs = inputs
+        self.rows = rows
+        self.deadline = deadline
+        self.future = Future()
+
+
+class BatchScheduler:
+    """Gathers requests arriving within a short window and runs them as one batch.
+
+    ``run_batch`` receives the concatenated inputs and must return
+    ``(probs, meta)`` with probs of shape (N, num_classes) and one ``meta``
+    entry per row; each caller gets back both sliced to its own inputs.
+
+    With ``concurrency`` > 1 up to that many batches run at once (one per model
+    replica); the next batch keeps filling while all of them are busy.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, window_ms=5.0, concurrency=1):
+        self._run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self.concurrency = max(1, int(concurrency))
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._executor = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._dropped = 0
+        self._size_histogram = {}
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                if self.concurrency > 1:
+                    self._executor = ThreadPoolExecutor(max_workers=self.concurrency,
+                                                        thread_name_prefix='batch-runner')
+                self._thread = threading.Thread(target=self._worker, name='batch-scheduler', daemon=True)
+                self._thread.start()
+
+    def submit(self, processed_img, deadline=None):
+        """Queue preprocessed inputs of shape (rows, H, W, C); returns a Future of ((rows, num_classes), meta).
+
+        Items whose time.monotonic() ``deadline`` has passed are dropped before the forward pass.
+        """
+        item = _BatchItem(processed_img, int(processed_img.shape[0]), deadline)
+        self._ensure_started()
+        self._queue.put(item)
+        return item.future
+
+    def predict(self, processed_img, deadline=None):
+        """Blocking convenience wrapper around submit()."""
+        future = self.submit(processed_img, deadline)
+        try:
+            return future.result(timeout=remaining_time(deadline))
+        except FutureTimeoutError:
+            raise DeadlineExceededError("Request deadline exceeded waiting for inference")
+
+    def _collect(self):
+        """Block for the first item, then gather more until the window closes or the batch is full."""
+        first = self._queue.get()
+        batch = [first]
+        rows = first.rows
+        window_end = time.monotonic() + self.window
+        while rows < self.max_batch_size:
+            remaining = window_end - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if rows + item.rows > self.max_batch_size:
+                # Does not fit: dispatch what we have and start the next batch with it
+                self._start_batch(batch, rows)
+                batch, rows = [item], item.rows
+                window_end = time.monotonic() + self.window
+                continue
+            batch.append(item)
+            rows += item.rows
+        return batch, rows
+
+    def _worker(self):
+        while True:
+            batch, rows = self._collect()
+            self._start_batch(batch, rows)
+
+    def _start_batch(self, batch, rows):
+        if self._executor is None:
+            self._dispatch(batch, rows)
+            return
+        # Wait for a free replica; requests arriving meanwhile queue up for the next batch
+        self._slots.acquire()
+        self._executor.submit(self._dispatch_released, batch, rows)
+
+    def _dispatch_released(self, batch, rows):
+        try:
+            self._dispatch(batch, rows)
+        finally:
+            self._slots.release()
+
+    def _dispatch(self, batch, rows):
+        now = time.monotonic()
+        live = []
+        for item in batch:
+            if item.deadline is not None and now >= item.deadline:
+                with self._stats_lock:
+                    self._dropped += 1
+                item.future.set_exception(DeadlineExceededError("Request deadline exceeded before inference"))
+            else:
+                live.append(item)
+        if not live:
+            return
+        batch = live
+        rows = sum(item.rows for item in batch)
+        self._record(rows)
+        try:
+            probs, meta = self._run_batch(_concat_batch([item.inputs for item in batch]))
+            offset = 0
+            for item in batch:
+                item.future.set_result((probs[offset:offset + item.rows], meta[offset:offset + item.rows]))
+                offset += item.rows
+        except Exception as e:
+            logger.error(f"Batched inference failed for {rows} rows: {e}", exc_info=True)
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+
+    def _record(self, rows):
+        with self._stats_lock:
+            self._batches += 1
+            self._items += rows
+            self._size_histogram[rows] = self._size_histogram.get(rows, 0) + 1
+
+    def stats(self):
+        """Batch-size statistics since startup."""
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "images": self._items,
+                "mean_batch_size": (self._items / self._batches) if self._batches else 0.0,
+                "max_batch_size": self.max_batch_size,
+                "window_ms": self.window * 1000.0,
+                "concurrency": self.concurrency,
+                "queue_depth": self._queue.qsize(),
+                "dropped_stale": self._dropped,
+                "batch_size_histogram": dict(sorted(self._size_histogram.items())),
+            }
+
 
  
 # PREDICTION SERVICE - Orchestrate prediction pipeline
@@ -127,16 +586,82 @@ class PredictionService:
     def __init__(self, model_path='saved_model/third', 
                  class_indices_path='saved_model/third/class_indices.json',
                  labels_txt_path='saved_model/third/labels.txt',
-                 preprocess_mode: str = 'efficientnet'):
+                 preprocess_mode: str = 'efficientnet',
+                 batching=None, max_batch_size=None, batch_window_ms=None,
+                 cache=None, registry=None, model_name='disease',
+                 cascade=None, cascade_threshold=None, cascade_model_path=None, near_duplicates=None):
         self.logger = logging.getLogger(__name__)
-        self._model_wrapper = ModelWrapper(model_path)
+        self.model_path = model_path
+        self.model_name = model_name
         self._output_processor = OutputProcessor()
         self.class_names = self._load_class_names(class_indices_path, labels_txt_path)
         self.preprocess_mode = preprocess_mode
+        # Decode straight to the resolution the model was trained at
+        height, width, _ = architecture_input_shape(model_path)
+        self.input_size = (width, height)
+
+        batching = config.BATCHING_ENABLED if batching is None else batching
+        self._scheduler = None
+        if batching:
+            self._scheduler = BatchScheduler(
+                self._infer_batch,
+                max_batch_size=config.BATCH_MAX_SIZE if max_batch_size is None else max_batch_size,
+                window_ms=config.BATCH_WINDOW_MS if batch_window_ms is None else batch_window_ms,
+                concurrency=config.MODEL_REPLICAS,
+            )
+
+        # Versioned models; the active version of `model_name` serves every request
+        if registry is None:
+            registry = ModelRegistry(model_wrapper_factory(),
+                                     memory_budget_bytes=int(config.MODEL_MEMORY_BUDGET_MB * 1024 * 1024),
+                                     warmup_batch_sizes=self.warmup_batch_sizes())
+        self._registry = registry
+        self._registry.ensure_registered(model_name, model_path)
+
+        # Optional cheap first stage, registered as "<model_name>_fast" with its own backend
+        cascade = config.CASCADE_ENABLED if cascade is None else cascade
+        self.cascade_threshold = config.CASCADE_THRESHOLD if cascade_threshold is None else cascade_threshold
+        self._cascade_name = None
+        if cascade:
+            self._cascade_name = f"{model_name}_fast"
+            self._registry.ensure_registered(
+                self._cascade_name, cascade_model_path or config.CASCADE_MODEL_PATH or model_path,
+                wrapper_factory=model_wrapper_factory(backend=config.CASCADE_BACKEND,
+                                                      tflite_variant=config.CASCADE_TFLITE_VARIANT))
+
+        cache = config.CACHE_ENABLED if cache is None else cache
+        self._cache = None
+        if cache:
+            self._cache = PredictionCache(
+                max_entries=config.CACHE_MAX_ENTRIES,
+                max_bytes=int(config.CACHE_MAX_MB * 1024 * 1024),
+                ttl=config.CACHE_TTL_S,
+            )
+
+        near_duplicates = config.NEAR_DUPLICATE_ENABLED if near_duplicates is None else near_duplicates
+        self._near_duplicates = None
+        if near_duplicates:
+            self._near_duplicates = NearDuplicateIndex(
+                max_entries=config.NEAR_DUPLICATE_MAX_ENTRIES,
+                max_distance=config.NEAR_DUPLICATE_MAX_DISTANCE,
+                ttl=config.NEAR_DUPLICATE_TTL_S,
+                hash_name=config.NEAR_DUPLICATE_HASH,
+            )
+
+        self._model_identity = None
+        if cache or near_duplicates:
+            self._model_identity = ModelIdentity(model_path, config.CACHE_MODEL_CHECK_S,
+                                                 on_change=self._clear_stored_results)
 
       
     # Private helper methods
       
+    def _clear_stored_results(self):
+        if self._cache is not None:
+            self._cache.clear()
+        if self._near_duplicates is not None:
+            self._near_duplicates.clear()
+
     def _load_class_names(self, json_path, labels_txt_path):
         """Delegate to class_loader module."""
         return load_class_names(json_path, labels_txt_path)
@@ -147,14 +672,189 @@ class PredictionService:
 
     def preprocess_image(self, image_data):
         """Delegate to image_processor module with configured preprocess mode."""
-        return preprocess_image(image_data, preprocess_mode=self.preprocess_mode)
+        return preprocess_image(image_data, preprocess_mode=self.preprocess_mode, size=self.input_size)
+
+    def preprocess_images(self, images):
+        """Batch variant of preprocess_image; see image_processor.preprocess_images."""
+        return preprocess_images(images, preprocess_mode=self.preprocess_mode, size=self.input_size)
+
+    @property
+    def _model_wrapper(self):
+        """Wrapper of the currently active model version."""
+        return self._registry.active(self.model_name).wrapper
+
+    def _format_result(self, preds, meta=(None, None, False)):
+        result = format_prediction(self.class_names, preds)
+        result["model_version"], result["cascade_stage"], result["mocked"] = meta
+        return result
+
+    def _error_result(self, error):
+        return {
+            "success": False,
+            "error": str(error),
+            "message": "Error analyzing image. Please try again."
+        }
+
+    def _run_model(self, name, batch, stage='forward'):
+        """One forward pass of the active version of ``name``; returns (probs (N, num_classes), version, mocked)."""
+        rows = int(batch.shape[0])
+        start = time.perf_counter()
+        with self._registry.acquire(name) as model:
+            raw_output = model.wrapper.predict(batch)
+        forward_done = time.perf_counter()
+        STAGE_SECONDS.observe(forward_done - start, stage)
+        BATCH_SIZE.observe(rows)
+        if raw_output is None:
+            # Mock mode: uniform distribution
+            size = len(self.class_names) if self.class_names else 2
+            return np.ones((rows, size), dtype=float) / float(size), model.version, True
+        probs = self._output_processor.extract_batch_probabilities(raw_output)
+        STAGE_SECONDS.observe(time.perf_counter() - forward_done, 'extract')
+        return probs, model.version, False
+
+    def _infer_batch(self, batch):
+        """Score a preprocessed batch; returns (probabilities of shape (N, num_classes), per-row meta).
+
+        Each meta entry is ``(model version, cascade stage, mocked)``; the stage is None without
+        a cascade, ``mocked`` is True for the uniform placeholder of a model that is not loaded.
+        """
+        if self._cascade_name is not None:
+            return self._infer_cascade(batch)
+        probs, version, mocked = self._run_model(self.model_name, batch)
+        if mocked:
+            MOCK_PREDICTIONS_TOTAL.inc(len(probs))
+        return probs, [(version, None, mocked)] * len(probs)
+
+    def _infer_cascade(self, batch):
+        """Cheap stage first; only rows below the confidence threshold go through the full model."""
+        fast_probs, fast_version, fast_mocked = self._run_model(self._cascade_name, batch, 'cascade_forward')
+        confident = np.zeros(len(fast_probs), dtype=bool) if fast_mocked else \
+            fast_probs.max(axis=1) >= self.cascade_threshold
+        meta = [(fast_version, 'fast', fast_mocked)] * len(fast_probs)
+        escalate = np.flatnonzero(~confident)
+        CASCADE_DECISIONS_TOTAL.inc(len(fast_probs) - len(escalate), 'fast')
+        if len(escalate) == 0:
+            return fast_probs, meta
+
+        CASCADE_DECISIONS_TOTAL.inc(len(escalate), 'full')
+        full_probs, full_version, full_mocked = self._run_model(self.model_name, batch[escalate])
+        if full_mocked:
+            MOCK_PREDICTIONS_TOTAL.inc(len(escalate))
+        probs = np.array(fast_probs, dtype=np.result_type(fast_probs, full_probs))
+        probs[escalate] = full_probs
+        for row in escalate:
+            meta[row] = (full_version, 'full', full_mocked)
+        return probs, meta
 
       
     # Public API
       
-    def predict(self, image_data):
+    def warmup_batch_sizes(self):
+        """Batch sizes the scheduler can produce that are worth tracing ahead of time."""
+        limit = self._scheduler.max_batch_size if self._scheduler is not None else 1
+        sizes = {1, limit}
+        size = 2
+        while size < limit:
+            sizes.add(size)
+            size *= 2
+        return sorted(sizes)
+
+    def warmup(self):
+        """Load the model and warm up preprocessing and every batch size with synthetic inputs."""
+        self.warmup_preprocess()
+        self.warmup_model()
+
+    def warmup_preprocess(self):
+        """Decode and normalize a synthetic photo so the first request does not pay for initialization."""
+        buf = BytesIO()
+        Image.new('RGB', (640, 480), (180, 120, 100)).save(buf, 'JPEG')
+        batch, _, _ = self.preprocess_images([buf.getvalue()])
+        if self._near_duplicates is not None and batch is not None:
+            self._near_duplicates.hash(batch[:1])
+
+    def warmup_model(self):
+        """Load the active model (and cascade stage) and trace every batch size, without preprocessing."""
+        if self._cascade_name is not None:
+            self._registry.active(self._cascade_name).wrapper.warmup(self.warmup_batch_sizes())
+        self._model_wrapper.warmup(self.warmup_batch_sizes())
+
+    def start_background_warmup(self):
+        """Run warmup() in a daemon thread so startup does not block the server."""
+        thread = threading.Thread(target=self._safe_warmup, name='model-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    def _safe_warmup(self):
+        try:
+            self.warmup()
+        except Exception as e:
+            self.logger.error(f"Model warm-up failed: {e}", exc_info=True)
+            self._model_wrapper.state = 'failed'
+            self._model_wrapper.load_error = str(e)
+
+    def is_ready(self, allow_mock=False):
+        """True once the model is loaded and warmed up (or, with allow_mock, settled in mock mode)."""
+        state = self._model_wrapper.state
+        return state == 'ready' or (allow_mock and state in ('mock', 'failed'))
+
+    def model_status(self):
+        status = self._model_wrapper.status()
+        status["version"] = self._registry.active_version(self.model_name)
+        if self._cascade_name is not None:
+            cascade = self._registry.active(self._cascade_name)
+            status["cascade"] = {**cascade.wrapper.status(), "version": cascade.version,
+                                 "threshold": self.cascade_threshold}
+        return status
+
+    @property
+    def registry(self):
+        return self._registry
+
+    def registry_status(self):
+        return self._registry.status()
+
+    def load_model_version(self, model_path, version=None, activate=True):
+        """Load a new model version in the background and hot-swap it in once warm. Returns (version, Future)."""
+        return self._registry.load(self.model_name, model_path, version=version, activate=activate)
+
+    def activate_model_version(self, version):
+        self._registry.activate(self.model_name, version)
+
+    def batch_stats(self):
+        """Batch-size statistics of the micro-batching scheduler, or None when disabled."""
+        return self._scheduler.stats() if self._scheduler is not None else None
+
+    def cache_stats(self):
+        """Hit/miss counters and size of the prediction cache, or None when disabled."""
+        return self._cache.stats() if self._cache is not None else None
+
+    def near_duplicate_stats(self):
+        """Hit/miss counters and size of the near-duplicate index, or None when disabled."""
+        return self._near_duplicates.stats() if self._near_duplicates is not None else None
+
+    def result_context(self):
+        """What a stored result is valid for: model version and identity + preprocess mode."""
+        version = self._registry.active_version(self.model_name)
+        if self._cascade_name is not None:
+            version = f"{version}+{self._registry.active_version(self._cascade_name)}@{self.cascade_threshold}"
+        return f"{version}:{self._model_identity.value}:{self.preprocess_mode}"
+
+    def cache_key(self, image_data, content_hash=None):
+        """Cache key: image bytes hash + result_context()."""
+        digest = content_hash or hash_content(image_data)
+        return f"{digest}:{self.result_context()}"
+
+    def predict(self, image_data, deadline=None, content_hash=None):
         """
         Execute full prediction pipeline: validate image → preprocess → infer → format result.
+
+        Results are served from the prediction cache when the same image was scored
+        recently; concurrent identical requests share one inference. ``content_hash``
+        may be passed when the caller already hashed the bytes. With the near-duplicate
+        index enabled, a visually near-identical recent image's result is reused too.
+
+        ``deadline`` is an optional time.monotonic() value; requests that are still
+        waiting when it passes raise DeadlineExceededError instead of being scored.
         
         Returns:
             dict: {
@@ -162,45 +862,149 @@ class PredictionService:
                 "predictions": {"ClassName": float, ...},
                 "top_prediction": str,
                 "confidence": float,
+                "model_version": str,
+                "cascade_stage": "fast" | "full" | None,
+                "cached": "exact" | "near_duplicate" | None,
+                "mocked": bool (placeholder scores; never cached or reused),
+                "timings": {"stage": seconds, ...},
                 "error": str (if success=False),
                 "message": str (if success=False)
             }
         """
+        if self._cache is None or not image_data:
+            return self._predict_uncached(image_data, deadline)
+
+        timer = StageTimer()
+        result, hit = self._cache.get_or_compute(
+            self.cache_key(image_data, content_hash),
+            lambda: self._predict_uncached(image_data, deadline),
+            cacheable=lambda r: r.get("success", False) and not r.get("mocked"),
+            deadline=deadline,
+        )
+        result = dict(result)
+        if hit:
+            result["cached"] = "exact"
+            # The stored timings belong to the request that computed the entry
+            timer.mark('cache')
+            timer.observe()
+            result["timings"] = timer.stages
+        return result
+
+    def _predict_uncached(self, image_data, deadline=None):
+        timer = StageTimer()
         try:
             if not image_data:
                 raise ValueError("Empty image data provided")
 
-            # Step 1: Validate
-            if not self._validate_image(image_data):
-                raise ValueError("Invalid image format")
-
-            # Step 2: Preprocess
+            # Step 1 + 2: Validate and preprocess (a single decode; invalid images raise ValueError)
             processed_img = self.preprocess_image(image_data)
+            timer.mark('preprocess')
+            return self._score(processed_img, timer, deadline)
 
-            # Step 3: Infer
-            raw_output = self._model_wrapper.predict(processed_img)
-            
-            # Step 4: Extract probabilities
-            if raw_output is None:
-                # Mock mode: uniform distribution
-                size = len(self.class_names) if self.class_names else 2
-                preds = np.ones((size,), dtype=float) / float(size)
+        except AdmissionError:
+            raise
+        except Exception as e:
+            ERRORS_TOTAL.inc(1, type(e).__name__)
+            self.logger.error(f"Prediction error: {e}", exc_info=True)
+            return self._error_result(e)
+
+    def predict_frame(self, image_data, buffer, deadline=None):
+        """Score one live-camera frame, decoding into ``buffer``, a reusable (1, H, W, 3) float32 array.
+
+        Same result format as predict(), without the cache of identical uploads.
+        """
+        timer = StageTimer()
+        try:
+            if not image_data:
+                raise ValueError("Empty image data provided")
+            decode_image(image_data, size=self.input_size, out=buffer[0])
+            apply_preprocess(buffer, self.preprocess_mode, out=buffer)
+            timer.mark('preprocess')
+            return self._score(buffer, timer, deadline)
+
+        except AdmissionError:
+            raise
+        except Exception as e:
+            ERRORS_TOTAL.inc(1, type(e).__name__)
+            self.logger.error(f"Frame prediction error: {e}")
+            return self._error_result(e)
+
+    def _score(self, processed_img, timer, deadline=None):
+        """Infer and format one preprocessed image (near-duplicate reuse first, when enabled)."""
+        # A retake or re-encode of a recent photo reuses that photo's result
+        if self._near_duplicates is not None:
+            context = self.result_context()
+            image_hash = self._near_duplicates.hash(processed_img)
+            reused, _ = self._near_duplicates.lookup(image_hash, context)
+            timer.mark('near_duplicate')
+            if reused is not None:
+                result = dict(reused, cached="near_duplicate")
+                timer.observe()
+                result["timings"] = timer.stages
+                return result
+
+        # Step 3 + 4: Infer (batched with concurrent requests when enabled) and extract probabilities
+        if self._scheduler is not None:
+            preds, meta = self._scheduler.predict(processed_img, deadline=deadline)
+        else:
+            check_deadline(deadline)
+            preds, meta = self._infer_batch(processed_img)
+        timer.mark('inference')
+
+        # Step 5: Format result
+        result = self._format_result(preds[0], meta[0])
+        if self._near_duplicates is not None and not result["mocked"]:
+            self._near_duplicates.add(image_hash, dict(result), context)
+        timer.mark('format')
+        timer.observe()
+        result["timings"] = timer.stages
+        return result
+
+    def predict_batch(self, images, deadline=None):
+        """
+        Score several images with batched forward passes.
+
+        Returns one result dict per input, in order, in the same format as predict();
+        an image that fails to decode gets its own error result without failing the rest.
+        """
+        results = [None] * len(images)
+        timer = StageTimer()
+        try:
+            # Step 1 + 2: Validate and preprocess in parallel
+            batch, indices, errors = self.preprocess_images(images)
+            timer.mark('batch_preprocess')
+            for i, error in errors.items():
+                results[i] = self._error_result(error)
+            if errors:
+                ERRORS_TOTAL.inc(len(errors), 'ValueError')
+            if batch is None:
+                return results
+
+            # Step 3 + 4: Infer in chunks of at most the scheduler's batch size
+            chunk = self._scheduler.max_batch_size if self._scheduler is not None else len(indices)
+            if self._scheduler is not None:
+                futures = [self._scheduler.submit(batch[start:start + chunk], deadline=deadline)
+                           for start in range(0, len(indices), chunk)]
+                pending = [f.result(timeout=remaining_time(deadline)) for f in futures]
+                preds = np.concatenate([p for p, _ in pending], axis=0)
+                meta = [m for _, rows in pending for m in rows]
             else:
-                preds = self._output_processor.extract_probabilities(raw_output)
-
-            # Step 5: Format result
-            result = {
-                "success": True,
-                "predictions": {self.class_names[i]: float(p) for i, p in enumerate(preds)},
-                "top_prediction": self.class_names[np.argmax(preds)],
-                "confidence": float(np.max(preds))
-            }
-            return result
+                check_deadline(deadline)
+                preds, meta = self._infer_batch(batch)
+            timer.mark('batch_inference')
+
+            # Step 5: Format results
+            for row, i in enumerate(indices):
+                results[i] = self._format_result(preds[row], meta[row])
+            timer.mark('batch_format')
+            timer.observe()
+            return results
 
+        except FutureTimeoutError:
+            raise DeadlineExceededError("Request deadline exceeded waiting for inference")
+        except AdmissionError:
+            raise
         except Exception as e:
-            self.logger.error(f"Prediction error: {e}", exc_info=True)
-            return {
-                "success": False,
-                "error": str(e),
-                "message": "Error analyzing image. Please try again."
-            }
\ No newline at end of file
+            ERRORS_TOTAL.inc(1, type(e).__name__)
+            self.logger.error(f"Batch prediction error: {e}", exc_info=True)
+            return [r if r is not None else self._error_result(e) for r in results]
\ No newline at end of file
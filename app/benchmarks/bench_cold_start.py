@@ -0,0 +1,140 @@
+"""Cold start: time to import the app and time to the first prediction, each in a fresh interpreter.
+
+Every run starts a new Python process, the way a serverless instance starts.
+Each run reports:
+
+- how long ``import app.main`` takes, and whether TensorFlow was imported by it;
+- how long the first ``POST /predict`` takes: app startup, service construction,
+  model load and preprocessing;
+- the peak RSS.
+
+Network access is blocked in the child. Any attempt, such as a weights download
+during loading, is counted in ``network_attempts``.
+
+Usage:
+    python -m app.benchmarks.bench_cold_start --scenarios tflite mock --repeats 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCENARIOS = {
+    "tf": {"SKINSCREEN_MODEL_BACKEND": "tf"},
+    "tflite": {"SKINSCREEN_MODEL_BACKEND": "tflite"},
+    "mock": {"SKINSCREEN_MOCK_MODEL": "1"},
+}
+
+
+def _block_network(attempts):
+    import socket
+
+    def refuse(*args, **kwargs):
+        attempts.append(repr(args[1:2] or args[:1]))
+        raise OSError("network access blocked by bench_cold_start")
+
+    socket.socket.connect = refuse
+    socket.socket.connect_ex = refuse
+    socket.getaddrinfo = refuse
+    socket.create_connection = refuse
+
+
+def child(image_path):
+    """Runs in the fresh process: import, first prediction, report JSON on stdout."""
+    attempts = []
+    _block_network(attempts)
+
+    start = time.perf_counter()
+    from app.main import app
+    import_s = time.perf_counter() - start
+    tf_at_import = 'tensorflow' in sys.modules
+    modules_at_import = len(sys.modules)
+
+    from fastapi.testclient import TestClient
+    from app.main import get_prediction_service
+
+    with open(image_path, 'rb') as f:
+        image = f.read()
+    start = time.perf_counter()
+    with TestClient(app) as client:
+        response = client.post('/predict', files={'file': ('cold.jpg', image, 'image/jpeg')})
+        first_request_s = time.perf_counter() - start
+        state = get_prediction_service().model_status()["state"]
+
+    from app.benchmarks.common import peak_rss_kb
+    print(json.dumps({
+        "import_s": import_s,
+        "first_request_s": first_request_s,
+        "time_to_first_prediction_s": import_s + first_request_s,
+        "status_code": response.status_code,
+        "model_state": state,
+        "tensorflow_imported_at_import": tf_at_import,
+        "tensorflow_imported_at_prediction": 'tensorflow' in sys.modules,
+        "modules_at_import": modules_at_import,
+        "network_attempts": len(attempts),
+        "peak_rss_mb": peak_rss_kb() / 1024.0,
+    }))
+
+
+def run_once(scenario, image_path, eager_load=False):
+    env = dict(os.environ, **SCENARIOS[scenario], SKINSCREEN_EAGER_LOAD='1' if eager_load else '0',
+               TF_CPP_MIN_LOG_LEVEL='3')
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-m', 'app.benchmarks.bench_cold_start', '--child', image_path],
+                          env=env, capture_output=True, text=True, timeout=600)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"{scenario} run failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["process_wall_s"] = wall
+    return result
+
+
+def run(scenarios, repeats=3, eager_load=False):
+    from app.benchmarks.common import synthetic_jpeg
+
+    with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as f:
+        f.write(synthetic_jpeg(1280, 960))
+    try:
+        report = {"repeats": repeats, "eager_load": eager_load, "scenarios": {}}
+        for scenario in scenarios:
+            runs = [run_once(scenario, f.name, eager_load) for _ in range(repeats)]
+            summary = {key: statistics.median(r[key] for r in runs)
+                       for key in ("import_s", "first_request_s", "time_to_first_prediction_s",
+                                   "process_wall_s", "peak_rss_mb")}
+            summary.update({key: runs[-1][key] for key in ("status_code", "model_state",
+                                                          "tensorflow_imported_at_import",
+                                                          "tensorflow_imported_at_prediction",
+                                                          "modules_at_import")})
+            summary["network_attempts"] = max(r["network_attempts"] for r in runs)
+            report["scenarios"][scenario] = summary
+        return report
+    finally:
+        os.unlink(f.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', nargs='*', default=['tflite', 'mock'], choices=sorted(SCENARIOS))
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--eager-load', action='store_true', help='Keep SKINSCREEN_EAGER_LOAD on in the child')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help='Write the JSON results here as well')
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+    report = run(args.scenarios, args.repeats, args.eager_load)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Decode time and peak memory per image: legacy triple-open pipeline vs single draft-mode decode.
+
+Usage:
+    python -m app.benchmarks.bench_decode [--width 4000 --height 3000 --repeats 20]
+"""
+import argparse
+import json
+import multiprocessing
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from app.api.image_processor import decode_image, validate_image
+from app.benchmarks.common import peak_rss_kb, reset_peak_rss, synthetic_jpeg
+
+
+def legacy_decode(image_data):
+    """The pipeline before single-decode: validate twice, then a full-resolution decode + resize."""
+    validate_image(image_data)
+    validate_image(image_data)
+    img = Image.open(BytesIO(image_data)).convert('RGB').resize((224, 224))
+    return np.asarray(img, dtype=np.uint8)
+
+
+def draft_decode(image_data, out=np.empty((224, 224, 3), dtype=np.uint8)):
+    return decode_image(image_data, out=out)
+
+
+VARIANTS = {'legacy': legacy_decode, 'draft': draft_decode}
+
+
+def _run_variant(name, image_data, repeats, queue):
+    # Runs in a fresh process so the peak RSS reflects this variant only
+    fn = VARIANTS[name]
+    fn(image_data)  # warm-up: import codecs, allocate buffers
+    reset_peak_rss()
+    baseline = peak_rss_kb()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(image_data)
+        timings.append(time.perf_counter() - start)
+    queue.put({
+        "variant": name,
+        "mean_ms": 1000 * float(np.mean(timings)),
+        "p50_ms": 1000 * float(np.percentile(timings, 50)),
+        "p95_ms": 1000 * float(np.percentile(timings, 95)),
+        "peak_rss_delta_mb": max(0, peak_rss_kb() - baseline) / 1024.0,
+        "peak_rss_mb": peak_rss_kb() / 1024.0,
+    })
+
+
+def run(width=4000, height=3000, repeats=20):
+    image_data = synthetic_jpeg(width, height)
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for name in VARIANTS:
+        queue = ctx.Queue()
+        proc = ctx.Process(target=_run_variant, args=(name, image_data, repeats, queue))
+        proc.start()
+        results.append(queue.get())
+        proc.join()
+    return {"image": {"width": width, "height": height, "bytes": len(image_data)}, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run(args.width, args.height, args.repeats), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Forward-pass latency: keras model.predict / signature calls vs the compiled fixed-signature path.
+
+Usage:
+    python -m app.benchmarks.bench_inference [--model saved_model/third] [--random-weights] [--xla]
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from app.api.model_loader import TF_AVAILABLE, build_model, load_model, read_architecture
+from app.api.services import ModelWrapper
+
+
+def make_wrapper(model, compiled, jit_compile=False):
+    wrapper = ModelWrapper('<in-process>', compiled=compiled, jit_compile=jit_compile)
+    wrapper.attach(model)
+    return wrapper
+
+
+def time_wrapper(wrapper, batch_size, iterations, input_shape=(224, 224, 3), warmup=3):
+    batch = np.random.default_rng(0).uniform(0, 255, (batch_size,) + tuple(input_shape)).astype(np.float32)
+    for _ in range(warmup):
+        wrapper.predict(batch)
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        output = wrapper.predict(batch)
+        # Force materialization so lazy tensors are timed too
+        if isinstance(output, dict):
+            [np.asarray(v) for v in output.values()]
+        else:
+            np.asarray(output)
+        timings.append(time.perf_counter() - start)
+    timings = np.asarray(timings)
+    return {
+        "batch_size": batch_size,
+        "mean_ms": 1000 * float(timings.mean()),
+        "p50_ms": 1000 * float(np.percentile(timings, 50)),
+        "p95_ms": 1000 * float(np.percentile(timings, 95)),
+        "images_per_s": batch_size / float(timings.mean()),
+    }
+
+
+def run(model_path='saved_model/third', random_weights=False, batch_sizes=(1, 2, 4, 8), iterations=30, xla=False):
+    if random_weights:
+        model = build_model(read_architecture(model_path), weights=None)
+    else:
+        model = load_model(model_path)
+
+    variants = {"legacy": make_wrapper(model, compiled=False), "compiled": make_wrapper(model, compiled=True)}
+    if xla:
+        variants["compiled_xla"] = make_wrapper(model, compiled=True, jit_compile=True)
+
+    results = {name: [time_wrapper(wrapper, size, iterations) for size in batch_sizes]
+               for name, wrapper in variants.items()}
+    return {"model": model_path, "random_weights": random_weights, "cpu_count": os.cpu_count(), "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--model', default='saved_model/third')
+    parser.add_argument('--random-weights', action='store_true',
+                        help='Build the architecture from model_architecture.json without loading weights')
+    parser.add_argument('--batch-sizes', type=int, nargs='*', default=[1, 2, 4, 8])
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--xla', action='store_true', help='Also time the XLA-compiled path')
+    parser.add_argument('--output', help='Write the JSON results here as well')
+    args = parser.parse_args()
+
+    if not TF_AVAILABLE:
+        raise SystemExit("TensorFlow is required for this benchmark")
+    report = run(args.model, args.random_weights, args.batch_sizes, args.iterations, args.xla)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
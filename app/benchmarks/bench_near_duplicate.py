@@ -0,0 +1,134 @@
+"""Near-duplicate reuse: hit rate per hash and threshold, and lookup cost against index size.
+
+Hit rate: every source photo is turned into variants like the ones a retake
+produces (re-encoded, cropped, downscaled, brighter, shifted framing). Each
+variant goes through the service's decode and normalization, then is hashed.
+``recall`` is the share of variants within the threshold of their own photo.
+``false_match_rate`` is the share of photos within the threshold of some
+*other* photo, i.e. how often a different image would get a wrong result.
+
+Lookup cost: the index is filled with random hashes, then timed lookups
+report p50/p95/p99 per index size. The time to hash one decoded image is
+reported separately.
+
+Usage:
+    python -m app.benchmarks.bench_near_duplicate [--image-dir photos/ --sizes 1024 16384 65536]
+"""
+import argparse
+import json
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from app.api.image_processor import preprocess_image
+from app.api.near_duplicate import HASHES, NearDuplicateIndex, hamming
+from app.benchmarks.common import percentiles, synthetic_jpeg
+
+
+def _jpeg(image, quality=90):
+    buf = BytesIO()
+    image.save(buf, 'JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def _crop(image, left, top, right, bottom):
+    width, height = image.size
+    return image.crop((int(width * left), int(height * top), int(width * (1 - right)), int(height * (1 - bottom))))
+
+
+VARIANTS = {
+    "reencode_q70": lambda image: _jpeg(image, quality=70),
+    "crop_3pct": lambda image: _jpeg(_crop(image, 0.03, 0.03, 0.03, 0.03)),
+    "downscale_50pct": lambda image: _jpeg(image.resize((image.width // 2, image.height // 2))),
+    "brightness_10pct": lambda image: _jpeg(ImageEnhance.Brightness(image).enhance(1.1)),
+    "reframe_5pct": lambda image: _jpeg(_crop(image, 0.05, 0.0, 0.0, 0.05)),
+}
+
+
+def load_sources(image_dir=None, count=64):
+    """Encoded photos from ``image_dir`` (searched recursively), or ``count`` synthetic ones."""
+    if not image_dir:
+        return [synthetic_jpeg(1280, 960, seed=i) for i in range(count)]
+    paths = sorted(os.path.join(root, name) for root, _, names in os.walk(image_dir) for name in names
+                   if name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')))[:count]
+    sources = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            sources.append(f.read())
+    return sources
+
+
+def hit_rates(sources, thresholds, mode='efficientnet', size=(224, 224)):
+    decode = lambda data: preprocess_image(data, preprocess_mode=mode, size=size)
+    originals = [decode(data) for data in sources]
+    variants = {name: [decode(make(Image.open(BytesIO(data)).convert('RGB'))) for data in sources]
+                for name, make in VARIANTS.items()}
+
+    report = {}
+    for hash_name, hash_fn in HASHES.items():
+        hash_fn(originals[0])
+        start = time.perf_counter()
+        hashes = np.array([hash_fn(pixels) for pixels in originals], dtype=np.uint64)
+        hash_ms = (time.perf_counter() - start) * 1000.0 / len(originals)
+        # Distance from each photo to its closest other photo
+        nearest_other = np.array([np.delete(hamming(hashes, h), i).min() if len(hashes) > 1 else 64
+                                  for i, h in enumerate(hashes)])
+        own = {name: np.array([int(hamming(hashes[i:i + 1], hash_fn(pixels))[0]) for i, pixels in enumerate(images)])
+               for name, images in variants.items()}
+        report[hash_name] = {
+            "hash_ms": hash_ms,
+            "thresholds": [{
+                "max_distance": t,
+                "recall": {name: float(np.mean(d <= t)) for name, d in own.items()},
+                "mean_recall": float(np.mean([np.mean(d <= t) for d in own.values()])),
+                "false_match_rate": float(np.mean(nearest_other <= t)),
+            } for t in thresholds],
+        }
+    return report
+
+
+def lookup_cost(sizes, repeats=200, seed=0):
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in sizes:
+        index = NearDuplicateIndex(max_entries=size, max_distance=4, ttl=3600.0)
+        for value in rng.integers(0, 2 ** 63, size=size, dtype=np.uint64):
+            index.add(int(value), {}, context='bench')
+        queries = rng.integers(0, 2 ** 63, size=repeats, dtype=np.uint64)
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            index.lookup(int(query), context='bench')
+            timings.append(time.perf_counter() - start)
+        results.append({"entries": size, **percentiles(timings)})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--image-dir', help='Real photos to use instead of synthetic ones')
+    parser.add_argument('--count', type=int, default=64, help='Number of source photos')
+    parser.add_argument('--thresholds', type=int, nargs='*', default=[2, 4, 6, 8, 10, 12])
+    parser.add_argument('--sizes', type=int, nargs='*', default=[256, 1024, 4096, 16384, 65536])
+    parser.add_argument('--mode', default='efficientnet', help='Preprocess mode the photos are decoded with')
+    parser.add_argument('--output', help='Write the JSON results here as well')
+    args = parser.parse_args()
+
+    sources = load_sources(args.image_dir, args.count)
+    report = {
+        "sources": len(sources),
+        "image_dir": args.image_dir,
+        "hit_rate": hit_rates(sources, args.thresholds, args.mode),
+        "lookup": lookup_cost(args.sizes),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Memory of preload-and-fork workers (serve.py) vs the same number of separately loaded workers.
+
+Starts serve.py once with ``--preload`` and once with ``--no-preload``, waits
+until every worker is ready, and compares the per-worker memory reports: RSS,
+PSS (shared pages charged proportionally) and USS (private memory).
+
+Usage:
+    SKINSCREEN_MODEL_BACKEND=tflite python -m app.benchmarks.bench_prefork --workers 4
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from app.benchmarks.load_test import _free_port
+
+SERVE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'serve.py')
+
+
+def measure(workers, preload, timeout=300.0):
+    """Run serve.py until its first memory report is written; returns the report."""
+    with tempfile.TemporaryDirectory() as tmp:
+        report_path = os.path.join(tmp, 'memory.json')
+        proc = subprocess.Popen([sys.executable, SERVE, '--workers', str(workers), '--port', str(_free_port()),
+                                 '--preload' if preload else '--no-preload', '--memory-report', report_path,
+                                 '--log-level', 'warning'])
+        try:
+            start = time.perf_counter()
+            while not os.path.exists(report_path):
+                if proc.poll() is not None:
+                    raise RuntimeError(f"serve.py exited with status {proc.returncode}")
+                if time.perf_counter() - start > timeout:
+                    raise RuntimeError("Workers did not become ready in time")
+                time.sleep(0.5)
+            time.sleep(0.5)     # let the report file be written completely
+            with open(report_path) as f:
+                report = json.load(f)
+            report["time_to_ready_s"] = time.perf_counter() - start
+            return report
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=60)
+
+
+def _summary(report):
+    workers = [m for m in report["per_worker"].values() if m]
+    return {
+        "time_to_ready_s": report["time_to_ready_s"],
+        "total_pss_mb": report["total_pss_mb"],
+        "mean_worker_rss_mb": sum(m["rss_mb"] for m in workers) / len(workers),
+        "mean_worker_pss_mb": sum(m["pss_mb"] for m in workers) / len(workers),
+        "mean_worker_uss_mb": report["mean_worker_uss_mb"],
+        "parent_pss_mb": (report["parent"] or {}).get("pss_mb"),
+    }
+
+
+def run(workers):
+    preloaded = measure(workers, preload=True)
+    separate = measure(workers, preload=False)
+    return {
+        "workers": workers,
+        "backend": preloaded["backend"],
+        "preload": _summary(preloaded),
+        "separate": _summary(separate),
+        "total_pss_saved_mb": separate["total_pss_mb"] - preloaded["total_pss_mb"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--output', help='Write the JSON results here as well')
+    args = parser.parse_args()
+
+    report = run(args.workers)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Normalization: NumPy in-place path vs tf.keras.applications preprocess_input, time and parity.
+
+For each mode and batch size it reports ms per batch for both paths and the
+largest absolute difference between them. It exits non-zero if any difference
+exceeds ``--atol``. TensorFlow is only needed for the reference side. Without it
+only the NumPy timings are reported.
+
+Usage:
+    python -m app.benchmarks.bench_preprocess [--batch-sizes 1 8 32 --repeats 50]
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from app.api.image_processor import NORMALIZATIONS, apply_preprocess
+from app.api.lazy_import import TF_AVAILABLE, tf
+from app.benchmarks.common import percentiles
+
+
+def tf_preprocess(pixels, mode):
+    """The TensorFlow normalization the service used before the NumPy path."""
+    images = tf.cast(pixels, tf.float32)
+    if mode == 'efficientnet':
+        return tf.keras.applications.efficientnet.preprocess_input(images)
+    if mode == 'resnet_v2':
+        return tf.keras.applications.resnet_v2.preprocess_input(images)
+    return images / 255.0
+
+
+def time_fn(fn, repeats):
+    fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return percentiles(timings)
+
+
+def run(batch_sizes=(1, 8, 32), size=224, repeats=50, atol=1e-6):
+    rng = np.random.default_rng(0)
+    results = []
+    for batch_size in batch_sizes:
+        pixels = rng.integers(0, 256, size=(batch_size, size, size, 3), dtype=np.uint8)
+        out = np.empty(pixels.shape, dtype=np.float32)
+        for mode in NORMALIZATIONS:
+            result = {"mode": mode, "batch_size": batch_size,
+                      "numpy": time_fn(lambda: apply_preprocess(pixels, mode, out=out), repeats)}
+            if TF_AVAILABLE:
+                result["tensorflow"] = time_fn(lambda: np.asarray(tf_preprocess(pixels, mode)), repeats)
+                diff = np.abs(apply_preprocess(pixels, mode) - np.asarray(tf_preprocess(pixels, mode)))
+                result["max_abs_diff"] = float(diff.max())
+                result["match"] = result["max_abs_diff"] <= atol
+            results.append(result)
+    return {"size": size, "atol": atol, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-sizes', type=int, nargs='*', default=[1, 8, 32])
+    parser.add_argument('--size', type=int, default=224)
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--atol', type=float, default=1e-6)
+    args = parser.parse_args()
+    report = run(args.batch_sizes, args.size, args.repeats, args.atol)
+    print(json.dumps(report, indent=2))
+    if not all(r.get("match", True) for r in report["results"]):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
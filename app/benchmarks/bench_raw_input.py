@@ -0,0 +1,108 @@
+"""Input formats: JPEG decode path vs raw pixels (SKPX) and .npy, client and server side.
+
+For each resolution it reports the payload size and three costs per format:
+
+- ``encode``: the client-side cost of producing the body;
+- ``preprocess``: the server-side cost of turning it into the normalized model
+  input (preprocess_image);
+- ``http`` (with ``--http``): a full ``POST /predict`` in-process against the
+  mock model with the cache off. Bodies above the upload limit are skipped.
+
+Raw frames are taken from the decoded JPEG, so every format carries the same
+picture.
+
+Usage:
+    python -m app.benchmarks.bench_raw_input [--resolutions 224x224 1280x960 --repeats 50 --http]
+"""
+import argparse
+import json
+import os
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from app.api.image_processor import encode_raw, preprocess_image
+from app.benchmarks.common import PHONE_RESOLUTIONS, percentiles, synthetic_jpeg
+
+
+def _npy(pixels):
+    buf = BytesIO()
+    np.save(buf, pixels)
+    return buf.getvalue()
+
+
+def _jpeg(pixels, quality=90):
+    buf = BytesIO()
+    Image.fromarray(pixels).save(buf, 'JPEG', quality=quality)
+    return buf.getvalue()
+
+
+ENCODERS = {"jpeg": _jpeg, "raw": encode_raw, "npy": _npy}
+
+
+def time_fn(fn, repeats):
+    fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return percentiles(timings)
+
+
+def _http_client():
+    os.environ.setdefault('SKINSCREEN_MOCK_MODEL', '1')
+    os.environ.setdefault('SKINSCREEN_CACHE_ENABLED', '0')
+    os.environ.setdefault('SKINSCREEN_EAGER_LOAD', '0')
+    from fastapi.testclient import TestClient
+    from app.api import config
+    from app.main import app
+    return TestClient(app), int(config.UPLOAD_MAX_MB * 1024 * 1024)
+
+
+def run(resolutions, repeats=50, mode='efficientnet', http=False):
+    client, max_bytes = _http_client() if http else (None, None)
+    results = []
+    try:
+        if client is not None:
+            client.__enter__()
+        for width, height in resolutions:
+            pixels = np.asarray(Image.open(BytesIO(synthetic_jpeg(width, height))).convert('RGB'))
+            for name, encode in ENCODERS.items():
+                body = encode(pixels)
+                result = {"format": name, "resolution": f"{width}x{height}", "bytes": len(body),
+                          "encode": time_fn(lambda: encode(pixels), repeats),
+                          "preprocess": time_fn(lambda: preprocess_image(body, preprocess_mode=mode), repeats)}
+                if client is not None and len(body) <= max_bytes:
+                    headers = {'content-type': 'image/jpeg' if name == 'jpeg' else 'application/octet-stream'}
+                    result["http"] = time_fn(lambda: client.post('/predict', content=body, headers=headers), repeats)
+                results.append(result)
+    finally:
+        if client is not None:
+            client.__exit__(None, None, None)
+    return {"mode": mode, "repeats": repeats, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--resolutions', nargs='*',
+                        default=['224x224'] + [f'{w}x{h}' for w, h in PHONE_RESOLUTIONS[2:]],
+                        help='WIDTHxHEIGHT of the client-side frames')
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--mode', default='efficientnet')
+    parser.add_argument('--http', action='store_true', help='Also time POST /predict in-process (mock model)')
+    parser.add_argument('--output', help='Write the JSON results here as well')
+    args = parser.parse_args()
+
+    resolutions = [tuple(int(v) for v in r.lower().split('x')) for r in args.resolutions]
+    report = run(resolutions, args.repeats, args.mode, args.http)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
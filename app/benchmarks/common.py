@@ -0,0 +1,54 @@
+"""Helpers shared by the benchmarks: synthetic images and memory measurement."""
+import resource
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+# Typical phone camera output sizes (12 MP, 8 MP, 1080p, 1.2 MP)
+PHONE_RESOLUTIONS = ((4032, 3024), (3264, 2448), (1920, 1080), (1280, 960))
+
+
+def synthetic_jpeg(width, height, seed=0, quality=90):
+    """A reproducible, photo-like JPEG (smooth gradients plus sensor noise)."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        128 + 80 * np.sin(x / (width / 7.0) + seed),
+        128 + 80 * np.cos(y / (height / 5.0) + seed),
+        128 + 60 * np.sin((x + y) / (width / 3.0)),
+    ], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    buf = BytesIO()
+    Image.fromarray(pixels, 'RGB').save(buf, 'JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def peak_rss_kb(pid='self'):
+    """Peak resident set size of a process in KiB (VmHWM on Linux)."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if pid == 'self':
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None
+
+
+def reset_peak_rss(pid='self'):
+    """Reset VmHWM to the current RSS where the kernel allows it (Linux >= 4.0)."""
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def percentiles(values, points=(50, 95, 99)):
+    if not len(values):
+        return {f"p{p}_ms": None for p in points}
+    arr = np.asarray(values) * 1000.0
+    return {f"p{p}_ms": float(np.percentile(arr, p)) for p in points}
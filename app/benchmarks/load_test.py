@@ -0,0 +1,319 @@
+"""End-to-end load test for the /predict API.
+
+Drives ``app.main:app`` in-process (through httpx's ASGI transport), as a local
+uvicorn subprocess, or at an existing URL, with reproducible synthetic phone
+photos. Closed-loop mode keeps ``--concurrency`` requests in flight; open-loop
+mode sends Poisson arrivals at ``--rate`` requests/s regardless of how fast
+the server answers. Reports p50/p95/p99 latency, throughput, error rate and
+the server's peak RSS, and writes everything to a JSON file for comparison.
+
+``--sweep-replicas`` / ``--sweep-intra`` / ``--sweep-inter`` / ``--sweep-affinity``
+run the same load against a fresh uvicorn server for every combination of
+CPU topology settings, skip combinations that need more threads than there
+are CPUs, and recommend the one with the highest throughput (among those
+meeting ``--slo-ms`` at p95, if given).
+
+Usage:
+    python -m app.benchmarks.load_test --target inprocess --mock --concurrency 8 --duration 20
+    python -m app.benchmarks.load_test --target uvicorn --mode open --rate 20 --output results/run.json
+    SKINSCREEN_MODEL_BACKEND=tflite python -m app.benchmarks.load_test --target uvicorn --concurrency 16 \
+        --sweep-replicas 1 2 4 --sweep-intra 1 2 4 --sweep-affinity none auto --slo-ms 500
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from app.benchmarks.common import PHONE_RESOLUTIONS, peak_rss_kb, percentiles, reset_peak_rss, synthetic_jpeg
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - benchmark-only dependency
+    httpx = None
+
+
+def make_images(count, resolutions=PHONE_RESOLUTIONS, seed=0):
+    """``count`` distinct JPEGs cycling through ``resolutions``; identical for the same seed."""
+    return [synthetic_jpeg(*resolutions[i % len(resolutions)], seed=seed + i) for i in range(count)]
+
+
+def unique_payload(image_data, counter):
+    # Decoders ignore bytes after the JPEG end marker, so this defeats the content-hash cache cheaply
+    return image_data + counter.to_bytes(8, 'little')
+
+
+class LoadResult:
+    def __init__(self):
+        self.latencies = []
+        self.statuses = Counter()
+        self.errors = Counter()
+        self.started = None
+        self.finished = None
+
+    def record(self, latency, status=None, error=None):
+        if status is not None:
+            self.statuses[status] += 1
+            if status == 200:
+                self.latencies.append(latency)
+        if error is not None:
+            self.errors[error] += 1
+
+    def summary(self):
+        total = sum(self.statuses.values()) + sum(self.errors.values())
+        ok = self.statuses.get(200, 0)
+        elapsed = (self.finished - self.started) if self.started and self.finished else 0.0
+        return {
+            "requests": total,
+            "ok": ok,
+            "error_rate": ((total - ok) / total) if total else 0.0,
+            "throughput_rps": (ok / elapsed) if elapsed else 0.0,
+            "elapsed_s": elapsed,
+            "latency": {"mean_ms": (1000 * sum(self.latencies) / len(self.latencies)) if self.latencies else None,
+                        **percentiles(self.latencies)},
+            "status_codes": {str(k): v for k, v in sorted(self.statuses.items())},
+            "client_errors": dict(self.errors),
+        }
+
+
+async def _send(client, payload, result, timeout):
+    start = time.perf_counter()
+    try:
+        response = await client.post('/predict', files={'file': ('photo.jpg', payload, 'image/jpeg')},
+                                     timeout=timeout)
+        result.record(time.perf_counter() - start, status=response.status_code)
+    except Exception as e:
+        result.record(time.perf_counter() - start, error=type(e).__name__)
+
+
+async def closed_loop(client, images, concurrency, duration, requests, timeout, unique):
+    """``concurrency`` workers, each sending its next request as soon as the previous one returns."""
+    result = LoadResult()
+    counter = iter(range(10 ** 12))
+    deadline = time.perf_counter() + duration
+    remaining = [requests] if requests else None
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            if remaining is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            i = next(counter)
+            payload = images[i % len(images)]
+            await _send(client, unique_payload(payload, i) if unique else payload, result, timeout)
+
+    result.started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    result.finished = time.perf_counter()
+    return result
+
+
+async def open_loop(client, images, rate, duration, timeout, unique, seed=0):
+    """Poisson arrivals at ``rate`` req/s; latency includes any queueing inside the server."""
+    result = LoadResult()
+    rng = random.Random(seed)
+    tasks = []
+    result.started = time.perf_counter()
+    next_arrival = result.started
+    i = 0
+    while next_arrival < result.started + duration:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        payload = images[i % len(images)]
+        tasks.append(asyncio.create_task(
+            _send(client, unique_payload(payload, i) if unique else payload, result, timeout)))
+        i += 1
+        next_arrival += rng.expovariate(rate)
+    await asyncio.gather(*tasks)
+    result.finished = time.perf_counter()
+    return result
+
+
+async def _wait_ready(client, timeout=300.0):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            if (await client.get('/readyz')).status_code == 200:
+                return time.perf_counter() - start
+        except Exception:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError("Server did not become ready")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _drive(client, args, images):
+    ready_s = await _wait_ready(client)
+    if args.mode == 'closed':
+        result = await closed_loop(client, images, args.concurrency, args.duration, args.requests,
+                                   args.timeout, args.unique)
+    else:
+        result = await open_loop(client, images, args.rate, args.duration, args.timeout, args.unique, args.seed)
+    return ready_s, result
+
+
+def run(args, server_env=None):
+    """One load run; ``server_env`` adds environment variables for the server (uvicorn target)."""
+    if httpx is None:
+        raise SystemExit("httpx is required: pip install -r requirements-bench.txt")
+
+    env = {'SKINSCREEN_READY_WHEN_MOCK': '1', **(server_env or {})}
+    if args.mock:
+        env['SKINSCREEN_MOCK_MODEL'] = '1'
+    images = make_images(args.images, seed=args.seed)
+    limits = httpx.Limits(max_connections=max(args.concurrency, 64))
+
+    server_pid = None
+    proc = None
+    if args.target == 'inprocess':
+        os.environ.update(env)
+        from app.main import app
+
+        async def main():
+            async with app.router.lifespan_context(app):
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url='http://loadtest', limits=limits) as client:
+                    reset_peak_rss()
+                    return await _drive(client, args, images)
+        ready_s, result = asyncio.run(main())
+        peak_kb = peak_rss_kb()
+    else:
+        url = args.url
+        if args.target == 'uvicorn':
+            port = _free_port()
+            url = f'http://127.0.0.1:{port}'
+            proc = subprocess.Popen([sys.executable, '-m', 'uvicorn', args.app, '--host', '127.0.0.1',
+                                     '--port', str(port), '--log-level', 'warning'],
+                                    env={**os.environ, **env})
+            server_pid = proc.pid
+
+        async def main():
+            async with httpx.AsyncClient(base_url=url, limits=limits) as client:
+                return await _drive(client, args, images)
+        try:
+            ready_s, result = asyncio.run(main())
+            peak_kb = peak_rss_kb(server_pid) if server_pid else None
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait(timeout=30)
+
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != 'output'},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count()},
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "time_to_ready_s": ready_s,
+        "server_peak_rss_mb": (peak_kb / 1024.0) if peak_kb else None,
+        **result.summary(),
+    }
+
+
+TOPOLOGY_SETTINGS = (
+    ('sweep_replicas', 'SKINSCREEN_MODEL_REPLICAS'),
+    ('sweep_intra', 'SKINSCREEN_INTRA_OP_THREADS'),
+    ('sweep_inter', 'SKINSCREEN_INTER_OP_THREADS'),
+    ('sweep_affinity', 'SKINSCREEN_CPU_AFFINITY'),
+)
+
+
+def topology_configs(args, cpu_count=None):
+    """Server environments for every combination of the --sweep-* values, and the ones skipped."""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    axes = [(name, getattr(args, attr)) for attr, name in TOPOLOGY_SETTINGS if getattr(args, attr)]
+    configs, skipped = [], []
+    for values in itertools.product(*[values for _, values in axes]):
+        env = {name: str(value) for (name, _), value in zip(axes, values)}
+        replicas = int(env.get('SKINSCREEN_MODEL_REPLICAS', 1))
+        threads = replicas * max(1, int(env.get('SKINSCREEN_INTRA_OP_THREADS', 1)))
+        (skipped if threads > cpu_count else configs).append(env)
+    return configs, skipped
+
+
+def recommend(runs, slo_ms=None):
+    """Highest-throughput error-free run (meeting the p95 SLO, if any); ties go to the lower p95."""
+    candidates = [r for r in runs if r["error_rate"] == 0 and r["latency"]["p95_ms"] is not None]
+    if slo_ms:
+        candidates = [r for r in candidates if r["latency"]["p95_ms"] <= slo_ms]
+    if not candidates:
+        return None
+    best = max(candidates, key=lambda r: (round(r["throughput_rps"], 1), -r["latency"]["p95_ms"]))
+    return {"server_env": best["server_env"], "throughput_rps": best["throughput_rps"],
+            "p95_ms": best["latency"]["p95_ms"], "p99_ms": best["latency"]["p99_ms"]}
+
+
+def sweep(args):
+    if args.target != 'uvicorn':
+        raise SystemExit("Topology sweeps start a server per configuration: use --target uvicorn")
+    configs, skipped = topology_configs(args)
+    runs = []
+    for server_env in configs:
+        print(f"Running {' '.join(f'{k}={v}' for k, v in server_env.items())}", file=sys.stderr)
+        report = run(args, server_env)
+        report["server_env"] = server_env
+        runs.append(report)
+        print(f"  {report['throughput_rps']:.1f} req/s, p95 {report['latency']['p95_ms'] or 0:.0f} ms, "
+              f"errors {report['error_rate']:.1%}", file=sys.stderr)
+    best = recommend(runs, args.slo_ms)
+    if best:
+        print("Recommended: " + ' '.join(f'{k}={v}' for k, v in best["server_env"].items()), file=sys.stderr)
+    else:
+        print("No configuration ran error-free within the SLO", file=sys.stderr)
+    return {"cpu_count": os.cpu_count(), "slo_ms": args.slo_ms, "recommended": best,
+            "skipped": skipped, "runs": runs}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', choices=('inprocess', 'uvicorn', 'url'), default='inprocess')
+    parser.add_argument('--url', default='http://localhost:5000', help='Server URL for --target url')
+    parser.add_argument('--app', default='app.main:app', help='ASGI app for --target uvicorn')
+    parser.add_argument('--mode', choices=('closed', 'open'), default='closed')
+    parser.add_argument('--concurrency', type=int, default=8, help='Closed loop: requests kept in flight')
+    parser.add_argument('--rate', type=float, default=10.0, help='Open loop: mean arrivals per second')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds to generate load for')
+    parser.add_argument('--requests', type=int, default=0, help='Closed loop: stop after this many (0 = no limit)')
+    parser.add_argument('--images', type=int, default=8, help='Distinct synthetic photos to cycle through')
+    parser.add_argument('--unique', action=argparse.BooleanOptionalAction, default=True,
+                        help='Make every payload byte-unique so the prediction cache never hits')
+    parser.add_argument('--mock', action='store_true', help='Serve mock predictions (no model load)')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sweep-replicas', type=int, nargs='*', help='Sweep SKINSCREEN_MODEL_REPLICAS')
+    parser.add_argument('--sweep-intra', type=int, nargs='*', help='Sweep SKINSCREEN_INTRA_OP_THREADS')
+    parser.add_argument('--sweep-inter', type=int, nargs='*', help='Sweep SKINSCREEN_INTER_OP_THREADS')
+    parser.add_argument('--sweep-affinity', nargs='*', help='Sweep SKINSCREEN_CPU_AFFINITY (e.g. none auto)')
+    parser.add_argument('--slo-ms', type=float, help='Sweep: only recommend configurations with p95 below this')
+    parser.add_argument('--output', help='Write the JSON report here')
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if any(getattr(args, attr) for attr, _ in TOPOLOGY_SETTINGS):
+        report = sweep(args)
+    else:
+        report = run(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
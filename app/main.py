@@ -1,14 +1,36 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Header, Depends, Request, Response, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.api import assessment
+from app.api import config
+from app.api import metrics
+from app.api.executor import InferenceExecutor, AdmissionError
+from app.api.ingest import UploadRejected, ingest_form, ingest_image, ingest_request, upload_openapi
+from app.api.image_processor import raw_pixels
+from app.api.live import LiveSession, live_stats
 from app.api.services import PredictionService
-from app.api.models import PredictionResponse
-from typing import List
+from app.api.models import (PredictionResponse, BatchPredictionItem, BatchPredictionResponse,
+                            CombinedPredictionResponse, ModelLoadRequest, AssessmentResponse)
+from app.api.multihead import MultiHeadEngine
+from typing import Optional
+import hmac
 import json
+import threading
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load and warm the model in the background; /readyz flips once it is hot
+    if config.EAGER_LOAD:
+        get_prediction_service().start_background_warmup()
+    yield
+    inference_executor.shutdown()
 
 app = FastAPI(
     title="Skin Lesion Classification API",
     description="API for classifying skin lesion images using deep learning",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS middleware
@@ -33,8 +55,96 @@ app.add_middleware(
     max_age=3600,
 )
 
-# Initialize the prediction service
-prediction_service = PredictionService()
+# Request counts and latency per route for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+# The prediction service and the multi-head engine are built on first use rather than at import,
+# so importing the app (e.g. a serverless cold start) does no model-related work
+_services_lock = threading.Lock()
+_prediction_service = None
+_multi_head_engine = None
+
+
+def get_prediction_service():
+    global _prediction_service
+    if _prediction_service is None:
+        with _services_lock:
+            if _prediction_service is None:
+                _prediction_service = PredictionService(preprocess_mode=config.PREPROCESS_MODE)
+    return _prediction_service
+
+
+def get_multi_head_engine():
+    """Disease + lesion attribute models, loaded on first use of /predict/full."""
+    global _multi_head_engine
+    if _multi_head_engine is None:
+        service = get_prediction_service()
+        with _services_lock:
+            if _multi_head_engine is None:
+                _multi_head_engine = MultiHeadEngine(preprocess_mode=service.preprocess_mode,
+                                                     registry=service.registry)
+    return _multi_head_engine
+
+
+def __getattr__(name):
+    # Keeps `from app.main import prediction_service` working for serve.py and scripts
+    if name == 'prediction_service':
+        return get_prediction_service()
+    if name == 'multi_head_engine':
+        return get_multi_head_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Blocking decode + inference runs here, never on the event loop
+inference_executor = InferenceExecutor(
+    max_workers=config.INFERENCE_WORKERS,
+    max_queue=config.INFERENCE_QUEUE_SIZE,
+    timeout=config.REQUEST_TIMEOUT_S,
+    retry_after=config.RETRY_AFTER_S,
+)
+
+# Scrape-time gauges and counters read from the components that already track them
+metrics.REGISTRY.callback('skinscreen_inflight_requests', 'Requests admitted to the inference executor',
+                          lambda: inference_executor.stats()["in_flight"])
+metrics.REGISTRY.callback('skinscreen_rejected_requests_total', 'Requests shed with 503 by reason',
+                          lambda: {"queue_full": inference_executor.stats()["rejected"],
+                                   "deadline": inference_executor.stats()["expired"]},
+                          metric_type='counter', labelname='reason')
+metrics.REGISTRY.callback('skinscreen_batch_queue_depth', 'Inputs waiting in the micro-batching queue',
+                          lambda: (get_prediction_service().batch_stats() or {}).get("queue_depth"))
+metrics.REGISTRY.callback('skinscreen_batch_dropped_stale_total', 'Inputs dropped because their deadline passed',
+                          lambda: (get_prediction_service().batch_stats() or {}).get("dropped_stale"),
+                          metric_type='counter')
+metrics.REGISTRY.callback('skinscreen_cache_lookups_total', 'Prediction cache lookups by outcome',
+                          lambda: {k: v for k, v in (get_prediction_service().cache_stats() or {}).items()
+                                   if k in ("hits", "misses", "coalesced")} or None,
+                          metric_type='counter', labelname='outcome')
+metrics.REGISTRY.callback('skinscreen_live_connections', 'Open live-camera WebSocket connections',
+                          lambda: live_stats()["connections"])
+metrics.REGISTRY.callback('skinscreen_live_frames_total', 'Live-camera frames by outcome (dropped = replaced by a newer frame)',
+                          lambda: live_stats()["frames"], metric_type='counter', labelname='outcome')
+metrics.REGISTRY.callback('skinscreen_model_ready', 'Whether the active model is loaded and warmed up',
+                          lambda: int(get_prediction_service().is_ready()))
+
+
+def _admission_exception(e: AdmissionError) -> HTTPException:
+    return HTTPException(
+        status_code=e.status_code,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def _upload_exception(e: UploadRejected) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=str(e))
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Model management is disabled unless SKINSCREEN_ADMIN_TOKEN is configured."""
+    if not config.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(x_admin_token or "", config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
 
 @app.get("/")
 async def root():
@@ -44,6 +154,19 @@ async def root():
         "status": "active"
     }
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the model is loaded and warmed up, so traffic can be routed here."""
+    service = get_prediction_service()
+    ready = service.is_ready(allow_mock=config.READY_WHEN_MOCK)
+    body = {"ready": ready, "model": service.model_status()}
+    return JSONResponse(content=body, status_code=200 if ready else 503)
+
 @app.get("/classes")
 async def get_classes():
     try:
@@ -53,23 +176,174 @@ async def get_classes():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/predict", response_model=PredictionResponse)
-async def predict(file: UploadFile = File(...)):
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
-    
+@app.get("/stats")
+async def get_stats():
+    """Runtime statistics, e.g. micro-batching batch sizes."""
+    service = get_prediction_service()
+    return {
+        "batching": service.batch_stats(),
+        "cache": service.cache_stats(),
+        "near_duplicates": service.near_duplicate_stats(),
+        "model": service.model_status(),
+        "executor": inference_executor.stats(),
+        "live": live_stats(),
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics: per-stage latency histograms, request/error counters and queue depths."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/predict", response_model=PredictionResponse, openapi_extra=upload_openapi('file'))
+async def predict(request: Request, response: Response,
+                  x_request_timeout: Optional[float] = Header(None)):
+    # Stream the upload in, rejecting oversized or non-image bodies before they are buffered
     try:
-        # Read the file
-        contents = await file.read()
-        
-        # Get predictions
-        predictions = prediction_service.predict(contents)
+        upload = await ingest_image(request)
+    except UploadRejected as e:
+        raise _upload_exception(e)
+
+    try:
+        # Get predictions (off the event loop, bounded by the request deadline)
+        predictions = await inference_executor.run(
+            get_prediction_service().predict, upload.data, timeout=x_request_timeout,
+            content_hash=upload.content_hash,
+        )
+        timings = predictions.pop("timings", None)
+        if timings:
+            response.headers["Server-Timing"] = metrics.server_timing(timings)
         
         return PredictionResponse(**predictions)
     
+    except AdmissionError as e:
+        raise _admission_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.websocket("/ws/predict")
+async def live_predict(websocket: WebSocket):
+    """Live camera: encoded frames in as binary messages, compact scores out (see app/api/live.py)."""
+    await LiveSession(websocket, get_prediction_service(), inference_executor).run()
+
+@app.post("/predict/batch", response_model=BatchPredictionResponse,
+          openapi_extra=upload_openapi('files', many=True))
+async def predict_batch(request: Request,
+                        x_request_timeout: Optional[float] = Header(None)):
+    # Rejected files (not an image, too large, ...) are reported per item instead of failing the batch
+    try:
+        uploads = await ingest_request(request, field='files', max_files=config.BATCH_UPLOAD_MAX_FILES,
+                                       fail_fast=False)
+    except UploadRejected as e:
+        raise _upload_exception(e)
+
+    # A raw pixel or .npy file may stack several images; each gets its own result, in order
+    entries = []
+    for upload in uploads:
+        if upload.image is not None and upload.image.count > 1:
+            entries.extend((upload.filename, pixels, None) for pixels in raw_pixels(upload.image.data))
+        else:
+            entries.append((upload.filename, upload.image.data if upload.image is not None else None, upload.error))
+
+    try:
+        results = await inference_executor.run(
+            get_prediction_service().predict_batch,
+            [data for _, data, error in entries if error is None],
+            timeout=x_request_timeout,
+        )
+    except AdmissionError as e:
+        raise _admission_exception(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    items = []
+    scored = iter(results)
+    for i, (filename, _, error) in enumerate(entries):
+        if error is not None:
+            items.append(BatchPredictionItem(index=i, filename=filename, error=error))
+            continue
+        result = next(scored)
+        if result.get("success"):
+            items.append(BatchPredictionItem(index=i, filename=filename,
+                                             prediction=PredictionResponse(**result)))
+        else:
+            items.append(BatchPredictionItem(index=i, filename=filename, error=result.get("error")))
+    return BatchPredictionResponse(results=items)
+
+@app.post("/predict/full", response_model=CombinedPredictionResponse, openapi_extra=upload_openapi('file'))
+async def predict_full(request: Request,
+                       x_request_timeout: Optional[float] = Header(None)):
+    """Disease prediction plus lesion form, surface and colour attributes in one call."""
+    try:
+        upload = await ingest_image(request)
+    except UploadRejected as e:
+        raise _upload_exception(e)
+
+    try:
+        results = await inference_executor.run(
+            get_multi_head_engine().predict, upload.data, timeout=x_request_timeout
+        )
+        disease = results.pop("disease")
+        return CombinedPredictionResponse(
+            disease=PredictionResponse(**disease),
+            attributes={name: PredictionResponse(**r) for name, r in results.items()},
+        )
+    except AdmissionError as e:
+        raise _admission_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/assess", response_model=AssessmentResponse, response_model_exclude_none=True,
+          openapi_extra=upload_openapi('file', text_fields={
+              "answers": 'Questionnaire answers as JSON, e.g. {"1": "Yes", "4": "Not at all"}',
+              "category": "Question set the answers belong to (default: the one the top prediction selects)",
+          }))
+async def assess(request: Request, response: Response,
+                 x_request_timeout: Optional[float] = Header(None)):
+    """Image prediction and questionnaire scoring in one call, with the condition details the results page shows."""
+    try:
+        upload, fields = await ingest_form(request, text_fields=('answers', 'category'))
+    except UploadRejected as e:
+        raise _upload_exception(e)
+    try:
+        answers = assessment.parse_answers(fields.get('answers'))
+        category = assessment.parse_category(fields.get('category'))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    try:
+        predictions = await inference_executor.run(
+            get_prediction_service().predict, upload.data, timeout=x_request_timeout,
+            content_hash=upload.content_hash,
+        )
+        timings = predictions.pop("timings", None)
+        if timings:
+            response.headers["Server-Timing"] = metrics.server_timing(timings)
+        return assessment.assess(predictions, answers, category)
+    except AdmissionError as e:
+        raise _admission_exception(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/models", dependencies=[Depends(require_admin)])
+async def list_models():
+    """Registered model versions, which one is active, residency and memory use."""
+    return get_prediction_service().registry_status()
+
+@app.post("/models/{name}/versions", status_code=202, dependencies=[Depends(require_admin)])
+async def load_model_version(name: str, request: ModelLoadRequest):
+    """Load a model version in the background; with activate=true it is swapped in once warm."""
+    version, _ = get_prediction_service().registry.load(name, request.path, version=request.version,
+                                                  activate=request.activate)
+    return {"name": name, "version": version, "status": "loading"}
+
+@app.post("/models/{name}/versions/{version}/activate", dependencies=[Depends(require_admin)])
+async def activate_model_version(name: str, version: str):
+    try:
+        get_prediction_service().registry.activate(name, version)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"name": name, "version": version, "status": "active"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,232 @@
+"""Score large image archives offline and write one JSON line per image.
+
+Paths are streamed from the given folders (or from stdin with ``-``), decoded
+and resized in a process pool, normalized and scored in batches, and written
+to the output as they complete, in input order. At most ``--prefetch``
+batches are in flight, so memory stays flat however large the archive is.
+
+Because the output is always a prefix of the input order, ``--resume`` only
+needs to count the lines already written and skip that many paths (falling
+back to matching paths when the folder changed since the last run).
+
+Usage:
+    python -m app.tools.bulk_score app/datasets/data/wbssData_prototype/train --output scores.jsonl
+    python -m app.tools.bulk_score archive/ --output scores.jsonl --resume --workers 8 --batch-size 64
+    find archive -name '*.jpg' | python -m app.tools.bulk_score - --output scores.jsonl
+"""
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.api.cache import model_fingerprint
+from app.api.image_processor import apply_preprocess, decode_image
+from app.api.model_loader import architecture_input_shape
+from app.api.services import ModelWrapper, OutputProcessor, format_prediction
+from app.tools.common import IMAGE_EXTENSIONS, chunked, iter_image_files, model_class_names, read_bytes
+
+logger = logging.getLogger(__name__)
+
+
+def iter_inputs(inputs):
+    """Yield image paths from folders, single files, or stdin (``-``), without listing everything first."""
+    for source in inputs:
+        if source == '-':
+            for line in sys.stdin:
+                if line.strip():
+                    yield line.strip()
+        elif os.path.isdir(source):
+            yield from iter_image_files(source)
+        elif source.lower().endswith(IMAGE_EXTENSIONS):
+            yield source
+        else:
+            logger.warning(f"Skipping {source}: not a folder or image file")
+
+
+def decode_chunk(paths, size=(224, 224)):
+    """Process-pool task: decode ``paths`` into a uint8 (n, H, W, 3) array; returns (pixels, {row: error})."""
+    pixels = np.empty((len(paths), size[1], size[0], 3), dtype=np.uint8)
+    errors = {}
+    for i, path in enumerate(paths):
+        try:
+            decode_image(read_bytes(path), size=size, out=pixels[i])
+        except Exception as e:
+            errors[i] = str(e)
+    return pixels, errors
+
+
+def _warm_worker(_):
+    return os.getpid()
+
+
+# RESUME - Skip what a previous run already wrote
+
+def completed_prefix(output_path):
+    """Count complete lines in ``output_path`` (dropping a partial last line); returns (count, last path)."""
+    if not os.path.exists(output_path):
+        return 0, None
+    count, last_path, good_bytes = 0, None, 0
+    with open(output_path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                last_path = json.loads(line)["path"]
+            except (ValueError, KeyError):
+                break
+            count += 1
+            good_bytes += len(line)
+    if good_bytes != os.path.getsize(output_path):
+        logger.warning(f"Truncating an incomplete record at the end of {output_path}")
+        with open(output_path, 'r+b') as f:
+            f.truncate(good_bytes)
+    return count, last_path
+
+
+def _completed_paths(output_path):
+    with open(output_path) as f:
+        return {json.loads(line)["path"] for line in f}
+
+
+def skip_completed(paths, output_path):
+    """Drop the paths a previous run already scored from the ``paths`` iterator."""
+    count, last_path = completed_prefix(output_path)
+    if not count:
+        return paths, 0
+    skipped = list(itertools.islice(paths, count - 1))
+    boundary = next(paths, None)
+    if boundary == last_path:
+        return paths, count
+    # The input changed since the last run: fall back to matching paths
+    logger.warning("Input order differs from the previous run; matching already scored paths instead")
+    done = _completed_paths(output_path)
+    rest = itertools.chain(skipped, [boundary] if boundary is not None else [], paths)
+    return (p for p in rest if p not in done), count
+
+
+# SCORING PIPELINE
+
+class Progress:
+    def __init__(self, already_done=0, interval=2.0):
+        self.done = 0
+        self.errors = 0
+        self.already_done = already_done
+        self.interval = interval
+        self.start = time.perf_counter()
+        self._last = 0.0
+
+    def update(self, done, errors, force=False):
+        self.done += done
+        self.errors += errors
+        now = time.perf_counter()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed else 0.0
+        line = (f"{self.already_done + self.done} scored ({self.done} this run, {self.errors} errors) "
+                f"{rate:.1f} images/s, {elapsed:.0f}s elapsed")
+        if sys.stderr.isatty():
+            print(f"\r{line}", end='' if not force else '\n', file=sys.stderr, flush=True)
+        else:
+            print(line, file=sys.stderr, flush=True)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        return {"scored": self.done, "errors": self.errors, "skipped_resumed": self.already_done,
+                "elapsed_s": elapsed, "images_per_s": self.done / elapsed if elapsed else 0.0}
+
+
+def score_archive(inputs, output_path, model_path='saved_model/third', backend='tf', variant='float16',
+                  preprocess_mode='efficientnet', batch_size=32, workers=None, prefetch=None, resume=False):
+    workers = workers or os.cpu_count() or 1
+    prefetch = prefetch or 2 * workers
+    class_names = model_class_names(model_path)
+    version = model_fingerprint(model_path)[:8]
+    height, width, _ = architecture_input_shape(model_path)
+
+    paths = iter(iter_inputs(inputs))
+    already_done = 0
+    if resume:
+        paths, already_done = skip_completed(paths, output_path)
+        logger.info(f"Resuming after {already_done} already scored images")
+
+    # Fork the decode workers before the model runs anything: TensorFlow is not fork-safe once used
+    context = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        list(pool.map(_warm_worker, range(workers)))
+
+        model = ModelWrapper(model_path, backend=backend, tflite_variant=variant)
+        if not model.load():
+            raise SystemExit(f"Could not load {model_path}: {model.load_error}")
+
+        progress = Progress(already_done)
+        pending = deque()
+        chunks = chunked(paths, batch_size)
+        with open(output_path, 'a' if resume else 'w') as out:
+            while True:
+                while len(pending) < prefetch:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    pending.append((chunk, pool.submit(decode_chunk, chunk, (width, height))))
+                if not pending:
+                    break
+
+                chunk, future = pending.popleft()
+                pixels, errors = future.result()
+                ok = [i for i in range(len(chunk)) if i not in errors]
+                probs = None
+                if ok:
+                    batch = apply_preprocess(pixels if not errors else pixels[ok], preprocess_mode)
+                    probs = OutputProcessor.extract_batch_probabilities(model.predict(batch))
+                rows = iter(range(len(ok)))
+                for i, path in enumerate(chunk):
+                    if i in errors:
+                        record = {"path": path, "error": errors[i]}
+                    else:
+                        result = format_prediction(class_names, probs[next(rows)])
+                        record = {"path": path, "top_prediction": result["top_prediction"],
+                                  "confidence": result["confidence"], "predictions": result["predictions"],
+                                  "model_version": version}
+                    out.write(json.dumps(record) + '\n')
+                out.flush()
+                progress.update(len(chunk) - len(errors), len(errors))
+        progress.update(0, 0, force=True)
+    return progress.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help='Folders or image files to score; "-" reads paths from stdin')
+    parser.add_argument('--output', required=True, help='JSONL file to write (appended to with --resume)')
+    parser.add_argument('--resume', action='store_true', help='Skip images already in --output')
+    parser.add_argument('--model', default='saved_model/third')
+    parser.add_argument('--backend', default='tf', choices=('tf', 'tflite'))
+    parser.add_argument('--variant', default='float16', help='TFLite variant for --backend tflite')
+    parser.add_argument('--preprocess-mode', default='efficientnet')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=None, help='Decode processes (default: CPU count)')
+    parser.add_argument('--prefetch', type=int, default=None,
+                        help='Batches decoded ahead of the model (default: 2 x workers); bounds memory')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if os.path.exists(args.output) and os.path.getsize(args.output) and not args.resume:
+        raise SystemExit(f"{args.output} already exists; pass --resume to continue it or remove it first")
+
+    summary = score_archive(args.inputs, args.output, args.model, args.backend, args.variant,
+                            args.preprocess_mode, args.batch_size, args.workers, args.prefetch, args.resume)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
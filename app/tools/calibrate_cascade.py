@@ -0,0 +1,189 @@
+"""Pick the cascade confidence threshold from a labelled image folder.
+
+Scores every image with the cheap first stage and the full model, then finds
+the lowest threshold (so the most images are answered by the cheap stage) at
+which the cascade's accuracy stays within ``--max-accuracy-loss`` of the full
+model. The loss is bounded with a one-sided ``--confidence`` upper bound on
+the paired per-image difference, so a small folder does not produce an
+overly optimistic threshold. Also reports how often the cheap stage answers
+and the expected per-image latency at each threshold.
+
+The folder layout is ``<data-dir>/<class name>/<image>``.
+
+Usage:
+    python -m app.tools.calibrate_cascade --data-dir path/to/labelled/images --max-accuracy-loss 0.01
+"""
+import argparse
+import json
+import logging
+import math
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+from app.api.image_processor import preprocess_images
+from app.api.model_loader import architecture_input_shape
+from app.api.services import ModelWrapper, OutputProcessor
+from app.tools.common import chunked, load_labelled_folder, model_class_names, read_bytes
+
+logger = logging.getLogger(__name__)
+
+
+def _timed_probs(wrapper, batch):
+    start = time.perf_counter()
+    probs = OutputProcessor.extract_batch_probabilities(wrapper.predict(batch))
+    return probs, time.perf_counter() - start
+
+
+def score(fast, full, samples, preprocess_mode, batch_size=16, size=(224, 224)):
+    """Probabilities of both stages on the same images; returns (fast, full, labels, seconds per image each)."""
+    fast_out, full_out, labels = [], [], []
+    fast_seconds = full_seconds = 0.0
+    for chunk in chunked(samples, batch_size):
+        batch, indices, errors = preprocess_images([read_bytes(path) for path, _ in chunk], preprocess_mode, size)
+        for i, error in errors.items():
+            logger.warning(f"Skipping {chunk[i][0]}: {error}")
+        if batch is None:
+            continue
+        probs, seconds = _timed_probs(fast, batch)
+        fast_out.append(probs)
+        fast_seconds += seconds
+        probs, seconds = _timed_probs(full, batch)
+        full_out.append(probs)
+        full_seconds += seconds
+        labels.extend(chunk[i][1] for i in indices)
+    n = len(labels)
+    if not n:
+        raise SystemExit("No usable images found")
+    return (np.concatenate(fast_out), np.concatenate(full_out), np.asarray(labels),
+            fast_seconds / n, full_seconds / n)
+
+
+def sweep(fast_probs, full_probs, labels, confidence=0.95):
+    """Accuracy of the cascade at every distinct threshold, with an upper confidence bound on the loss.
+
+    Returns a list of dicts sorted by increasing threshold.
+    """
+    n = len(labels)
+    z = NormalDist().inv_cdf(confidence)
+    conf = fast_probs.max(axis=1)
+    fast_correct = (fast_probs.argmax(axis=1) == labels).astype(np.float64)
+    full_correct = (full_probs.argmax(axis=1) == labels).astype(np.float64)
+    full_accuracy = float(full_correct.mean())
+
+    # Accepting the k most confident images changes the outcome of exactly those images
+    order = np.argsort(-conf, kind='stable')
+    diff = (full_correct - fast_correct)[order]
+    loss_sum = np.concatenate([[0.0], np.cumsum(diff)])
+    loss_sq = np.concatenate([[0.0], np.cumsum(diff ** 2)])
+    sorted_conf = conf[order]
+
+    rows = []
+    # Candidate thresholds: each distinct confidence (accept everything at or above it) plus "never"
+    boundaries = [k for k in range(1, n + 1) if k == n or sorted_conf[k] < sorted_conf[k - 1]]
+    for k in [0] + boundaries:
+        loss = loss_sum[k] / n
+        variance = max(loss_sq[k] / n - loss ** 2, 0.0)
+        stderr = np.sqrt(variance / (n - 1)) if n > 1 else 0.0
+        rows.append({
+            "threshold": float(sorted_conf[k - 1]) if k else float('inf'),
+            "fast_fraction": k / n,
+            "accuracy": float(full_accuracy - loss),
+            "accuracy_loss": float(loss),
+            "accuracy_loss_upper": float(loss + z * stderr),
+        })
+    return sorted(rows, key=lambda r: r["threshold"]), full_accuracy, float(fast_correct.mean())
+
+
+def choose_threshold(rows, max_accuracy_loss):
+    """Lowest threshold whose loss upper bound is within the budget (None if only "never" qualifies)."""
+    for row in rows:
+        if row["accuracy_loss_upper"] <= max_accuracy_loss and row["threshold"] != float('inf'):
+            return row
+    return None
+
+
+def calibrate(data_dir, model_path='saved_model/third', fast_model_path=None, fast_backend='tflite',
+              fast_variant='int8', preprocess_mode='efficientnet', max_accuracy_loss=0.01, confidence=0.95,
+              batch_size=16, backend='tf', variant='float16'):
+    class_names = model_class_names(model_path)
+    samples = load_labelled_folder(data_dir, class_names)
+    if not samples:
+        raise SystemExit(f"No images under {data_dir} matched the classes {class_names}")
+
+    full = ModelWrapper(model_path, backend=backend, tflite_variant=variant)
+    fast = ModelWrapper(fast_model_path or model_path, backend=fast_backend, tflite_variant=fast_variant)
+    for name, wrapper in (("full", full), ("fast", fast)):
+        if not wrapper.load():
+            raise SystemExit(f"Could not load the {name} model: {wrapper.load_error}")
+        wrapper.warmup((batch_size,))
+
+    height, width, _ = architecture_input_shape(model_path)
+    fast_probs, full_probs, labels, fast_s, full_s = score(fast, full, samples, preprocess_mode, batch_size,
+                                                           (width, height))
+    rows, full_accuracy, fast_accuracy = sweep(fast_probs, full_probs, labels, confidence)
+    chosen = choose_threshold(rows, max_accuracy_loss)
+    for row in rows:
+        row["expected_ms_per_image"] = 1000 * (fast_s + (1 - row["fast_fraction"]) * full_s)
+
+    return {
+        "data_dir": data_dir,
+        "samples": int(len(labels)),
+        "model": {"path": model_path, "backend": backend, "variant": variant},
+        "fast_model": {"path": fast_model_path or model_path, "backend": fast_backend, "variant": fast_variant},
+        "max_accuracy_loss": max_accuracy_loss,
+        "confidence": confidence,
+        "full_accuracy": full_accuracy,
+        "fast_accuracy": fast_accuracy,
+        "full_ms_per_image": 1000 * full_s,
+        "fast_ms_per_image": 1000 * fast_s,
+        "recommended": chosen,
+        "curve": [r for r in rows if r["threshold"] != float('inf')],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', required=True, help='Labelled folder: <data-dir>/<class name>/<image>')
+    parser.add_argument('--model', default='saved_model/third')
+    parser.add_argument('--backend', default='tf', choices=('tf', 'tflite'), help='Backend of the full model')
+    parser.add_argument('--variant', default='float16', help='TFLite variant of the full model')
+    parser.add_argument('--fast-model', help='First-stage model directory (default: --model)')
+    parser.add_argument('--fast-backend', default='tflite', choices=('tf', 'tflite'))
+    parser.add_argument('--fast-variant', default='int8', help='TFLite variant of the first stage')
+    parser.add_argument('--preprocess-mode', default='efficientnet')
+    parser.add_argument('--max-accuracy-loss', type=float, default=0.01,
+                        help='Largest acceptable top-1 accuracy drop vs the full model (absolute, e.g. 0.01)')
+    parser.add_argument('--confidence', type=float, default=0.95,
+                        help='Confidence level of the upper bound on the accuracy loss')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--output', help='Write the JSON report here as well')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = calibrate(args.data_dir, args.model, args.fast_model, args.fast_backend, args.fast_variant,
+                       args.preprocess_mode, args.max_accuracy_loss, args.confidence, args.batch_size,
+                       args.backend, args.variant)
+
+    print(f"\n{report['samples']} images: full model accuracy {report['full_accuracy']:.3f} "
+          f"({report['full_ms_per_image']:.1f} ms/image), first stage {report['fast_accuracy']:.3f} "
+          f"({report['fast_ms_per_image']:.1f} ms/image)")
+    chosen = report["recommended"]
+    if chosen is None:
+        print(f"No threshold keeps the accuracy loss within {args.max_accuracy_loss} "
+              f"at {args.confidence:.0%} confidence; leave the cascade disabled")
+    else:
+        print(f"Threshold {chosen['threshold']:.4f}: first stage answers {chosen['fast_fraction']:.1%}, "
+              f"accuracy {chosen['accuracy']:.3f} (loss {chosen['accuracy_loss']:.4f}, "
+              f"upper bound {chosen['accuracy_loss_upper']:.4f}), ~{chosen['expected_ms_per_image']:.1f} ms/image")
+        # Rounded up so the configured threshold never admits images the calibration did not
+        print(f"\n    SKINSCREEN_CASCADE_ENABLED=1 "
+              f"SKINSCREEN_CASCADE_THRESHOLD={math.ceil(chosen['threshold'] * 1e4) / 1e4:.4f}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Helpers shared by the command-line tools: image folders, labels and batching."""
+import os
+
+from app.api.class_loader import load_class_names
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.gif', '.tif', '.tiff')
+
+
+def iter_image_files(root):
+    """Yield image file paths under ``root`` in a stable order, without listing the whole tree up front."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield entry.path
+        stack.extend(reversed(subdirs))
+
+
+def model_class_names(model_path):
+    return load_class_names(os.path.join(model_path, 'class_indices.json'),
+                            os.path.join(model_path, 'labels.txt'))
+
+
+def _normalize_label(name):
+    # Dataset folders are often named like "1. Eczema 1677"; compare on letters only
+    return ''.join(ch for ch in name.lower() if ch.isalpha())
+
+
+def load_labelled_folder(root, class_names):
+    """List ``(path, class_index)`` for a ``root/<class>/<image>`` tree.
+
+    Folder names are matched to ``class_names`` case-insensitively, ignoring
+    digits and punctuation; folders that match no class are skipped.
+    """
+    by_label = {_normalize_label(name): i for i, name in enumerate(class_names)}
+    samples = []
+    for entry in sorted(os.scandir(root), key=lambda e: e.name):
+        if not entry.is_dir():
+            continue
+        label = by_label.get(_normalize_label(entry.name))
+        if label is None:
+            continue
+        samples.extend((path, label) for path in iter_image_files(entry.path))
+    return samples
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def chunked(items, size):
+    """Split any iterable into lists of at most ``size`` items."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
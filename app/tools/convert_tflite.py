@@ -0,0 +1,176 @@
+"""Convert the models under saved_model/ to quantized TFLite variants and report parity.
+
+For each model directory this writes ``model_float16.tflite``,
+``model_dynamic.tflite`` (dynamic-range weights) and ``model_int8.tflite``
+(integer weights and activations, calibrated on a small image set) next to the
+original model, plus ``tflite_parity.json`` comparing every variant with the
+original on the parity images: top-1 agreement overall and per class, and the
+maximum absolute probability delta per class in labels.txt.
+
+Usage:
+    python -m app.tools.convert_tflite --calibration-dir path/to/images [--models saved_model/third ...]
+"""
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+
+from app.api.image_processor import apply_preprocess, preprocess_images
+from app.api.model_loader import TF_AVAILABLE, TFLITE_VARIANTS, TFLiteModel, load_model, tflite_model_path, tf
+from app.api.services import OutputProcessor
+from app.tools.common import chunked, iter_image_files, model_class_names, read_bytes
+
+logger = logging.getLogger(__name__)
+
+
+def discover_models(root='saved_model'):
+    """Model directories under ``root`` that have a model_architecture.json."""
+    return sorted(os.path.join(root, name) for name in os.listdir(root)
+                  if os.path.exists(os.path.join(root, name, 'model_architecture.json')))
+
+
+def load_images(image_dir, limit, preprocess_mode, seed=0, batch_size=16):
+    """Preprocessed float32 batch of up to ``limit`` images; synthetic noise images if no folder is given."""
+    if image_dir:
+        paths = []
+        for path in iter_image_files(image_dir):
+            paths.append(path)
+            if len(paths) >= limit:
+                break
+        batches = []
+        for chunk in chunked(paths, batch_size):
+            batch, _, errors = preprocess_images([read_bytes(p) for p in chunk], preprocess_mode)
+            for i, error in errors.items():
+                logger.warning(f"Skipping {chunk[i]}: {error}")
+            if batch is not None:
+                batches.append(np.asarray(batch, dtype=np.float32))
+        if batches:
+            return np.concatenate(batches, axis=0)
+        logger.warning(f"No usable images under {image_dir}; falling back to synthetic inputs")
+
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, size=(limit, 224, 224, 3), dtype=np.uint8)
+    return np.asarray(apply_preprocess(pixels, preprocess_mode), dtype=np.float32)
+
+
+def _converter(model, model_path):
+    if isinstance(model, tf.keras.Model):
+        return tf.lite.TFLiteConverter.from_keras_model(model)
+    return tf.lite.TFLiteConverter.from_saved_model(model_path)
+
+
+def convert(model, model_path, variant, calibration):
+    converter = _converter(model, model_path)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == 'int8':
+        def representative_dataset():
+            for i in range(len(calibration)):
+                yield [calibration[i:i + 1]]
+        converter.representative_dataset = representative_dataset
+        # Float input/output keep the serving path unchanged; ops without int8 kernels stay float
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+    elif variant != 'dynamic':
+        raise ValueError(f"Unknown TFLite variant: {variant}")
+    return converter.convert()
+
+
+def _predict_reference(model, batch, batch_size=16):
+    outputs = []
+    for start in range(0, len(batch), batch_size):
+        chunk = batch[start:start + batch_size]
+        raw = model.predict(chunk, verbose=0) if isinstance(model, tf.keras.Model) else model(tf.constant(chunk))
+        outputs.append(OutputProcessor.extract_batch_probabilities(raw))
+    return np.concatenate(outputs, axis=0)
+
+
+def _predict_tflite(model, batch, batch_size=16):
+    return np.concatenate([model(batch[start:start + batch_size]) for start in range(0, len(batch), batch_size)])
+
+
+def parity_report(reference, candidate, class_names):
+    """Top-1 agreement and max probability delta, overall and per class."""
+    ref_top = reference.argmax(axis=1)
+    cand_top = candidate.argmax(axis=1)
+    delta = np.abs(reference - candidate)
+    per_class = {}
+    for i, name in enumerate(class_names):
+        rows = ref_top == i
+        per_class[name] = {
+            "samples": int(rows.sum()),
+            "top1_agreement": float((cand_top[rows] == i).mean()) if rows.any() else None,
+            "max_prob_delta": float(delta[:, i].max()),
+        }
+    return {
+        "samples": int(len(reference)),
+        "top1_agreement": float((ref_top == cand_top).mean()),
+        "max_prob_delta": float(delta.max()),
+        "per_class": per_class,
+    }
+
+
+def convert_model(model_path, variants, calibration, parity_inputs, num_threads=None):
+    class_names = model_class_names(model_path)
+    model = load_model(model_path)
+    reference = _predict_reference(model, parity_inputs)
+
+    report = {"model": model_path, "variants": {}}
+    for variant in variants:
+        out_path = tflite_model_path(model_path, variant)
+        with open(out_path, 'wb') as f:
+            f.write(convert(model, model_path, variant, calibration))
+        candidate = _predict_tflite(TFLiteModel(out_path, num_threads=num_threads), parity_inputs)
+        report["variants"][variant] = {
+            "path": out_path,
+            "size_mb": os.path.getsize(out_path) / (1024 * 1024),
+            **parity_report(reference, candidate, class_names),
+        }
+        logger.info(f"{out_path}: top-1 agreement {report['variants'][variant]['top1_agreement']:.3f}")
+
+    with open(os.path.join(model_path, 'tflite_parity.json'), 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def print_report(report):
+    print(f"\n{report['model']}")
+    for variant, result in report["variants"].items():
+        print(f"  {variant:8s} {result['size_mb']:7.2f} MB  top-1 agreement {result['top1_agreement']:.3f}  "
+              f"max |Δp| {result['max_prob_delta']:.4f}")
+        for name, cls in result["per_class"].items():
+            agreement = '   n/a' if cls["top1_agreement"] is None else f"{cls['top1_agreement']:.3f}"
+            print(f"      {name:28s} n={cls['samples']:<5d} agreement {agreement}  max |Δp| {cls['max_prob_delta']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--models', nargs='*', help='Model directories (default: every model under saved_model/)')
+    parser.add_argument('--variants', nargs='*', default=list(TFLITE_VARIANTS), choices=TFLITE_VARIANTS)
+    parser.add_argument('--calibration-dir', help='Images used to calibrate int8 activation ranges')
+    parser.add_argument('--calibration-size', type=int, default=100)
+    parser.add_argument('--parity-dir', help='Images used for the parity report (default: calibration images)')
+    parser.add_argument('--parity-size', type=int, default=200)
+    parser.add_argument('--preprocess-mode', default='efficientnet')
+    parser.add_argument('--threads', type=int, default=None, help='TFLite interpreter threads for the parity run')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not TF_AVAILABLE:
+        raise SystemExit("TensorFlow is required to convert models")
+
+    calibration = load_images(args.calibration_dir, args.calibration_size, args.preprocess_mode)
+    parity_inputs = (load_images(args.parity_dir, args.parity_size, args.preprocess_mode, seed=1)
+                     if args.parity_dir else calibration)
+
+    for model_path in args.models or discover_models():
+        try:
+            print_report(convert_model(model_path, args.variants, calibration, parity_inputs, args.threads))
+        except Exception as e:
+            logger.error(f"Conversion failed for {model_path}: {e}", exc_info=True)
+
+
+if __name__ == '__main__':
+    main()
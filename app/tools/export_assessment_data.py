@@ -0,0 +1,108 @@
+"""Export the frontend's questionnaire scoring tables to JSON for the /assess endpoint.
+
+The frontend keeps the source of truth: question lists per category
+(src/pages/selfAssessmentQuestions.js), disease attributes and weights
+(src/pages/ConditionAttr.jsx), display thresholds (src/utils/resultPageConfig.js)
+and condition descriptions (src/data/conditions.js). This tool reads the
+object literals out of those files and writes app/api/assessment_data.json.
+Rerun it whenever the frontend tables change.
+
+Usage:
+    python -m app.tools.export_assessment_data [--src src --output app/api/assessment_data.json]
+"""
+import argparse
+import json
+import os
+import re
+
+from app.api.assessment import DATA_PATH
+
+# (JSON key, source file, variable name)
+SOURCES = (
+    ('category_keywords', 'pages/selfAssessmentQuestions.js', 'categories'),
+    ('questions', 'pages/selfAssessmentQuestions.js', 'CATEGORY_QUESTIONS'),
+    ('diseases', 'pages/ConditionAttr.jsx', 'DISEASES'),
+    ('display_thresholds', 'utils/resultPageConfig.js', 'DISPLAY_THRESHOLDS'),
+    ('conditions', 'data/conditions.js', 'CONDITION_DESCRIPTIONS'),
+)
+
+_TOKEN = re.compile(r'''
+    (?P<space>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+  | (?P<number>-?\d+(?:\.\d+)?)
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<punct>[{}\[\]:,])
+''', re.VERBOSE | re.DOTALL)
+
+
+def _tokens(text, start):
+    """Tokens of the balanced object literal starting at ``text[start]``."""
+    depth, pos = 0, start
+    while True:
+        match = _TOKEN.match(text, pos)
+        if match is None:
+            raise ValueError(f"Unexpected input at offset {pos}: {text[pos:pos + 40]!r}")
+        pos = match.end()
+        kind, value = match.lastgroup, match.group()
+        if kind == 'space':
+            continue
+        yield kind, value
+        if value in '{[':
+            depth += 1
+        elif value in '}]':
+            depth -= 1
+            if depth == 0:
+                return
+
+
+def _json_string(literal):
+    if literal[0] == "'":
+        literal = '"' + literal[1:-1].replace('\\\'', '\'').replace('"', '\\"') + '"'
+    return literal
+
+
+def js_literal_to_python(text, name):
+    """Parse the object or array literal assigned to ``name`` in ``text``."""
+    match = re.search(rf'\b{re.escape(name)}\s*=\s*([{{\[])', text)
+    if match is None:
+        raise ValueError(f"No literal assigned to {name}")
+    parts = []
+    for kind, value in _tokens(text, match.start(1)):
+        if value in '}]' and parts and parts[-1] == ',':
+            parts.pop()  # trailing comma
+        if kind == 'string':
+            parts.append(_json_string(value))
+        elif kind == 'name':
+            parts.append(json.dumps(value) if value not in ('true', 'false', 'null') else value)
+        else:
+            parts.append(value)
+    return json.loads(''.join(parts))
+
+
+def export(src_dir='src'):
+    data = {}
+    for key, relpath, name in SOURCES:
+        with open(os.path.join(src_dir, relpath), encoding='utf-8') as f:
+            data[key] = js_literal_to_python(f.read(), name)
+    # Scoring only needs each question's id and position; the texts stay in the frontend
+    data['questions'] = {category: [q['id'] for q in questions]
+                         for category, questions in data['questions'].items()}
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--src', default='src', help='Frontend source directory')
+    parser.add_argument('--output', default=DATA_PATH)
+    args = parser.parse_args()
+
+    data = export(args.src)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, ensure_ascii=False)
+        f.write('\n')
+    print(f"Wrote {args.output}: {len(data['questions'])} question sets, "
+          f"{sum(len(d) for d in data['diseases'].values())} diseases, {len(data['conditions'])} conditions")
+
+
+if __name__ == '__main__':
+    main()
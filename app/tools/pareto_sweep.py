@@ -0,0 +1,296 @@
+"""Sweep serving configurations over a labelled folder and report the accuracy/latency/memory Pareto front.
+
+Every combination of preprocessing mode, input resolution, precision and batch
+size is scored on the same images. Each configuration row gets top-1 accuracy
+(with a confusion matrix over the model's classes), latency per image and per
+batch, and memory. Rows that no other row beats on all three objectives form
+the Pareto front. The report ends with a recommendation: the fastest front
+row whose accuracy is within ``--max-accuracy-loss`` of the best one.
+
+Precision ``float32`` is the TensorFlow model. ``float16``, ``dynamic`` and
+``int8`` are the TFLite variants written by ``app.tools.convert_tflite``.
+Resolutions other than the one in model_architecture.json reuse the trained
+weights at the new input size. The EfficientNet backbone is fully
+convolutional, so only the Keras model and TFLite graphs that allow resizing
+can be swept this way; other combinations are reported as skipped.
+
+Each (precision, resolution) pair runs in a fresh process, so its memory figures
+are not inflated by the models loaded before it.
+
+Usage:
+    python -m app.tools.pareto_sweep --data-dir path/to/labelled/images
+    python -m app.tools.pareto_sweep --data-dir path/to/labelled/images --precisions float32 float16 int8 \\
+        --resolutions 192 224 260 --batch-sizes 1 8 32 --output pareto.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.api.image_processor import apply_preprocess, decode_image
+from app.api.model_loader import TFLITE_VARIANTS, architecture_input_shape, build_model, load_model, read_architecture
+from app.api.services import ModelWrapper, OutputProcessor
+from app.benchmarks.common import peak_rss_kb, reset_peak_rss
+from app.tools.common import load_labelled_folder, model_class_names, read_bytes
+
+logger = logging.getLogger(__name__)
+
+PREPROCESS_MODES = ('efficientnet', 'resnet_v2', 'scale01')
+PRECISIONS = ('float32',) + TFLITE_VARIANTS
+
+
+def current_rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+# MODEL PER CONFIGURATION
+
+def make_wrapper(model_path, precision, resolution, random_weights=False, num_threads=None):
+    """A loaded ModelWrapper serving ``model_path`` at ``precision`` and ``resolution`` (square)."""
+    native = architecture_input_shape(model_path)[0]
+    if precision != 'float32':
+        wrapper = ModelWrapper(model_path, backend='tflite', tflite_variant=precision, num_threads=num_threads)
+        if not wrapper.load():
+            raise RuntimeError(wrapper.load_error)
+        return wrapper
+
+    arch = read_architecture(model_path)
+    if random_weights:
+        model = build_model(dict(arch, input_shape=[resolution, resolution, 3]), weights=None)
+    else:
+        model = load_model(model_path)
+        if resolution != native:
+            if not arch or not hasattr(model, 'get_weights'):
+                raise RuntimeError("Changing the resolution needs a Keras model and model_architecture.json")
+            resized = build_model(dict(arch, input_shape=[resolution, resolution, 3]), weights=None)
+            resized.set_weights(model.get_weights())
+            model = resized
+    wrapper = ModelWrapper(model_path)
+    wrapper.attach(model)
+    return wrapper
+
+
+def _forward(wrapper, batch):
+    return OutputProcessor.extract_batch_probabilities(wrapper.predict(batch))
+
+
+def evaluate(model_path, precision, resolution, samples, num_classes, preprocess_modes, batch_sizes,
+             iterations=20, random_weights=False, num_threads=None):
+    """Score one (precision, resolution) pair for every preprocessing mode and batch size.
+
+    Runs in its own process; memory is reported relative to the process after the
+    images were decoded, so it covers the model and its activations only.
+    """
+    size = (resolution, resolution)
+    start = time.perf_counter()
+    pixels = np.empty((len(samples), resolution, resolution, 3), dtype=np.uint8)
+    kept, labels = [], []
+    for path, label in samples:
+        try:
+            decode_image(read_bytes(path), size=size, out=pixels[len(kept)])
+        except ValueError as e:
+            logger.warning(f"Skipping {path}: {e}")
+            continue
+        kept.append(path)
+        labels.append(label)
+    if not kept:
+        raise RuntimeError("No usable images")
+    pixels = pixels[:len(kept)]
+    labels = np.asarray(labels)
+    decode_ms = 1000 * (time.perf_counter() - start) / len(kept)
+
+    baseline_mb = current_rss_mb()
+    wrapper = make_wrapper(model_path, precision, resolution, random_weights, num_threads)
+    _forward(wrapper, apply_preprocess(pixels[:1], preprocess_modes[0]))
+    model_mb = current_rss_mb() - baseline_mb
+
+    accuracy = {}
+    for mode in preprocess_modes:
+        start = time.perf_counter()
+        batches = [apply_preprocess(pixels[i:i + 32], mode) for i in range(0, len(pixels), 32)]
+        preprocess_ms = 1000 * (time.perf_counter() - start) / len(pixels)
+        predicted = np.concatenate([_forward(wrapper, batch) for batch in batches]).argmax(axis=1)
+        confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        np.add.at(confusion, (labels, predicted), 1)
+        accuracy[mode] = {
+            "accuracy": float((predicted == labels).mean()),
+            "preprocess_ms_per_image": preprocess_ms,
+            "confusion_matrix": confusion.tolist(),
+        }
+
+    # Forward-pass cost does not depend on the normalization, so time one mode per batch size.
+    # Ascending sizes keep the peak RSS after each run attributable to that size.
+    latency = {}
+    for batch_size in sorted(batch_sizes):
+        reps = np.resize(np.arange(len(pixels)), batch_size)
+        batch = apply_preprocess(pixels[reps], preprocess_modes[0])
+        for _ in range(3):
+            _forward(wrapper, batch)
+        reset_peak_rss()
+        timings = []
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            _forward(wrapper, batch)
+            timings.append(time.perf_counter() - t0)
+        timings = np.asarray(timings) * 1000
+        latency[batch_size] = {
+            "batch_p50_ms": float(np.percentile(timings, 50)),
+            "batch_p95_ms": float(np.percentile(timings, 95)),
+            "inference_ms_per_image": float(timings.mean()) / batch_size,
+            "peak_mb": max(peak_rss_kb() / 1024.0 - baseline_mb, model_mb),
+        }
+
+    return {"samples": len(kept), "decode_ms_per_image": decode_ms, "model_mb": model_mb,
+            "accuracy": accuracy, "latency": latency}
+
+
+# PARETO FRONT
+
+OBJECTIVES = (("accuracy", max), ("ms_per_image", min), ("peak_mb", min))
+
+
+def dominates(a, b):
+    better_or_equal = all((a[k] >= b[k]) if best is max else (a[k] <= b[k]) for k, best in OBJECTIVES)
+    return better_or_equal and any(a[k] != b[k] for k, _ in OBJECTIVES)
+
+
+def pareto_front(rows):
+    """Mark every row that no other row dominates with ``pareto: True``."""
+    for row in rows:
+        row["pareto"] = not any(dominates(other, row) for other in rows if other is not row)
+    return [row for row in rows if row["pareto"]]
+
+
+def recommend(front, max_accuracy_loss):
+    if not front:
+        return None
+    best = max(row["accuracy"] for row in front)
+    eligible = [row for row in front if row["accuracy"] >= best - max_accuracy_loss]
+    return min(eligible, key=lambda row: (row["ms_per_image"], row["peak_mb"]))
+
+
+def sweep(data_dir, model_path='saved_model/third', preprocess_modes=PREPROCESS_MODES, resolutions=None,
+          precisions=('float32', 'float16', 'int8'), batch_sizes=(1, 8, 32), limit=500, iterations=20,
+          max_accuracy_loss=0.01, random_weights=False, num_threads=None, seed=0):
+    class_names = model_class_names(model_path)
+    samples = load_labelled_folder(data_dir, class_names)
+    if not samples:
+        raise SystemExit(f"No images under {data_dir} matched the classes {class_names}")
+    if limit and len(samples) > limit:
+        samples = random.Random(seed).sample(samples, limit)
+    resolutions = resolutions or [architecture_input_shape(model_path)[0]]
+
+    rows, confusion, skipped = [], {}, []
+    context = multiprocessing.get_context('spawn')
+    for precision in precisions:
+        for resolution in resolutions:
+            name = f"{precision}@{resolution}"
+            logger.info(f"Evaluating {name} on {len(samples)} images")
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(evaluate, model_path, precision, resolution, samples, len(class_names),
+                                         list(preprocess_modes), list(batch_sizes), iterations, random_weights,
+                                         num_threads).result()
+            except Exception as e:
+                logger.warning(f"Skipping {name}: {e}")
+                skipped.append({"precision": precision, "resolution": resolution, "reason": str(e)})
+                continue
+            for mode, acc in result["accuracy"].items():
+                confusion[f"{mode}/{name}"] = acc["confusion_matrix"]
+                for batch_size, lat in result["latency"].items():
+                    rows.append({
+                        "preprocess_mode": mode,
+                        "resolution": resolution,
+                        "precision": precision,
+                        "batch_size": batch_size,
+                        "accuracy": acc["accuracy"],
+                        # End to end per image: decode + normalize + its share of the batched forward pass
+                        "ms_per_image": result["decode_ms_per_image"] + acc["preprocess_ms_per_image"]
+                        + lat["inference_ms_per_image"],
+                        "batch_p50_ms": lat["batch_p50_ms"],
+                        "batch_p95_ms": lat["batch_p95_ms"],
+                        "model_mb": result["model_mb"],
+                        "peak_mb": lat["peak_mb"],
+                        "samples": result["samples"],
+                    })
+
+    front = sorted(pareto_front(rows), key=lambda row: row["ms_per_image"])
+    return {
+        "data_dir": data_dir,
+        "model": model_path,
+        "classes": class_names,
+        "random_weights": random_weights,
+        "objectives": {k: "max" if best is max else "min" for k, best in OBJECTIVES},
+        "max_accuracy_loss": max_accuracy_loss,
+        "recommended": recommend(front, max_accuracy_loss),
+        "pareto_front": front,
+        "rows": rows,
+        "confusion_matrices": confusion,
+        "skipped": skipped,
+    }
+
+
+def print_report(report):
+    header = f"{'':2}{'mode':<13}{'res':>5}{'precision':>10}{'batch':>6}{'acc':>7}{'ms/img':>8}{'p95 ms':>8}{'MB':>7}"
+    print(header)
+    for row in sorted(report["rows"], key=lambda r: r["ms_per_image"]):
+        print(f"{'*' if row['pareto'] else '':2}{row['preprocess_mode']:<13}{row['resolution']:>5}"
+              f"{row['precision']:>10}{row['batch_size']:>6}{row['accuracy']:>7.3f}{row['ms_per_image']:>8.2f}"
+              f"{row['batch_p95_ms']:>8.1f}{row['peak_mb']:>7.0f}")
+    for skip in report["skipped"]:
+        print(f"  skipped {skip['precision']}@{skip['resolution']}: {skip['reason']}")
+    print("\n* = Pareto front (accuracy vs ms/image vs peak MB)")
+
+    chosen = report["recommended"]
+    if chosen is None:
+        return
+    print(f"\nRecommended: {chosen['preprocess_mode']} at {chosen['resolution']}px, {chosen['precision']}, "
+          f"batch {chosen['batch_size']} (accuracy {chosen['accuracy']:.3f}, {chosen['ms_per_image']:.2f} ms/image)")
+    backend = ("SKINSCREEN_MODEL_BACKEND=tf" if chosen["precision"] == 'float32'
+               else f"SKINSCREEN_MODEL_BACKEND=tflite SKINSCREEN_TFLITE_VARIANT={chosen['precision']}")
+    print(f"\n    {backend} SKINSCREEN_PREPROCESS_MODE={chosen['preprocess_mode']} "
+          f"SKINSCREEN_BATCH_MAX_SIZE={chosen['batch_size']}")
+    if chosen["resolution"] != architecture_input_shape(report["model"])[0]:
+        print(f"    (serving at {chosen['resolution']}px needs the model exported with that input_shape)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', required=True, help='Labelled folder: <data-dir>/<class name>/<image>')
+    parser.add_argument('--model', default='saved_model/third')
+    parser.add_argument('--preprocess-modes', nargs='*', default=list(PREPROCESS_MODES), choices=PREPROCESS_MODES)
+    parser.add_argument('--resolutions', type=int, nargs='*',
+                        help='Square input sizes (default: the one in model_architecture.json)')
+    parser.add_argument('--precisions', nargs='*', default=['float32', 'float16', 'int8'], choices=PRECISIONS)
+    parser.add_argument('--batch-sizes', type=int, nargs='*', default=[1, 8, 32])
+    parser.add_argument('--limit', type=int, default=500, help='Random subset of at most this many images (0 = all)')
+    parser.add_argument('--iterations', type=int, default=20, help='Timed forward passes per batch size')
+    parser.add_argument('--max-accuracy-loss', type=float, default=0.01,
+                        help='Accuracy the recommendation may give up against the best front row (absolute)')
+    parser.add_argument('--threads', type=int, default=None, help='TFLite interpreter threads')
+    parser.add_argument('--random-weights', action='store_true',
+                        help='Build float32 models from model_architecture.json without loading weights')
+    parser.add_argument('--output', help='Write the JSON report here as well')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = sweep(args.data_dir, args.model, args.preprocess_modes, args.resolutions, args.precisions,
+                   args.batch_sizes, args.limit, args.iterations, args.max_accuracy_loss, args.random_weights,
+                   args.threads)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
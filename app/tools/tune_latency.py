@@ -0,0 +1,335 @@
+"""Latency-aware multi-objective tuning on top of the existing Optuna accuracy study.
+
+The shipped study (``optuna_optuna_efficientnet_b0_dataset.db``) optimized
+validation accuracy only. This tool writes a second study with three
+objectives: validation accuracy (maximize), p95 CPU latency of one image on
+the serving path in ModelWrapper (minimize), and model size (minimize).
+
+- Import: every completed trial of the accuracy study is copied over with its
+  architecture's measured latency and size. Its accuracy is already known, so
+  the Pareto front is usable straight away.
+- Candidates: the latency and size of every backbone x input size x head size
+  combination in the search space are measured and checked against
+  ``--slo-ms``, without training anything.
+- Search (``--n-trials`` with ``--train module:function``): NSGA-II proposes
+  new architectures. Candidates over the latency SLO are pruned before the
+  expensive training call. Accepted ones are trained by the given function,
+  which takes the architecture dict (model_architecture.json format) and the
+  trial and returns the validation accuracy.
+
+Latency does not depend on the weights, so models are built from the
+architecture with random weights. Measurements are cached per architecture.
+Trials record whether they meet the SLO in force when they were added, so use
+a new ``--study-name`` when the SLO changes. Needs ``pip install -r requirements-bench.txt``.
+
+Usage:
+    python -m app.tools.tune_latency --slo-ms 40
+    python -m app.tools.tune_latency --slo-ms 40 --backbones EfficientNetB0 EfficientNetB1 --input-sizes 160 192 224
+    python -m app.tools.tune_latency --slo-ms 40 --n-trials 20 --train my_training:train_and_evaluate
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import tempfile
+
+try:
+    import optuna
+    from optuna.distributions import CategoricalDistribution
+except ImportError:
+    optuna = None
+
+# Optuna >= 5 records constraints on the trial itself; older versions take a sampler callback
+TRIAL_CONSTRAINTS = optuna is not None and hasattr(optuna.trial.Trial, 'set_constraint')
+
+from app.api.model_loader import TF_AVAILABLE, build_model, read_architecture
+from app.api.services import ModelWrapper
+from app.benchmarks.bench_inference import time_wrapper
+
+logger = logging.getLogger(__name__)
+
+SOURCE_STORAGE = 'sqlite:///optuna_optuna_efficientnet_b0_dataset.db'
+# Kept apart from the shipped study so running the tool does not rewrite it
+TARGET_STORAGE = 'sqlite:///optuna_latency.db'
+METRIC_NAMES = ('val_accuracy', 'latency_p95_ms', 'size_mb')
+DIRECTIONS = ('maximize', 'minimize', 'minimize')
+
+
+# MEASUREMENT - Serving latency and size of one architecture
+
+class LatencyMeter:
+    """Builds architectures and times batch-1 inference through ModelWrapper, caching per architecture."""
+
+    def __init__(self, backend='tf', variant='float16', iterations=30, num_threads=None):
+        self.backend = backend
+        self.variant = variant
+        self.iterations = iterations
+        self.num_threads = num_threads
+        self._cache = {}
+
+    def measure(self, arch_info):
+        key = (arch_info.get('model_type'), tuple(arch_info['input_shape']), arch_info.get('dense_units'),
+               arch_info.get('num_classes'))
+        if key not in self._cache:
+            self._cache[key] = self._measure(arch_info)
+        return self._cache[key]
+
+    def _measure(self, arch_info):
+        model = build_model(arch_info, weights=None)
+        input_shape = tuple(arch_info['input_shape'])
+        if self.backend == 'tflite':
+            from app.tools.convert_tflite import convert, load_images
+
+            calibration = load_images(None, 16, 'efficientnet') if self.variant == 'int8' else None
+            flatbuffer = convert(model, None, self.variant, calibration)
+            with tempfile.NamedTemporaryFile(suffix='.tflite', delete=False) as f:
+                f.write(flatbuffer)
+            try:
+                wrapper = ModelWrapper(f.name, backend='tflite', num_threads=self.num_threads)
+                if not wrapper.load():
+                    raise RuntimeError(wrapper.load_error)
+                timing = time_wrapper(wrapper, 1, self.iterations, input_shape)
+            finally:
+                os.unlink(f.name)
+            size_mb = len(flatbuffer) / (1024 * 1024)
+        else:
+            wrapper = ModelWrapper('<candidate>')
+            wrapper.attach(model)
+            timing = time_wrapper(wrapper, 1, self.iterations, input_shape)
+            size_mb = model.count_params() * 4 / (1024 * 1024)
+        result = {"latency_p50_ms": timing["p50_ms"], "latency_p95_ms": timing["p95_ms"], "size_mb": size_mb,
+                  "params": int(model.count_params())}
+        logger.info(f"{arch_info.get('model_type')} {input_shape[0]}px dense {arch_info.get('dense_units')}: "
+                    f"p95 {result['latency_p95_ms']:.1f} ms, {size_mb:.1f} MB")
+        return result
+
+
+# SEARCH SPACE
+
+class SearchSpace:
+    def __init__(self, base_arch, backbones, input_sizes, dense_units):
+        self.base_arch = base_arch
+        self.backbones = tuple(dict.fromkeys(backbones))
+        self.input_sizes = tuple(dict.fromkeys(input_sizes))
+        self.dense_units = tuple(dict.fromkeys(dense_units))
+
+    def distributions(self):
+        # Optuna requires the same choices for a parameter across a study, for imported and sampled trials alike
+        return {
+            "backbone": CategoricalDistribution(self.backbones),
+            "input_size": CategoricalDistribution(self.input_sizes),
+            "dense_units": CategoricalDistribution(self.dense_units),
+        }
+
+    def arch(self, backbone, input_size, dense_units, **overrides):
+        arch = dict(self.base_arch, model_type=backbone, input_shape=[input_size, input_size, 3],
+                    dense_units=dense_units)
+        arch.update(overrides)
+        return arch
+
+    def suggest(self, trial):
+        return self.arch(trial.suggest_categorical("backbone", self.backbones),
+                         trial.suggest_categorical("input_size", self.input_sizes),
+                         trial.suggest_categorical("dense_units", self.dense_units),
+                         dropout_rate=trial.suggest_float("dropout_rate", 0.0, 0.5))
+
+    def grid(self):
+        for backbone in self.backbones:
+            for size in self.input_sizes:
+                for units in self.dense_units:
+                    yield self.arch(backbone, size, units)
+
+
+def _slo_violation(latency_ms, slo_ms):
+    # A positive value marks the trial infeasible
+    return latency_ms - slo_ms if slo_ms else 0.0
+
+
+def _constraint_attrs(latency_ms, slo_ms):
+    """create_trial() keyword arguments recording the SLO constraint of an imported trial."""
+    if TRIAL_CONSTRAINTS:
+        return {"constraints": {"latency_slo": _slo_violation(latency_ms, slo_ms)}}
+    return {"system_attrs": {"constraints": [_slo_violation(latency_ms, slo_ms)]}}
+
+
+def open_target_study(name, storage, slo_ms=None, seed=0):
+    constraints_func = None
+    if not TRIAL_CONSTRAINTS:
+        constraints_func = lambda trial: (_slo_violation(trial.user_attrs.get("latency_p95_ms", 0.0), slo_ms),)
+    sampler = optuna.samplers.NSGAIISampler(seed=seed, constraints_func=constraints_func)
+    study = optuna.create_study(study_name=name, storage=storage, directions=list(DIRECTIONS),
+                                sampler=sampler, load_if_exists=True)
+    study.set_metric_names(list(METRIC_NAMES))
+    return study
+
+
+def import_accuracy_trials(source, target, space, meter, slo_ms=None):
+    """Copy the completed trials of ``source`` into ``target`` with measured latency and size added."""
+    imported = {t.user_attrs.get("source_trial") for t in target.trials}
+    native_backbone = space.base_arch.get('model_type', 'EfficientNetB0')
+    native_size = space.base_arch['input_shape'][0]
+    added = 0
+    for trial in source.get_trials(deepcopy=False, states=[optuna.trial.TrialState.COMPLETE]):
+        if trial.number in imported:
+            continue
+        params = dict(trial.params, backbone=native_backbone, input_size=native_size)
+        params.setdefault("dense_units", space.base_arch.get('dense_units'))
+        distributions = dict(trial.distributions, **space.distributions())
+        arch = space.arch(native_backbone, native_size, params["dense_units"],
+                          dropout_rate=params.get("dropout_rate", space.base_arch.get('dropout_rate')),
+                          base_trainable=params.get("base_trainable", space.base_arch.get('base_trainable')))
+        measured = meter.measure(arch)
+        target.add_trial(optuna.trial.create_trial(
+            params=params,
+            distributions=distributions,
+            values=[trial.value, measured["latency_p95_ms"], measured["size_mb"]],
+            user_attrs=dict(measured, source_trial=trial.number, meets_slo=_meets(measured, slo_ms)),
+            **_constraint_attrs(measured["latency_p95_ms"], slo_ms),
+        ))
+        added += 1
+    return added
+
+
+def _meets(measured, slo_ms):
+    return slo_ms is None or measured["latency_p95_ms"] <= slo_ms
+
+
+def load_trainer(spec):
+    """Resolve ``module:function``; the function takes (arch_info, trial) and returns validation accuracy."""
+    module, _, function = spec.partition(':')
+    if not function:
+        raise SystemExit(f"--train must look like module:function, got {spec!r}")
+    return getattr(importlib.import_module(module), function)
+
+
+def make_objective(space, meter, train, slo_ms=None):
+    def objective(trial):
+        arch = space.suggest(trial)
+        measured = meter.measure(arch)
+        for key, value in measured.items():
+            trial.set_user_attr(key, value)
+        trial.set_user_attr("meets_slo", _meets(measured, slo_ms))
+        if TRIAL_CONSTRAINTS:
+            trial.set_constraint("latency_slo", _slo_violation(measured["latency_p95_ms"], slo_ms))
+        if not _meets(measured, slo_ms):
+            # Too slow to deploy: skip the training run
+            raise optuna.TrialPruned(f"p95 {measured['latency_p95_ms']:.1f} ms exceeds the {slo_ms} ms SLO")
+        return float(train(arch, trial)), measured["latency_p95_ms"], measured["size_mb"]
+    return objective
+
+
+def pareto_report(study, slo_ms=None):
+    rows = []
+    for trial in study.best_trials:
+        accuracy, latency, size = trial.values
+        rows.append({"trial": trial.number, "source_trial": trial.user_attrs.get("source_trial"),
+                     "val_accuracy": accuracy, "latency_p95_ms": latency, "size_mb": size,
+                     "meets_slo": slo_ms is None or latency <= slo_ms,
+                     "params": {k: trial.params[k] for k in sorted(trial.params)}})
+    return sorted(rows, key=lambda r: r["latency_p95_ms"])
+
+
+def tune(source_storage=SOURCE_STORAGE, source_name=None, storage=None, study_name=None, model_path='saved_model/third',
+         backbones=None, input_sizes=None, dense_units=None, slo_ms=None, n_trials=0, train=None,
+         backend='tf', variant='float16', iterations=30, num_threads=None, seed=0):
+    if optuna is None:
+        raise SystemExit("optuna is required: pip install -r requirements-bench.txt")
+    if not TF_AVAILABLE:
+        raise SystemExit("TensorFlow is required to build and time candidate models")
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+    source_name = source_name or optuna.get_all_study_names(source_storage)[0]
+    source = optuna.load_study(study_name=source_name, storage=source_storage)
+    base_arch = read_architecture(model_path)
+    if not base_arch:
+        raise SystemExit(f"{model_path} has no model_architecture.json to take the base architecture from")
+
+    source_units = [t.params["dense_units"] for t in source.trials if "dense_units" in t.params]
+    space = SearchSpace(
+        base_arch,
+        [base_arch.get('model_type', 'EfficientNetB0')] + list(backbones or []),
+        [base_arch['input_shape'][0]] + list(input_sizes or []),
+        sorted(set(source_units + list(dense_units or []) + [base_arch.get('dense_units', 256)])),
+    )
+    meter = LatencyMeter(backend, variant, iterations, num_threads)
+    target = open_target_study(study_name or f"{source_name}_latency", storage or TARGET_STORAGE, slo_ms, seed)
+
+    added = import_accuracy_trials(source, target, space, meter, slo_ms)
+    logger.info(f"Imported {added} trials from '{source_name}' into '{target.study_name}'")
+
+    candidates = []
+    for arch in space.grid():
+        measured = meter.measure(arch)
+        candidates.append({"backbone": arch['model_type'], "input_size": arch['input_shape'][0],
+                           "dense_units": arch['dense_units'], "meets_slo": _meets(measured, slo_ms), **measured})
+
+    if n_trials:
+        if train is None:
+            raise SystemExit("--n-trials needs --train module:function to obtain the accuracy of new architectures")
+        target.optimize(make_objective(space, meter, train, slo_ms), n_trials=n_trials)
+
+    return {
+        "source_study": source_name,
+        "study": target.study_name,
+        "objectives": dict(zip(METRIC_NAMES, DIRECTIONS)),
+        "backend": backend if backend == 'tf' else f"tflite/{variant}",
+        "slo_ms": slo_ms,
+        "pareto_front": pareto_report(target, slo_ms),
+        "candidates": sorted(candidates, key=lambda c: c["latency_p95_ms"]),
+    }
+
+
+def print_report(report):
+    slo = report["slo_ms"]
+    print(f"\nPareto front of '{report['study']}' ({report['backend']}, "
+          f"{f'SLO {slo} ms p95' if slo else 'no latency SLO'}):")
+    print(f"{'trial':>6}{'acc':>8}{'p95 ms':>9}{'MB':>7}  params")
+    for row in report["pareto_front"]:
+        params = {k: row["params"][k] for k in ('backbone', 'input_size', 'dense_units', 'dropout_rate')
+                  if k in row["params"]}
+        flag = '' if row["meets_slo"] else '  (over SLO)'
+        print(f"{row['trial']:>6}{row['val_accuracy']:>8.4f}{row['latency_p95_ms']:>9.1f}{row['size_mb']:>7.1f}"
+              f"  {params}{flag}")
+
+    print("\nCandidate architectures (untrained; latency and size only):")
+    for c in report["candidates"]:
+        flag = '' if c["meets_slo"] else '  (over SLO)'
+        print(f"  {c['backbone']:<16}{c['input_size']:>5}px  dense {c['dense_units']:<5}"
+              f"p95 {c['latency_p95_ms']:7.1f} ms  {c['size_mb']:6.1f} MB{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source-storage', default=SOURCE_STORAGE, help='Storage URL of the accuracy study')
+    parser.add_argument('--source-study', help='Name of the accuracy study (default: the only one in the storage)')
+    parser.add_argument('--storage', help=f'Storage URL for the multi-objective study (default: {TARGET_STORAGE})')
+    parser.add_argument('--study-name', help='Multi-objective study name (default: <source study>_latency)')
+    parser.add_argument('--model', default='saved_model/third', help='Model whose architecture is the base')
+    parser.add_argument('--backbones', nargs='*', default=[], help='Extra keras.applications backbones, e.g. EfficientNetB1')
+    parser.add_argument('--input-sizes', type=int, nargs='*', default=[], help='Extra square input sizes')
+    parser.add_argument('--dense-units', type=int, nargs='*', default=[], help='Extra head sizes')
+    parser.add_argument('--slo-ms', type=float, help='p95 latency budget for one image')
+    parser.add_argument('--n-trials', type=int, default=0, help='New architectures to search (needs --train)')
+    parser.add_argument('--train', help='module:function(arch_info, trial) -> validation accuracy')
+    parser.add_argument('--backend', default='tf', choices=('tf', 'tflite'), help='Serving backend to time')
+    parser.add_argument('--variant', default='float16', help='TFLite variant for --backend tflite')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--threads', type=int, default=None, help='TFLite interpreter threads')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the JSON report here as well')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = tune(args.source_storage, args.source_study, args.storage, args.study_name, args.model, args.backbones,
+                  args.input_sizes, args.dense_units, args.slo_ms, args.n_trials,
+                  load_trainer(args.train) if args.train else None, args.backend, args.variant, args.iterations,
+                  args.threads, args.seed)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
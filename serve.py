@@ -0,0 +1,285 @@
+"""Preload-and-fork server: load the model once, then fork worker processes that share it.
+
+The parent imports the app (TensorFlow, FastAPI, NumPy, Pillow), loads and
+warms the model, freezes the GC so shared objects are not dirtied, binds the
+listening socket and forks ``--workers`` uvicorn workers that all accept on it.
+Workers that die are restarted; if more than ``--max-restarts`` exits happen
+within ``--restart-window`` seconds the whole server stops instead of looping.
+
+What is shared depends on the backend. TFLite interpreters keep working after
+fork(), so with ``SKINSCREEN_MODEL_BACKEND=tflite`` the parent's loaded and
+warmed interpreter, including its packed weights, is shared copy-on-write. The
+TensorFlow runtime is not fork-safe once it has executed an op: its thread
+pools do not exist in the child and the first op deadlocks. With the ``tf``
+backend the parent therefore only shares the imported modules, and each worker
+loads its own weights after the fork.
+
+With ``SKINSCREEN_CPU_AFFINITY=auto`` the CPUs are split evenly between the
+workers and each worker is pinned to its share before it loads anything; its
+model replicas then split that share again (see app/api/cpu.py).
+
+``--no-preload`` forks before importing anything, so every worker loads
+separately. Use it as the baseline for the memory report, which lists RSS, PSS
+and USS (private memory) per worker from /proc/<pid>/smaps_rollup.
+
+Usage:
+    python serve.py --workers 4 --port 5000
+    SKINSCREEN_MODEL_BACKEND=tflite python serve.py --workers 4 --memory-report memory.json
+"""
+import argparse
+import gc
+import importlib
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+from app.api import config
+from app.api.cpu import cpu_sets, pin_current_thread
+
+logger = logging.getLogger('serve')
+
+
+def memory_usage(pid):
+    """RSS, PSS, USS and shared memory of a process in MB, from /proc/<pid>/smaps_rollup (Linux only)."""
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        return None
+    mb = lambda kb: kb / 1024.0
+    return {
+        "rss_mb": mb(fields.get('Rss', 0)),
+        "pss_mb": mb(fields.get('Pss', 0)),
+        "uss_mb": mb(fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)),
+        "shared_mb": mb(fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)),
+    }
+
+
+def preload():
+    """Import the app in the parent and load whatever can safely be shared across fork()."""
+    from app.main import prediction_service
+
+    start = time.perf_counter()
+    if config.MODEL_BACKEND == 'tflite' or config.MOCK_MODEL:
+        # Neither backend runs TensorFlow ops, so the warmed model survives fork(); the TF runtime would not
+        prediction_service.warmup_model()
+        logger.info(f"Preloaded model in parent ({prediction_service.model_status()['state']}) "
+                    f"in {time.perf_counter() - start:.1f}s")
+    else:
+        # Importing TensorFlow is fork-safe (running ops is not); the app itself only imports it lazily
+        importlib.import_module('tensorflow')
+        logger.info("TensorFlow backend: sharing imported modules only; each worker loads its own weights")
+    # Objects allocated so far stay untouched by the GC, so their pages remain shared
+    gc.collect()
+    gc.freeze()
+
+
+def run_worker(sock, ready_fd, log_level, cpus=None):
+    """Body of a forked worker: finish loading, report readiness, serve until told to stop."""
+    # The only thread right after fork(), so every thread the worker starts inherits the pinning
+    if pin_current_thread(cpus):
+        logger.info(f"Worker pid {os.getpid()} pinned to CPUs {cpus}")
+    import uvicorn
+    from app.main import app, prediction_service
+
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    # Warm up here rather than in the lifespan hook so readiness can be reported to the parent
+    config.EAGER_LOAD = False
+    prediction_service.warmup_preprocess()
+    if not prediction_service.is_ready(allow_mock=True):
+        prediction_service.warmup_model()
+    os.write(ready_fd, f"{os.getpid()}\n".encode())
+    os.close(ready_fd)
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level))
+    server.run(sockets=[sock])
+
+
+class Supervisor:
+    """Forks workers on a shared socket, restarts the ones that exit and reports their memory."""
+
+    def __init__(self, sock, workers, log_level='info', max_restarts=5, restart_window=60.0,
+                 memory_report=None, report_interval=0.0, preloaded=True):
+        self.sock = sock
+        self.workers = workers
+        self.log_level = log_level
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.memory_report = memory_report
+        self.report_interval = report_interval
+        self.preloaded = preloaded
+        # Per-worker CPU sets; explicit SKINSCREEN_CPU_AFFINITY lists apply to the replicas instead
+        self.cpu_sets = cpu_sets(config.CPU_AFFINITY, workers) if config.CPU_AFFINITY.strip().lower() == 'auto' else None
+        self._children = {}     # pid -> slot
+        self._ready = set()
+        self._restarts = []
+        self._stopping = False
+        self._gave_up = False
+        self._ready_r, self._ready_w = os.pipe()
+
+    def _spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.close(self._ready_r)
+                run_worker(self.sock, self._ready_w, self.log_level,
+                           self.cpu_sets[slot] if self.cpu_sets else None)
+            except BaseException:
+                logger.exception(f"Worker {slot} crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self._children[pid] = slot
+        logger.info(f"Started worker {slot} (pid {pid})")
+
+    def _stop(self, signum, _frame):
+        logger.info(f"Received {signal.Signals(signum).name}, stopping workers")
+        self._stopping = True
+
+    def _read_ready(self, timeout):
+        readable, _, _ = select.select([self._ready_r], [], [], timeout)
+        if not readable:
+            return
+        for line in os.read(self._ready_r, 4096).decode().split():
+            pid = int(line)
+            if pid in self._children:
+                self._ready.add(pid)
+                logger.info(f"Worker {self._children[pid]} (pid {pid}) is ready")
+
+    def _reap(self):
+        while self._children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            slot = self._children.pop(pid, None)
+            self._ready.discard(pid)
+            if slot is None or self._stopping:
+                continue
+            logger.warning(f"Worker {slot} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}")
+            now = time.monotonic()
+            self._restarts = [t for t in self._restarts if now - t < self.restart_window] + [now]
+            if len(self._restarts) > self.max_restarts:
+                logger.error(f"{len(self._restarts)} worker exits within {self.restart_window:.0f}s, giving up")
+                self._stopping = True
+                self._gave_up = True
+                return
+            self._spawn(slot)
+
+    def report(self):
+        workers = {str(pid): memory_usage(pid) for pid in sorted(self._children)}
+        known = [m for m in workers.values() if m]
+        parent = memory_usage(os.getpid())
+        report = {
+            "mode": "preload" if self.preloaded else "separate",
+            "backend": "mock" if config.MOCK_MODEL else config.MODEL_BACKEND,
+            "workers": len(self._children),
+            "parent": parent,
+            "per_worker": workers,
+            # PSS charges shared pages proportionally, so the sum is the real footprint of the pool
+            "total_pss_mb": sum(m["pss_mb"] for m in known) + (parent["pss_mb"] if parent else 0.0),
+            "total_rss_mb": sum(m["rss_mb"] for m in known),
+            "mean_worker_uss_mb": (sum(m["uss_mb"] for m in known) / len(known)) if known else None,
+        }
+        for pid, m in workers.items():
+            if m:
+                logger.info(f"Worker pid {pid}: RSS {m['rss_mb']:.0f} MB, PSS {m['pss_mb']:.0f} MB, "
+                            f"private {m['uss_mb']:.0f} MB, shared {m['shared_mb']:.0f} MB")
+        logger.info(f"Total PSS {report['total_pss_mb']:.0f} MB for {report['workers']} workers")
+        if self.memory_report:
+            with open(self.memory_report, 'w') as f:
+                json.dump(report, f, indent=2)
+        return report
+
+    def _shutdown(self, grace=30.0):
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + grace
+        while self._children and time.monotonic() < deadline:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid:
+                self._children.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        for pid in list(self._children):
+            logger.warning(f"Worker pid {pid} did not stop in time, killing it")
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self._children.clear()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+        reported_at = None
+        while not self._stopping:
+            self._read_ready(timeout=1.0)
+            self._reap()
+            all_ready = self._children and self._ready == set(self._children)
+            due = reported_at is None or (self.report_interval and
+                                          time.monotonic() - reported_at >= self.report_interval)
+            if all_ready and due:
+                self.report()
+                reported_at = time.monotonic()
+        self._shutdown()
+        return 1 if self._gave_up else 0
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=config.WORKER_PROCESSES)
+    parser.add_argument('--preload', action=argparse.BooleanOptionalAction, default=True,
+                        help='Load in the parent before forking (--no-preload: every worker loads separately)')
+    parser.add_argument('--max-restarts', type=int, default=config.WORKER_MAX_RESTARTS)
+    parser.add_argument('--restart-window', type=float, default=config.WORKER_RESTART_WINDOW_S)
+    parser.add_argument('--memory-report', help='Write the per-worker memory report (JSON) here')
+    parser.add_argument('--report-interval', type=float, default=0.0,
+                        help='Repeat the memory report every N seconds (0 = once, when all workers are ready)')
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s [%(process)d] %(levelname)s %(message)s')
+    if not hasattr(os, 'fork'):
+        raise SystemExit("serve.py needs fork(); use run.py on this platform")
+
+    if args.preload:
+        preload()
+    if threading.active_count() > 1:
+        logger.warning(f"{threading.active_count()} threads alive before fork; they will not exist in workers")
+
+    sock = bind_socket(args.host, args.port)
+    logger.info(f"Listening on {args.host}:{args.port} with {args.workers} workers")
+    supervisor = Supervisor(sock, args.workers, args.log_level, args.max_restarts, args.restart_window,
+                            args.memory_report, args.report_interval, preloaded=args.preload)
+    sys.exit(supervisor.run())
+
+
+if __name__ == '__main__':
+    main()